@@ -0,0 +1,134 @@
+import bisect
+import numpy as np
+import pandas as pd
+
+# Concentration <-> AQI conversion and AQI severity, shared by the AQI calculator, the models,
+# ingestion and the API. Breakpoint tables are built once at import, so a scalar conversion is a
+# binary search and one multiply-add, and an array conversion is a searchsorted per pollutant.
+
+# Concentration Breakpoints Constants (https://www.der.wa.gov.au/your-environment/air/air-quality-index)
+CONCENTRATION_BREAKPOINTS = {
+    "co": [0, 6, 9, 13.5, 18, float('inf')],
+    "no2": [0, 80, 120, 180, 240, float('inf')],
+    "o3": [0, 67, 100, 150, 200, float('inf')],
+    "pm10": [0, 50, 100, 200, 600, float('inf')],
+    "pm2.5": [0, 25, 50, 100, 300, float('inf')],
+    "so2": [0, 133, 200, 300, 400, float('inf')]
+}
+
+# AQI Breakpoints Constant
+# 200 is the max; Everything above 200 is an 'Extremely Poor' AQI Index (https://soe.dcceew.gov.au/air-quality/about-chapter/approach)
+AQI_BREAKPOINTS = [0, 33, 66, 99, 149, 200]
+
+# Severity categories (https://soe.dcceew.gov.au/air-quality/about-chapter/approach):
+# an AQI up to and including SEVERITY_UPPER_BOUNDS[i] is SEVERITY_LABELS[i], anything above is the last label
+SEVERITY_UPPER_BOUNDS = [32, 65, 98, 148, 199]
+SEVERITY_LABELS = ["1 (Very Good)", "2 (Good)", "3 (Fair)", "4 (Poor)", "5 (Very Poor)", "6 (Extremely Poor)"]
+
+POLLUTANTS = list(CONCENTRATION_BREAKPOINTS)
+
+# Precomputed Tables
+
+# One row per pollutant (in POLLUTANTS order) and one column per breakpoint range
+C_TABLE = np.array([CONCENTRATION_BREAKPOINTS[name] for name in POLLUTANTS], dtype=float)
+AQI_TABLE = np.asarray(AQI_BREAKPOINTS, dtype=float)
+LAST_RANGE = C_TABLE.shape[1] - 2
+
+# Per pollutant: (breakpoints, [(Clow, Ilow, slope, constant AQI or None) per range]) for the scalar path.
+# slope is computed exactly as the original formula did, so results are bit-for-bit the same.
+def _scalar_ranges(c_breakpoints):
+    ranges = []
+    for i in range(len(c_breakpoints) - 1):
+        Clow, Chigh = c_breakpoints[i], c_breakpoints[i + 1]
+        Ilow, Ihigh = AQI_BREAKPOINTS[i], AQI_BREAKPOINTS[i + 1]
+        # Handle case where AQI is constant
+        constant = Ihigh if Ilow == Ihigh else None
+        ranges.append((Clow, Ilow, (Ihigh - Ilow) / (Chigh - Clow), constant))
+    return ranges
+
+SCALAR_TABLES = {name: (breakpoints, _scalar_ranges(breakpoints)) for name, breakpoints in CONCENTRATION_BREAKPOINTS.items()}
+
+# Scalar API
+
+# AQI of one concentration. Concentrations below the first or at/above the last breakpoint get the
+# maximum AQI of 200, a missing concentration gives NaN and an unknown pollutant raises KeyError.
+def calculate_aqi(concentration, pollutant):
+    breakpoints, ranges = SCALAR_TABLES[pollutant]
+    if concentration != concentration: # NaN
+        return float('nan')
+    i = bisect.bisect_right(breakpoints, concentration) - 1
+    if i < 0 or i >= len(ranges):
+        return AQI_BREAKPOINTS[-1]
+    Clow, Ilow, slope, constant = ranges[i]
+    if constant is not None:
+        return constant
+    return slope * (concentration - Clow) + Ilow
+
+# (Clow, Chigh) concentration band of a pollutant whose AQI range contains aqi. An AQI of 200 or
+# more is the open band above the last finite breakpoint; NaN or negative AQIs give (nan, nan).
+def concentration_band(aqi, pollutant):
+    breakpoints = CONCENTRATION_BREAKPOINTS[pollutant]
+    if not aqi >= 0:
+        return (float('nan'), float('nan'))
+    i = min(bisect.bisect_right(AQI_BREAKPOINTS, aqi) - 1, LAST_RANGE)
+    return (breakpoints[i], breakpoints[i + 1])
+
+# Severity category of an AQI, e.g. "1 (Very Good)". A NaN AQI is "6 (Extremely Poor)", as it always was.
+def classify_severity(aqi):
+    for upper, label in zip(SEVERITY_UPPER_BOUNDS, SEVERITY_LABELS):
+        if aqi <= upper:
+            return label
+    return SEVERITY_LABELS[-1]
+
+# Array API
+
+# Pollutant codes into POLLUTANTS, -1 for unknown pollutants; categorical input is recoded without rehashing
+def pollutant_codes(pollutants):
+    return pd.Categorical(pollutants, categories=POLLUTANTS).codes
+
+def calculate_aqi_array(concentrations, pollutants):
+    concentrations = np.asarray(concentrations, dtype=float)
+    aqi = np.full(concentrations.shape, np.nan)
+
+    # The matching breakpoint range of every concentration,
+    # i.e. the i with c_breakpoints[i] <= concentration < c_breakpoints[i + 1]
+    codes = pollutant_codes(pollutants)
+    ranges = np.full(concentrations.shape, -1)
+    for code in range(len(POLLUTANTS)):
+        rows = np.flatnonzero(codes == code)
+        ranges[rows] = np.searchsorted(C_TABLE[code], concentrations[rows], side="right") - 1
+
+    valid = (codes >= 0) & ~np.isnan(concentrations)
+    rows = np.flatnonzero(valid)
+    code = codes[rows]
+    i = ranges[rows]
+    # Concentrations below the first or at/above the last breakpoint get the maximum AQI of 200
+    in_range = (i >= 0) & (i <= LAST_RANGE)
+    i = np.clip(i, 0, LAST_RANGE)
+
+    Clow, Chigh = C_TABLE[code, i], C_TABLE[code, i + 1]
+    Ilow, Ihigh = AQI_TABLE[i], AQI_TABLE[i + 1]
+    with np.errstate(invalid="ignore"):
+        # Same formula and operation order as calculate_aqi, so results match it exactly
+        values = ((Ihigh - Ilow) / (Chigh - Clow)) * (concentrations[rows] - Clow) + Ilow
+    values = np.where(Ilow == Ihigh, Ihigh, values)
+    aqi[rows] = np.where(in_range, values, AQI_TABLE[-1])
+    return aqi
+
+# Clow and Chigh arrays of concentration_band; NaN for negative or missing AQIs and unknown pollutants
+def concentration_band_array(aqi, pollutants):
+    aqi = np.asarray(aqi, dtype=float)
+    codes = pollutant_codes(pollutants)
+    low = np.full(aqi.shape, np.nan)
+    high = np.full(aqi.shape, np.nan)
+    rows = np.flatnonzero((codes >= 0) & (aqi >= 0))
+    i = np.minimum(np.searchsorted(AQI_TABLE, aqi[rows], side="right") - 1, LAST_RANGE)
+    low[rows] = C_TABLE[codes[rows], i]
+    high[rows] = C_TABLE[codes[rows], i + 1]
+    return low, high
+
+# Severity label of every AQI, as an object array of SEVERITY_LABELS; agrees with classify_severity
+def classify_severity_array(aqi):
+    aqi = np.asarray(aqi, dtype=float)
+    # side="left" puts an AQI equal to a bound in that bound's category; NaN sorts past every bound
+    return np.asarray(SEVERITY_LABELS, dtype=object)[np.searchsorted(SEVERITY_UPPER_BOUNDS, aqi, side="left")]
@@ -1,36 +1,93 @@
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 from pathlib import Path
+from app.datasets.dataset_store import dataset_store, shared_dataset_store
 
 MAIN_PATH = Path("app")
 
 class final_aqi_determinator:
 
+    OUTPUT_COLUMNS = ["Date", "City", "Highest AQI", "Rounded AQI"]
+
     def __init__(self):
         datapath = MAIN_PATH / "data" / "australia_air_quality_pollutant_aqi.csv"
         self.filepath = datapath
-        self.dataframe = pd.read_csv(self.filepath)
+        self.dataframe = shared_dataset_store.frame(self.filepath, columns=["Date", "City", "AQI", "Rounded AQI"])
         self.outputframe = None
 
     def determine(self, text):
-        self.dataframe['Date'] = pd.to_datetime(self.dataframe['Date'], dayfirst=True)
-
-        # Drops rows with missing AQI before grouping
-        df_valid = self.dataframe.dropna(subset=['AQI'])
-
-        # Gets index of max AQI per (Date, City)
-        max_aqi_indices = df_valid.groupby(["Date", "City"])["AQI"].idxmax().dropna().astype(int)
+        # Dates are already parsed by the dataset store; the shared frame is left untouched
+        dates = self.dataframe['Date']
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, dayfirst=True)
 
-        # Selects rows with highest AQI per group
+        # Row with the highest AQI of every (Date, City), in date then city order
+        indices = highest_aqi_indices(dates, self.dataframe['City'], self.dataframe['AQI'])
         self.outputframe = (
-            self.dataframe.loc[max_aqi_indices]
+            self.dataframe.iloc[indices]
             [["Date", "City", "AQI", "Rounded AQI"]]
             .rename(columns={"AQI": "Highest AQI"})
             .reset_index(drop=True)
         )
+        self.outputframe['Date'] = dates.iloc[indices].to_numpy()
+
+        # The rows come out in ascending date order already; descending is the same order reversed
+        if text == "descending":
+            self.outputframe = self.outputframe.iloc[::-1]
+
+    # Determines the highest AQI per (Date, City) of a csv of any size, reading it in chunks of chunksize rows.
+    # Rows are first split into one temporary file per month, which is all the memory a month needs;
+    # each month is then reduced on its own and appended to output_path, so the output is in date order
+    # (descending if text is "descending") without ever holding or sorting the whole history.
+    # Returns the number of (Date, City) rows written.
+    def determine_streaming(self, output_path, text="ascending", filepath=None, chunksize=1_000_000):
+        filepath = filepath if filepath is not None else self.filepath
+        partition_path = Path(tempfile.mkdtemp(prefix="final_aqi_"))
+        try:
+            months = set()
+            for chunk in pd.read_csv(filepath, usecols=["Date", "City", "AQI", "Rounded AQI"], chunksize=chunksize):
+                chunk['Date'] = dataset_store.parse_dates(chunk['Date'])
+                chunk = chunk.dropna(subset=['AQI', 'Date'])
+                month_keys = chunk['Date'].to_numpy().astype("datetime64[M]").view("int64")
+                # Partitions are appended as pickled frames, so dates never go through text and back
+                for month, rows in chunk.groupby(month_keys, sort=False):
+                    with open(partition_path / f"{month}.pkl", "ab") as f:
+                        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    months.add(month)
+
+            written = 0
+            descending = text == "descending"
+            temp_output = Path(f"{output_path}.{os.getpid()}.tmp")
+            with open(temp_output, "w") as f:
+                f.write(",".join(final_aqi_determinator.OUTPUT_COLUMNS) + "\n")
+                for month in sorted(months, reverse=descending):
+                    rows = final_aqi_determinator.read_partition(partition_path / f"{month}.pkl")
+                    indices = highest_aqi_indices(rows['Date'], rows['City'], rows['AQI'])
+                    result = rows.iloc[indices].rename(columns={"AQI": "Highest AQI"})[final_aqi_determinator.OUTPUT_COLUMNS]
+                    if descending:
+                        result = result.iloc[::-1]
+                    result.to_csv(f, header=False, index=False, date_format="%Y-%m-%d")
+                    written += len(result)
+            os.replace(temp_output, output_path)
+            return written
+        finally:
+            shutil.rmtree(partition_path, ignore_errors=True)
 
-        # Sorts the outputframe by date
-        ascending = text != "descending"
-        self.outputframe = self.outputframe.sort_values(by='Date', ascending=ascending)
+    # Reads back every frame appended to a partition file, in the order they were written
+    @staticmethod
+    def read_partition(path):
+        frames = []
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    frames.append(pickle.load(f))
+                except EOFError:
+                    break
+        return pd.concat(frames, ignore_index=True)
 
     # Saves the updated dataframe to a .csv file while printing the results
     def save(self):
@@ -38,3 +95,47 @@ class final_aqi_determinator:
         filename = MAIN_PATH / "data" / "australia_air_quality_final_aqi.csv"
         self.outputframe.to_csv(filename, index=False)
         print(f"Results saved to {filename}")
+
+# Vectorized Reduction Method
+
+# Positions of the rows with the highest AQI of every (Date, City), ordered by date then city.
+# Every row gets one integer slot for its (day, city), the highest AQI of each slot is found with
+# np.maximum.at and the first row that reaches it is kept, as with groupby().idxmax(); no sort is needed.
+# Rows with a missing AQI, date or city are ignored.
+def highest_aqi_indices(dates, cities, aqi):
+    aqi = np.asarray(aqi, dtype=float)
+    date_values = np.asarray(dates)
+    if not np.issubdtype(date_values.dtype, np.datetime64):
+        date_values = date_values.astype("datetime64[ns]")
+    if isinstance(getattr(cities, "dtype", None), pd.CategoricalDtype):
+        city_keys = np.asarray(cities.cat.codes, dtype=np.int64)
+        city_count = len(cities.cat.categories)
+    else:
+        city_keys, uniques = pd.factorize(np.asarray(cities, dtype=object), sort=True)
+        city_count = len(uniques)
+
+    valid = np.flatnonzero(~np.isnan(aqi) & ~np.isnat(date_values) & (city_keys >= 0))
+    if len(valid) == 0:
+        return valid
+
+    # Whole days when the dates carry no time of day, otherwise the exact timestamps ranked
+    valid_dates = date_values[valid]
+    days = valid_dates.astype("datetime64[D]")
+    if np.array_equal(days, valid_dates):
+        date_keys = days.view("int64") - days.view("int64").min()
+    else:
+        date_keys = pd.factorize(valid_dates.view("int64"), sort=True)[0]
+    slot_keys = date_keys * city_count + city_keys[valid]
+
+    # Slots stay dense for daily data; a sparse range (far-apart dates) is ranked down first
+    if slot_keys.max() >= 2 * len(valid) + 1024:
+        slot_keys = pd.factorize(slot_keys, sort=True)[0]
+    slots = int(slot_keys.max()) + 1
+
+    valid_aqi = aqi[valid]
+    highest = np.full(slots, -np.inf)
+    np.maximum.at(highest, slot_keys, valid_aqi)
+    reaching = np.flatnonzero(valid_aqi == highest[slot_keys])
+    first = np.full(slots, len(valid))
+    np.minimum.at(first, slot_keys[reaching], reaching)
+    return valid[first[first < len(valid)]]
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import queue
+import threading
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from app.ingestion.file_lock import file_lock
+
+MAIN_PATH = Path("app")
+
+# Records predictions in the background: requests only enqueue their records, and a writer
+# thread appends them in batches to a size-rotated JSON lines log or to parquet part files
+class prediction_audit_sink:
+
+    AUDIT_PATH = MAIN_PATH / "data" / "audit"
+    FORMATS = ["jsonl", "parquet"]
+
+    def __init__(self, audit_path = AUDIT_PATH, file_format = "jsonl", batch_size = 500, flush_interval = 1.0,
+                 max_bytes = 50 * 1024 * 1024, queue_size = 100000):
+        if file_format not in prediction_audit_sink.FORMATS:
+            raise ValueError(f"Unknown audit format '{file_format}', expected one of {prediction_audit_sink.FORMATS}")
+        self.audit_path = Path(audit_path)
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0 # Records discarded because the queue was full
+        self.errors = 0
+        self.closed = False
+        self.part = 0
+        self.log_lock = file_lock(self.audit_path / "predictions.jsonl.lock")
+        self.start_writer()
+        # A worker forked from a preloaded parent (app/serve.py) gets its own queue and writer thread,
+        # as threads do not survive a fork
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start_writer(self):
+        self.writer = threading.Thread(target=self._run, name="prediction-audit-sink", daemon=True)
+        self.writer.start()
+
+    def _after_fork(self):
+        if self.closed:
+            return
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.written = self.dropped = self.errors = 0
+        # The parent's writer may have held the lock when the process forked
+        self.log_lock = file_lock(self.audit_path / "predictions.jsonl.lock")
+        self.start_writer()
+
+    # Queues prediction records without blocking; when the writer falls behind, records are dropped and counted
+    def submit(self, records, model_version = None):
+        if self.closed:
+            return
+        predicted_at = datetime.now().isoformat(timespec="milliseconds")
+        for record in records:
+            entry = dict(record)
+            entry["predicted_at"] = predicted_at
+            entry["model_version"] = model_version
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+
+    # Writer thread: collects up to batch_size records, or whatever arrived within flush_interval
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None: # Sentinel queued by close()
+                    stop = True
+                    break
+                batch.append(entry)
+
+            if batch:
+                try:
+                    self._write(batch)
+                    self.written += len(batch)
+                except Exception as e:
+                    # Auditing must never take the service down; the batch is lost and counted
+                    self.errors += 1
+                    print(f"Could not write {len(batch)} audit records: {e}")
+            if stop:
+                return
+
+    def _write(self, batch):
+        os.makedirs(self.audit_path, exist_ok=True)
+        if self.file_format == "parquet":
+            # Every batch becomes its own part file, so files are never appended to
+            self.part += 1
+            name = f"predictions-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self.part:06d}.parquet"
+            pd.DataFrame(batch).to_parquet(self.audit_path / name, index=False)
+            return
+
+        log_file = self.audit_path / "predictions.jsonl"
+        lines = "".join(json.dumps(entry, default=str) + "\n" for entry in batch)
+        # Every worker process appends to the same log, so the size check, rotation and append happen
+        # under a lock file next to it: only one worker rotates a full log, and none appends meanwhile
+        with self.log_lock:
+            try:
+                if os.path.getsize(log_file) >= self.max_bytes:
+                    # Numbered like parquet parts, so logs rotated within the same second never overwrite each other
+                    self.part += 1
+                    name = f"predictions-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self.part:06d}.jsonl"
+                    os.replace(log_file, self.audit_path / name)
+            except FileNotFoundError:
+                # Not created yet, or rotated by another process in the meantime (without flock, on
+                # Windows): the append below starts a new log
+                pass
+            # One write per batch: appends never interleave within a batch
+            with open(log_file, "a") as f:
+                f.write(lines)
+
+    # Writes out everything still queued and stops the writer thread
+    def close(self, timeout = 10):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join(timeout)
+
+    def status(self):
+        return {
+            "format": self.file_format,
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    # Builds the sink configured by AUDIT_SINK (jsonl, parquet or none), AUDIT_PATH, AUDIT_BATCH_SIZE,
+    # AUDIT_FLUSH_INTERVAL and AUDIT_MAX_BYTES; returns None when auditing is disabled
+    @staticmethod
+    def from_environment():
+        file_format = os.environ.get("AUDIT_SINK", "jsonl")
+        if file_format == "none":
+            return None
+        return prediction_audit_sink(
+            os.environ.get("AUDIT_PATH", prediction_audit_sink.AUDIT_PATH),
+            file_format,
+            int(os.environ.get("AUDIT_BATCH_SIZE", 500)),
+            float(os.environ.get("AUDIT_FLUSH_INTERVAL", 1.0)),
+            int(os.environ.get("AUDIT_MAX_BYTES", 50 * 1024 * 1024)),
+        )
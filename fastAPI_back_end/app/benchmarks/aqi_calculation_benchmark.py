@@ -0,0 +1,106 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from app.aqi_calculation.aqi_conversion import calculate_aqi, calculate_aqi_array, CONCENTRATION_BREAKPOINTS, AQI_BREAKPOINTS
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+
+# The previous row-by-row implementation of pollutant_aqi_calculator.calculate, kept as the baseline
+def calculate_with_iterrows(dataframe):
+    dataframe = dataframe.copy()
+    dataframe['AQI'] = None
+    dataframe['Rounded AQI'] = None
+    for index, row in dataframe.iterrows():
+        pollutant = row['Pollutant']
+        median = row['median']
+        if pd.notna(median) and pollutant in CONCENTRATION_BREAKPOINTS:
+            aqi = calculate_aqi(median, pollutant)
+            dataframe.at[index, 'AQI'] = aqi
+            dataframe.at[index, 'Rounded AQI'] = round(aqi)
+    return dataframe
+
+# Plain scalar loop without iterrows, used to extrapolate the baseline on very large inputs
+def calculate_with_scalar_loop(concentrations, pollutants):
+    return [calculate_aqi(c, p) if (p in CONCENTRATION_BREAKPOINTS and not np.isnan(c)) else np.nan
+            for c, p in zip(concentrations, pollutants)]
+
+# The previous scalar calculate_aqi: a linear scan of the breakpoint ranges on every call
+def calculate_aqi_linear_scan(concentration, pollutant):
+    c_breakpoints = CONCENTRATION_BREAKPOINTS[pollutant]
+    for i in range(len(c_breakpoints) - 1):
+        Clow, Chigh = c_breakpoints[i], c_breakpoints[i + 1]
+        Ilow, Ihigh = AQI_BREAKPOINTS[i], AQI_BREAKPOINTS[i + 1]
+        if (Clow <= concentration < Chigh):
+            if (Ilow == Ihigh):
+                return Ihigh
+            return ((Ihigh - Ilow) / (Chigh - Clow)) * (concentration - Clow) + Ilow
+    return AQI_BREAKPOINTS[-1]
+
+# Per-call time of the scalar conversion, linear scan against the precomputed tables, in microseconds
+def compare_scalar(concentrations, pollutants):
+    pairs = list(zip(concentrations.tolist(), [str(p) for p in pollutants]))
+    scan, scan_time = timed(lambda: [calculate_aqi_linear_scan(c, p) for c, p in pairs])
+    tables, tables_time = timed(lambda: [calculate_aqi(c, p) for c, p in pairs])
+    check_identical(np.asarray(tables, dtype=float), scan)
+    return {"calls": len(pairs), "linear_scan_us": scan_time / len(pairs) * 1e6, "tables_us": tables_time / len(pairs) * 1e6}
+
+# Draws concentrations from the real per-pollutant distributions, including out-of-range values;
+# pollutants are categorical, as large datasets should be stored
+def synthetic_rows(dataframe, rows, seed=42):
+    rng = np.random.default_rng(seed)
+    sample = dataframe[['Pollutant', 'median']].sample(n=rows, replace=True, random_state=seed)
+    concentrations = sample['median'].to_numpy() * rng.uniform(0.5, 3.0, rows)
+    return concentrations, pd.Categorical(sample['Pollutant'])
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def check_identical(vectorized, scalar):
+    scalar = np.asarray(scalar, dtype=float)
+    same = (vectorized == scalar) | (np.isnan(vectorized) & np.isnan(scalar))
+    if not same.all():
+        raise AssertionError(f"{(~same).sum()} rows differ between the vectorized and scalar AQI")
+
+def run(synthetic=10_000_000, sample=200_000):
+    dataframe = pd.read_csv(DATA_PATH)
+    results = []
+
+    # Full dataset: iterrows baseline against the vectorized engine
+    baseline, baseline_time = timed(calculate_with_iterrows, dataframe)
+    vectorized, vectorized_time = timed(calculate_aqi_array, dataframe['median'], dataframe['Pollutant'])
+    check_identical(vectorized, baseline['AQI'].astype(float))
+    results.append({"rows": len(dataframe), "baseline": "iterrows", "baseline_s": baseline_time,
+                    "vectorized_s": vectorized_time, "speedup": baseline_time / vectorized_time})
+
+    # Synthetic dataset: the scalar loop is timed on a sample and scaled up
+    if synthetic:
+        concentrations, pollutants = synthetic_rows(dataframe, synthetic)
+        vectorized, vectorized_time = timed(calculate_aqi_array, concentrations, pollutants)
+        scalar, scalar_time = timed(calculate_with_scalar_loop, concentrations[:sample], pollutants[:sample])
+        check_identical(vectorized[:sample], scalar)
+        scalar_time *= synthetic / sample
+        results.append({"rows": synthetic, "baseline": f"scalar loop (extrapolated from {sample} rows)",
+                        "baseline_s": scalar_time, "vectorized_s": vectorized_time,
+                        "speedup": scalar_time / vectorized_time})
+
+    return results, compare_scalar(*synthetic_rows(dataframe, sample))
+
+# python -m app.benchmarks.aqi_calculation_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized AQI calculation against the scalar one.")
+    parser.add_argument("--synthetic-rows", type=int, default=10_000_000)
+    parser.add_argument("--sample-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    results, scalar = run(args.synthetic_rows, args.sample_rows)
+    for result in results:
+        print(f"{result['rows']:>10} rows  {result['baseline']}: {result['baseline_s']:.3f}s  "
+              f"vectorized: {result['vectorized_s']:.3f}s  speedup: {result['speedup']:.0f}x")
+    print(f"single value  linear scan: {scalar['linear_scan_us']:.2f}us  lookup tables: {scalar['tables_us']:.2f}us")
@@ -0,0 +1,67 @@
+import os
+import time
+import argparse
+import tempfile
+import pandas as pd
+from pathlib import Path
+
+from app.datasets.dataset_store import dataset_store
+from app.datasets.columnar_cache import columnar_cache
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+MODEL_COLUMNS = ["City", "Pollutant", "count", "min", "max", "variance", "median"]
+
+def best_of(repeats, fn, *args, **kwargs):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# Times a typed csv parse against reading the parquet copy, in full and with only the model columns
+def compare(filepath, cache, repeats):
+    file_hash = dataset_store.hash_file(filepath)
+    cache.load(filepath, file_hash, dataset_store.read) # Builds the parquet copy
+
+    csv_time = best_of(repeats, dataset_store.read, filepath)
+    parquet_time = best_of(repeats, cache.load, filepath, file_hash, dataset_store.read)
+    columns_time = best_of(repeats, cache.load, filepath, file_hash, dataset_store.read, MODEL_COLUMNS)
+    return {
+        "rows": len(pd.read_csv(filepath, usecols=["City"])),
+        "csv_s": csv_time,
+        "parquet_s": parquet_time,
+        "parquet_columns_s": columns_time,
+        "speedup": csv_time / parquet_time,
+    }
+
+def run(scale=20, repeats=3):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = columnar_cache(Path(temp_dir) / "cache")
+        if not cache.enabled:
+            raise RuntimeError("pyarrow is required to benchmark the parquet cache")
+
+        results.append(compare(DATA_PATH, cache, repeats))
+
+        # Larger input made of repeated copies of the dataset, with the original day-first dates
+        if scale > 1:
+            scaled_path = Path(temp_dir) / "australia_air_quality_scaled.csv"
+            dataframe = pd.read_csv(DATA_PATH)
+            pd.concat([dataframe] * scale, ignore_index=True).to_csv(scaled_path, index=False)
+            results.append(compare(scaled_path, cache, repeats))
+            os.remove(scaled_path)
+    return results
+
+# python -m app.benchmarks.dataset_load_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark csv against parquet dataset loading.")
+    parser.add_argument("--scale", type=int, default=20, help="copies of the dataset in the large run")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for result in run(args.scale, args.repeats):
+        print(f"{result['rows']:>9} rows  csv: {result['csv_s']:.3f}s  parquet: {result['parquet_s']:.3f}s  "
+              f"parquet ({len(MODEL_COLUMNS)} columns): {result['parquet_columns_s']:.3f}s  speedup: {result['speedup']:.1f}x")
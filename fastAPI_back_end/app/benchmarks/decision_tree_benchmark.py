@@ -0,0 +1,67 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from app.models.model_registry.model_registry import model_registry
+
+def best_of(repeats, fn, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# The previous severity step of combined_model.predict_frame for one predicted row:
+# a zero-filled pollutant frame and the sklearn classifier
+def sklearn_single(clf, pollutants, pollutant, median):
+    input_data = pd.DataFrame(0.0, index=[0], columns=pollutants)
+    input_data.loc[0, pollutant] = median
+    return clf.predict(input_data)
+
+# Pollutant medians drawn around the training distribution, one pollutant set per row as in serving
+def synthetic_rows(pollutants, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.zeros((rows, len(pollutants)))
+    X[np.arange(rows), rng.integers(0, len(pollutants), rows)] = rng.exponential(10.0, rows)
+    return X
+
+def run(rows=(1000, 100_000, 2_000_000), repeats=5):
+    registry = model_registry()
+    registry.load_or_train()
+    clf = registry.decision_tree.clf
+    tree = registry.decision_tree.compiled
+    pollutants = tree.feature_names
+
+    loops = 1000
+    results = {
+        "single_row_us": {
+            "sklearn": best_of(repeats, lambda: [sklearn_single(clf, pollutants, "so2", 3.0) for _ in range(loops)]) / loops * 1e6,
+            "compiled": best_of(repeats, lambda: [tree.predict_one({"so2": 3.0}) for _ in range(loops)]) / loops * 1e6,
+        },
+        "batches": [],
+    }
+    for n in rows:
+        X = synthetic_rows(pollutants, n)
+        frame = pd.DataFrame(X, columns=pollutants)
+        results["batches"].append({
+            "rows": n,
+            "sklearn_s": best_of(repeats, clf.predict, frame),
+            "compiled_s": best_of(repeats, tree.predict, X),
+            "identical": bool((clf.predict(frame) == tree.predict(X)).all()),
+        })
+    return results
+
+# python -m app.benchmarks.decision_tree_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the compiled decision tree against sklearn's predict.")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(repeats=args.repeats)
+    single = results["single_row_us"]
+    print(f"single row  sklearn: {single['sklearn']:.1f}us  compiled: {single['compiled']:.1f}us")
+    for result in results["batches"]:
+        print(f"{result['rows']:>9} rows  sklearn: {result['sklearn_s'] * 1000:.1f}ms  "
+              f"compiled: {result['compiled_s'] * 1000:.1f}ms  identical: {result['identical']}")
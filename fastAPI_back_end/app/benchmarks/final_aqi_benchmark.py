@@ -0,0 +1,102 @@
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+import pandas as pd
+from pathlib import Path
+
+from app.aqi_calculation.final_aqi_determinator import final_aqi_determinator, highest_aqi_indices
+from app.datasets.dataset_store import dataset_store
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality_pollutant_aqi.csv"
+
+# The previous determine(): groupby idxmax, .loc gather, then a sort of the output
+def groupby_idxmax(dataframe):
+    df_valid = dataframe.dropna(subset=['AQI'])
+    max_aqi_indices = df_valid.groupby(["Date", "City"], observed=True)["AQI"].idxmax().dropna().astype(int)
+    return dataframe.loc[max_aqi_indices][["Date", "City", "AQI", "Rounded AQI"]].reset_index(drop=True).sort_values(by='Date')
+
+def slot_reduction(dataframe):
+    return dataframe.iloc[highest_aqi_indices(dataframe['Date'], dataframe['City'], dataframe['AQI'])]
+
+def best_of(repeats, fn, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# Peak traced memory (numpy and pandas buffers) while running fn, in MB
+def peak_memory(fn, *args):
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+# Copies of the dataset shifted by whole multiples of its date span, as a longer history of the same cities
+def scaled_history(dataframe, copies):
+    span = dataframe['Date'].max() - dataframe['Date'].min() + pd.Timedelta(days=1)
+    frames = []
+    for copy in range(copies):
+        frame = dataframe.copy()
+        frame['Date'] = frame['Date'] + copy * span
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def compare_in_memory(dataframe, repeats):
+    baseline = best_of(repeats, groupby_idxmax, dataframe)
+    vectorized = best_of(repeats, slot_reduction, dataframe)
+    return {"rows": len(dataframe), "groupby_idxmax_s": baseline, "slot_reduction_s": vectorized, "speedup": baseline / vectorized}
+
+# Full load and in-memory reduction against the chunked, month-partitioned streaming mode on the same csv
+def compare_streaming(filepath, chunksize):
+    determinator = final_aqi_determinator()
+    output_path = Path(tempfile.gettempdir()) / "final_aqi_streaming_benchmark.csv"
+
+    def in_memory():
+        dataframe = dataset_store.read(filepath)[["Date", "City", "AQI", "Rounded AQI"]]
+        slot_reduction(dataframe)
+
+    def streaming():
+        determinator.determine_streaming(output_path, filepath=filepath, chunksize=chunksize)
+
+    # Timed without tracing, which slows every allocation down; memory is measured on a second run
+    results = {"in_memory_s": best_of(1, in_memory), "in_memory_peak_mb": peak_memory(in_memory),
+               "streaming_s": best_of(1, streaming), "streaming_peak_mb": peak_memory(streaming)}
+    os.remove(output_path)
+    return results
+
+def run(copies=200, stream_copies=50, chunksize=200_000, repeats=3):
+    dataframe = dataset_store.read(DATA_PATH)[["Date", "City", "AQI", "Rounded AQI"]]
+    results = {"in_memory": [compare_in_memory(dataframe, repeats),
+                             compare_in_memory(scaled_history(dataframe, copies), 1)]}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history_path = Path(temp_dir) / "history.csv"
+        history = scaled_history(dataframe, stream_copies)
+        history.to_csv(history_path, index=False, date_format="%Y-%m-%d")
+        results["streaming"] = compare_streaming(history_path, chunksize)
+        results["streaming"]["rows"] = len(history)
+    return results
+
+# python -m app.benchmarks.final_aqi_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the highest AQI per (Date, City) reduction.")
+    parser.add_argument("--copies", type=int, default=200, help="dataset copies in the large in-memory run")
+    parser.add_argument("--stream-copies", type=int, default=50, help="dataset copies in the streaming run")
+    parser.add_argument("--chunksize", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.copies, args.stream_copies, args.chunksize, args.repeats)
+    for result in results["in_memory"]:
+        print(f"{result['rows']:>9} rows  groupby idxmax: {result['groupby_idxmax_s']:.3f}s  "
+              f"slot reduction: {result['slot_reduction_s']:.3f}s  speedup: {result['speedup']:.1f}x")
+    streaming = results["streaming"]
+    print(f"{streaming['rows']:>9} rows from csv  in memory: {streaming['in_memory_s']:.2f}s, peak {streaming['in_memory_peak_mb']:.0f}MB  "
+          f"streaming: {streaming['streaming_s']:.2f}s, peak {streaming['streaming_peak_mb']:.0f}MB")
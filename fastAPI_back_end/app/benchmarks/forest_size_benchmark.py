@@ -0,0 +1,61 @@
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+
+from app.models.random_forest.random_forest_pollutant_median import random_forest_pollutant_median
+from app.models.model_registry.model_registry import model_registry
+
+# (n_estimators, max_depth) settings compared against the default 100 unlimited-depth trees
+SETTINGS = [(100, None), (50, None), (50, 12), (25, 10), (10, 8)]
+
+def best_of(repeats, fn, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# Fits every (city, pollutant) forest with one setting and reports held-out accuracy,
+# prediction latency and serialized size, averaged or summed over the grid
+def evaluate(n_estimators, max_depth, repeats):
+    results, single_times, batch_times, size = [], [], [], 0
+    for pollutant in model_registry.POLLUTANTS:
+        rf = random_forest_pollutant_median(pollutant, n_estimators=n_estimators, max_depth=max_depth, n_jobs=-1)
+        rf.compute()
+        results.extend(rf.results)
+
+        sample = rf.df[rf.df["Pollutant"] == pollutant][rf.features]
+        for model in rf.models.values():
+            single_times.append(best_of(repeats, model.predict, sample.iloc[:1]))
+            batch_times.append(best_of(repeats, model.predict, sample.iloc[:1000]))
+            size += len(pickle.dumps(model))
+
+    results = pd.DataFrame(results)
+    return {
+        "n_estimators": n_estimators,
+        "max_depth": max_depth,
+        "forests": len(results),
+        "mean_r2": results["RF_R2"].mean(),
+        "mean_mae": results["RF_MAE"].mean(),
+        "single_row_ms": np.median(single_times) * 1000,
+        "batch_1000_ms": np.median(batch_times) * 1000,
+        "total_mb": size / (1024 * 1024),
+    }
+
+def run(settings=SETTINGS, repeats=5):
+    return [evaluate(n_estimators, max_depth, repeats) for n_estimators, max_depth in settings]
+
+# python -m app.benchmarks.forest_size_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare accuracy, latency and size of compact random forests.")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for result in run(repeats=args.repeats):
+        depth = result["max_depth"] if result["max_depth"] is not None else "none"
+        print(f"trees {result['n_estimators']:>3}  depth {depth:>4}  R2 {result['mean_r2']:.4f}  MAE {result['mean_mae']:.4f}  "
+              f"1 row {result['single_row_ms']:.2f}ms  1000 rows {result['batch_1000_ms']:.2f}ms  size {result['total_mb']:.1f}MB "
+              f"({result['forests']} forests)")
@@ -0,0 +1,92 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+from app.models.model_registry.model_registry import model_registry
+from app.features.feature_store import shared_feature_store
+from app.benchmarks.decision_tree_benchmark import best_of
+
+# The four sklearn pipelines of a city, each called on the feature frame, as predict() used to
+def pipelines_predict(pipelines, frame):
+    return np.column_stack([pipeline.predict(frame) for pipeline in pipelines.values()])
+
+# The previous feature building: parsed dates, .dt accessors, get_dummies and zero-filled missing dummies
+def pandas_features(dataframe, features):
+    new_data = dataframe.copy()
+    new_data["Date"] = pd.to_datetime(new_data["Date"])
+    new_data["dayofyear"] = new_data["Date"].dt.dayofyear
+    new_data["year"] = new_data["Date"].dt.year
+    new_data["month"] = new_data["Date"].dt.month
+    new_data["weekday"] = new_data["Date"].dt.weekday
+    new_data = pd.concat([new_data, pd.get_dummies(new_data["Pollutant"], prefix="pollutant")], axis=1)
+    for col in features:
+        if col not in new_data.columns:
+            new_data[col] = 0
+    return new_data[features].to_numpy(dtype=float)
+
+# Random dates over ten years and random pollutants, as (Date, City, Pollutant) rows of one city
+def synthetic_rows(city, pollutants, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.datetime64("2016-01-01") + rng.integers(0, 3650, rows)
+    return pd.DataFrame({"Date": days, "City": city, "Pollutant": np.asarray(pollutants)[rng.integers(0, len(pollutants), rows)]})
+
+def run(city="Sydney", rows=(1, 1000, 1_000_000), repeats=5):
+    registry = model_registry()
+    registry.load_or_train()
+    lr = registry.linear_regression
+    operator = lr.compact[city]
+    pipelines = {target: lr.models[f"{city}_{target}"] for target in lr.targets}
+
+    results = {"predictor": {}, "features": [], "operator": []}
+
+    # Whole predict() for one request row: the pipelines (previous path) against the compact operator
+    row = pd.DataFrame({"Date": ["2025-06-01"], "City": [city], "Pollutant": ["so2"]})
+    loops = 200
+    compact = dict(lr.compact)
+    results["predictor"]["compact_ms"] = best_of(repeats, lambda: [lr.predict(city, row) for _ in range(loops)]) / loops * 1000
+    lr.compact = {}
+    results["predictor"]["pipelines_ms"] = best_of(repeats, lambda: [lr.predict(city, row) for _ in range(loops)]) / loops * 1000
+    lr.compact = compact
+
+    for n in rows:
+        data = synthetic_rows(city, lr.selected_pollutants, n)
+        data["Date"] = data["Date"].dt.strftime("%Y-%m-%d") # Dates arrive as ISO strings
+        loops = max(1, 1000 // n)
+
+        # Feature building: pandas against the feature store's calendar and pollutant encoding
+        X = shared_feature_store.feature_matrix(data["Date"], data["Pollutant"], lr.features)
+        results["features"].append({
+            "rows": n,
+            "pandas_s": best_of(repeats, lambda: [pandas_features(data, lr.features) for _ in range(loops)]) / loops,
+            "feature_store_s": best_of(repeats, lambda: [shared_feature_store.feature_matrix(data["Date"], data["Pollutant"], lr.features) for _ in range(loops)]) / loops,
+            "identical": bool(np.array_equal(pandas_features(data, lr.features), X)),
+        })
+
+        # The models alone, on prebuilt features
+        frame = pd.DataFrame(X, columns=lr.features)
+        expected = pipelines_predict(pipelines, frame)
+        actual = operator.predict(X)
+        results["operator"].append({
+            "rows": n,
+            "pipelines_s": best_of(repeats, lambda: [pipelines_predict(pipelines, frame) for _ in range(loops)]) / loops,
+            "compact_s": best_of(repeats, lambda: [operator.predict(X) for _ in range(loops)]) / loops,
+            "max_relative_error": float(np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0))),
+        })
+    return results
+
+# python -m app.benchmarks.linear_regression_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the compact Linear Regression operator against the sklearn pipelines.")
+    parser.add_argument("--city", default="Sydney")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.city, repeats=args.repeats)
+    predictor = results["predictor"]
+    print(f"predict() one row  pipelines: {predictor['pipelines_ms']:.2f}ms  compact: {predictor['compact_ms']:.2f}ms")
+    for result in results["features"]:
+        print(f"{result['rows']:>9} rows  features  pandas: {result['pandas_s'] * 1000:.3f}ms  "
+              f"feature store: {result['feature_store_s'] * 1000:.3f}ms  identical: {result['identical']}")
+    for result in results["operator"]:
+        print(f"{result['rows']:>9} rows  models  pipelines: {result['pipelines_s'] * 1000:.3f}ms  compact: {result['compact_s'] * 1000:.3f}ms  "
+              f"max relative error: {result['max_relative_error']:.1e}")
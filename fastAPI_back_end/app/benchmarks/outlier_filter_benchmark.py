@@ -0,0 +1,91 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from app.datasets.dataset_store import shared_dataset_store
+from app.datasets.outlier_filter import outlier_filter
+from app.benchmarks.final_aqi_benchmark import best_of, peak_memory
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+COLUMNS = ["count", "min", "max", "variance", "median"]
+
+# The previous filter: pandas quantiles, chained comparisons and .any(axis=1)
+def pandas_filter(df, columns):
+    Q1 = df[columns].quantile(0.25)
+    Q3 = df[columns].quantile(0.75)
+    IQR = Q3 - Q1
+    lower, upper = Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+    return df[~((df[columns] < lower) | (df[columns] > upper)).any(axis=1)]
+
+def pandas_mask(df, columns, lower, upper):
+    return ~((df[columns] < lower) | (df[columns] > upper)).any(axis=1)
+
+def compare_mask(df, repeats):
+    outliers = outlier_filter(COLUMNS).fit(df)
+    lower, upper = outliers.bounds
+    return {
+        "rows": len(df),
+        "pandas_fit_and_filter_s": best_of(repeats, pandas_filter, df, COLUMNS),
+        "pandas_mask_s": best_of(repeats, pandas_mask, df, COLUMNS, lower, upper),
+        "outlier_filter_mask_s": best_of(repeats, outliers.mask, df),
+        "identical": bool(pandas_filter(df, COLUMNS).index.equals(outliers.filter(df).index)),
+    }
+
+# Bounds from a chunked read of a csv by exact selection, against loading it whole
+def compare_out_of_core(df, chunksize, max_in_memory):
+    path = Path(tempfile.gettempdir()) / "outlier_filter_benchmark.csv"
+    df[COLUMNS].to_csv(path, index=False)
+    try:
+        def in_memory():
+            return outlier_filter(COLUMNS).fit(pd.read_csv(path).dropna())
+
+        def chunked():
+            return outlier_filter(COLUMNS).fit_chunks(lambda: (chunk.dropna() for chunk in pd.read_csv(path, chunksize=chunksize)), max_in_memory)
+
+        start = time.perf_counter()
+        expected = in_memory()
+        in_memory_s = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = chunked()
+        chunked_s = time.perf_counter() - start
+        return {
+            "rows": len(df),
+            "in_memory_s": in_memory_s,
+            "chunked_s": chunked_s,
+            "in_memory_peak_mb": peak_memory(in_memory),
+            "chunked_peak_mb": peak_memory(chunked),
+            "identical": bool(np.array_equal(expected.lower, actual.lower) and np.array_equal(expected.upper, actual.upper)),
+        }
+    finally:
+        os.remove(path)
+
+def run(copies=200, repeats=3, chunksize=500_000, max_in_memory=100_000):
+    df = shared_dataset_store.clean(DATA_PATH)
+    large = pd.concat([df] * copies, ignore_index=True)
+    return {
+        "mask": [compare_mask(df, repeats), compare_mask(large, repeats)],
+        "out_of_core": compare_out_of_core(large, chunksize, max_in_memory),
+    }
+
+# python -m app.benchmarks.outlier_filter_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the outlier filter against the pandas IQR filter, in memory and out of core.")
+    parser.add_argument("--copies", type=int, default=200, help="copies of the dataset in the large run")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    args = parser.parse_args()
+
+    results = run(args.copies, args.repeats, args.chunksize)
+    for result in results["mask"]:
+        print(f"{result['rows']:>10} rows  pandas fit+filter: {result['pandas_fit_and_filter_s'] * 1000:.1f}ms  "
+              f"mask pandas: {result['pandas_mask_s'] * 1000:.1f}ms  outlier_filter: {result['outlier_filter_mask_s'] * 1000:.1f}ms  "
+              f"identical: {result['identical']}")
+    result = results["out_of_core"]
+    print(f"{result['rows']:>10} rows from csv  in memory: {result['in_memory_s']:.1f}s, {result['in_memory_peak_mb']:.0f}MB peak  "
+          f"chunked: {result['chunked_s']:.1f}s, {result['chunked_peak_mb']:.0f}MB peak  identical: {result['identical']}")
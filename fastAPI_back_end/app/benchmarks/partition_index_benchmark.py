@@ -0,0 +1,99 @@
+import time
+import shutil
+import argparse
+import tempfile
+import pandas as pd
+from pathlib import Path
+
+from app.datasets.dataset_store import dataset_store, shared_dataset_store
+from app.datasets.partition_index import partition_index
+from app.datasets.partitioned_dataset import partitioned_dataset
+from app.benchmarks.final_aqi_benchmark import best_of
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+
+# The previous lookups: a boolean mask over every row
+def mask_rows(df, city, pollutant=None):
+    if pollutant is None:
+        return df[df["City"] == city]
+    return df[(df["City"] == city) & (df["Pollutant"] == pollutant)]
+
+# Every city's and every (city, pollutant)'s rows, looked up by mask and through the index
+def compare_in_memory(df, repeats):
+    start = time.perf_counter()
+    index = partition_index(df)
+    build_s = time.perf_counter() - start
+    keys = list(index.ranges)
+    cities = index.cities()
+    return {
+        "rows": len(df),
+        "build_s": build_s,
+        "mask_partition_s": best_of(repeats, lambda: [mask_rows(df, city, pollutant) for city, pollutant in keys]) / len(keys),
+        "index_partition_s": best_of(repeats, lambda: [index.rows(city, pollutant) for city, pollutant in keys]) / len(keys),
+        "mask_city_s": best_of(repeats, lambda: [mask_rows(df, city) for city in cities]) / len(cities),
+        "index_city_s": best_of(repeats, lambda: [index.rows(city) for city in cities]) / len(cities),
+        "identical": all(index.rows(city, pollutant).equals(mask_rows(df, city, pollutant)) for city, pollutant in keys)
+                     and all(index.rows(city).equals(mask_rows(df, city)) for city in cities),
+    }
+
+# One (city, pollutant)'s history from a csv too large to load: a chunked scan of the whole csv
+# against reading its partition, after partitioning the csv once
+def compare_on_disk(df, city, pollutant, chunksize):
+    data_path = Path(tempfile.gettempdir()) / "partition_index_benchmark.csv"
+    partitions_path = Path(tempfile.gettempdir()) / "partition_index_benchmark"
+    df.to_csv(data_path, index=False, date_format="%Y-%m-%d")
+    try:
+        def scan():
+            frames = []
+            for chunk in pd.read_csv(data_path, chunksize=chunksize):
+                chunk["Date"] = dataset_store.parse_dates(chunk["Date"])
+                frames.append(mask_rows(chunk.dropna(), city, pollutant))
+            return pd.concat(frames, ignore_index=True)
+
+        start = time.perf_counter()
+        partitions = partitioned_dataset.write(data_path, partitions_path, chunksize=chunksize)
+        partition_s = time.perf_counter() - start
+        start = time.perf_counter()
+        expected = scan()
+        scan_s = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = partitions.frame(city, pollutant)
+        read_s = time.perf_counter() - start
+        return {
+            "rows": len(df),
+            "partition_rows": partitions.rows(city, pollutant),
+            "partition_s": partition_s,
+            "scan_s": scan_s,
+            "read_s": read_s,
+            "identical": bool(expected.equals(actual)),
+        }
+    finally:
+        data_path.unlink()
+        shutil.rmtree(partitions_path, ignore_errors=True)
+
+def run(copies=100, disk_copies=20, city="Sydney", pollutant="pm10", repeats=3, chunksize=500_000):
+    df = shared_dataset_store.clean(DATA_PATH)
+    return {
+        "in_memory": [compare_in_memory(df, repeats), compare_in_memory(pd.concat([df] * copies, ignore_index=True), repeats)],
+        "on_disk": compare_on_disk(pd.concat([df] * disk_copies, ignore_index=True), city, pollutant, chunksize),
+    }
+
+# python -m app.benchmarks.partition_index_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare (City, Pollutant) partition lookups against boolean masks, in memory and on disk.")
+    parser.add_argument("--copies", type=int, default=100, help="copies of the dataset in the large in-memory run")
+    parser.add_argument("--disk-copies", type=int, default=20, help="copies of the dataset in the on-disk run")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.copies, args.disk_copies, repeats=args.repeats)
+    for result in results["in_memory"]:
+        print(f"{result['rows']:>9} rows  index built in {result['build_s'] * 1000:.1f}ms  "
+              f"(city, pollutant) mask: {result['mask_partition_s'] * 1000:.3f}ms  index: {result['index_partition_s'] * 1000:.3f}ms  "
+              f"city mask: {result['mask_city_s'] * 1000:.3f}ms  index: {result['index_city_s'] * 1000:.3f}ms  identical: {result['identical']}")
+    result = results["on_disk"]
+    print(f"{result['rows']:>9} rows on disk  partitioned once in {result['partition_s']:.1f}s  "
+          f"{result['partition_rows']} rows of one (city, pollutant)  csv scan: {result['scan_s']:.2f}s  "
+          f"partition read: {result['read_s'] * 1000:.1f}ms  identical: {result['identical']}")
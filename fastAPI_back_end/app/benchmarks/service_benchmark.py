@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import socket
+import platform
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from app.benchmarks.startup_benchmark import measure, CURRENT_STARTUP
+
+MAIN_PATH = Path("app")
+
+RESULTS_PATH = MAIN_PATH / "benchmarks" / "results"
+
+# Every request is computed by default: the result cache would otherwise answer repeated requests,
+# and the audit trail would write every prediction to disk. --cache and --audit turn them back on.
+def service_environment(cache, audit):
+    env = dict(os.environ)
+    if not cache:
+        env["RESULT_CACHE_BACKEND"] = "none"
+    if not audit:
+        env["AUDIT_SINK"] = "none"
+    return env
+
+# (date, city, pollutant) request bodies spread over the trained (city, pollutant) models and a year of dates
+def request_bodies(registry, count, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = list(registry.rf_models)
+    dates = pd.date_range("2025-01-01", periods=365, freq="D").strftime("%Y-%m-%d")
+    bodies = []
+    for key, day in zip(rng.integers(0, len(keys), count), rng.integers(0, len(dates), count)):
+        city, pollutant = keys[key]
+        bodies.append({"date": dates[day], "city": city, "pollutant": pollutant})
+    return bodies
+
+def latency_summary(latencies, seconds):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "requests_per_s": len(latencies) / seconds,
+    }
+
+# Sends every body to /predict from `concurrency` threads, each holding one request open at a time.
+# send(body) returns the response status code.
+def load(send, bodies, concurrency):
+    def timed(body):
+        start = time.perf_counter()
+        status = send(body)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, bodies))
+    seconds = time.perf_counter() - start
+
+    errors = sum(1 for _, status in outcomes if status != 200)
+    result = latency_summary([latency for latency, _ in outcomes], seconds)
+    result.update({"concurrency": concurrency, "errors": errors})
+    return result
+
+# /predict through Starlette's TestClient: the full app and middleware, without a network stack
+def in_process(bodies, concurrency_levels, warmup):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = []
+    with TestClient(app) as client:
+        send = lambda body: client.post("/predict", json=body).status_code
+        for body in bodies[:warmup]:
+            send(body)
+        for concurrency in concurrency_levels:
+            results.append(load(send, bodies[warmup:], concurrency))
+    return results
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# /predict against a real Uvicorn server in a child process, over HTTP with one keep-alive client per thread
+def uvicorn_server(bodies, concurrency_levels, warmup, env, startup_timeout=600):
+    import httpx
+    import threading
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.perf_counter() + startup_timeout
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"Uvicorn exited with code {server.returncode} before serving")
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"Uvicorn did not start within {startup_timeout}s")
+            time.sleep(0.2)
+
+        local = threading.local()
+        def send(body):
+            if not hasattr(local, "client"):
+                local.client = httpx.Client(base_url=url, timeout=60)
+            return local.client.post("/predict", json=body).status_code
+
+        for body in bodies[:warmup]:
+            send(body)
+        return [load(send, bodies[warmup:], concurrency) for concurrency in concurrency_levels]
+    finally:
+        server.terminate()
+        server.wait()
+
+def stage_summary(fn, iterations):
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times = np.asarray(times) * 1e6
+    return {"p50_us": float(np.percentile(times, 50)), "p95_us": float(np.percentile(times, 95)), "mean_us": float(times.mean())}
+
+# Times each stage of one /predict on its own, with the same single-row inputs combined_model uses
+def stages(registry, iterations):
+    from app.models.combined_model.combined_model import combined_model
+    from app.models.random_forest.random_forest_pollutant_median import random_forest_pollutant_median
+    from app.aqi_calculation.aqi_conversion import calculate_aqi
+    from app.datasets.dataset_store import dataset_store
+
+    city, pollutant = next(iter(registry.rf_models))
+    row = pd.DataFrame({"Date": ["2025-06-01"], "City": [city], "Pollutant": [pollutant]})
+    lr_row = row.join(registry.predict_linear_regression(city, row)[["count", "variance", "min", "max"]])
+    median = float(registry.predict_random_forest(city, pollutant, lr_row.dropna(subset=random_forest_pollutant_median.FEATURES))["median"].iloc[0])
+    tree = registry.decision_tree.compiled
+    medians = np.zeros((1, len(tree.feature_names)))
+    medians[0, tree.feature_names.index(pollutant)] = median
+    model = combined_model(registry=registry)
+
+    return {
+        "linear_regression": stage_summary(lambda: registry.predict_linear_regression(city, row), iterations),
+        "random_forest": stage_summary(lambda: registry.predict_random_forest(city, pollutant, lr_row), iterations),
+        "decision_tree": stage_summary(lambda: tree.predict(medians), iterations),
+        "calculate_aqi": stage_summary(lambda: calculate_aqi(median, pollutant), iterations),
+        "compute": stage_summary(lambda: model.compute("2025-06-01", city, pollutant), iterations),
+        "csv_load": stage_summary(lambda: dataset_store.read(dataset_store.AIR_QUALITY_PATH), max(1, iterations // 100)),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(requests=500, concurrency_levels=(1, 4, 16), iterations=1000, warmup=20,
+        modes=("in_process", "uvicorn"), cache=False, audit=False, startup_repeats=3):
+    env = service_environment(cache, audit)
+    os.environ.update(env) # The in-process app and the cold start children read the same settings
+
+    from app.models.model_registry.model_registry import model_registry
+    registry = model_registry()
+    registry.load_or_train()
+    bodies = request_bodies(registry, requests + warmup)
+
+    results = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "model_version": registry.version,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": {"requests": requests, "concurrency": list(concurrency_levels), "iterations": iterations,
+                         "warmup": warmup, "cache": cache, "audit": audit},
+        },
+        "cold_start_s": min(measure(CURRENT_STARTUP) for _ in range(startup_repeats)),
+        "stages": stages(registry, iterations),
+    }
+    if "in_process" in modes:
+        results["in_process"] = in_process(bodies, concurrency_levels, warmup)
+    if "uvicorn" in modes:
+        results["uvicorn"] = uvicorn_server(bodies, concurrency_levels, warmup, env)
+    return results
+
+# Relative change of every matching latency and throughput figure against an earlier results file
+def compare(results, baseline):
+    lines = []
+    for mode in ["in_process", "uvicorn"]:
+        before = {r["concurrency"]: r for r in baseline.get(mode, [])}
+        for result in results.get(mode, []):
+            previous = before.get(result["concurrency"])
+            if previous:
+                lines.append(f"{mode} c={result['concurrency']}: p50 {change(result['p50_ms'], previous['p50_ms'])}  "
+                             f"p99 {change(result['p99_ms'], previous['p99_ms'])}  "
+                             f"req/s {change(result['requests_per_s'], previous['requests_per_s'])}")
+    for stage, result in results["stages"].items():
+        if stage in baseline.get("stages", {}):
+            lines.append(f"{stage}: p50 {change(result['p50_us'], baseline['stages'][stage]['p50_us'])}")
+    if "cold_start_s" in baseline:
+        lines.append(f"cold start: {change(results['cold_start_s'], baseline['cold_start_s'])}")
+    return lines
+
+def change(current, previous):
+    return f"{(current - previous) / previous * 100:+.1f}%" if previous else "n/a"
+
+# python -m app.benchmarks.service_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /predict latency, throughput and per-stage timings.")
+    parser.add_argument("--requests", type=int, default=500, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--iterations", type=int, default=1000, help="calls per stage microbenchmark")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", choices=["in_process", "uvicorn"], default=["in_process", "uvicorn"])
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on")
+    parser.add_argument("--audit", action="store_true", help="keep the audit trail on")
+    parser.add_argument("--output", help="results file (default: app/benchmarks/results/service_<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run(args.requests, args.concurrency, args.iterations, args.warmup, args.modes, args.cache, args.audit)
+
+    output = Path(args.output) if args.output else RESULTS_PATH / f"service_{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"Cold start: {results['cold_start_s']:.2f}s")
+    for stage, result in results["stages"].items():
+        print(f"{stage:>17}  p50 {result['p50_us']:>10.1f}us  p95 {result['p95_us']:>10.1f}us")
+    for mode in args.modes:
+        for result in results[mode]:
+            print(f"{mode:>10} c={result['concurrency']:<3}  p50 {result['p50_ms']:.2f}ms  p95 {result['p95_ms']:.2f}ms  "
+                  f"p99 {result['p99_ms']:.2f}ms  {result['requests_per_s']:.0f} req/s  errors {result['errors']}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            for line in compare(results, json.load(f)):
+                print(line)
+    print(f"Results saved to {output}")
@@ -0,0 +1,65 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Each measurement runs in a fresh interpreter so imports and dataset loads are cold
+
+# What main.py used to do at import: fit the decision tree, with the 13-depth x 5-fold grid search
+LEGACY_STARTUP = """
+import time, json
+start = time.perf_counter()
+import fastapi
+from app.models.decision_tree.decision_tree_aqi_severity import decision_tree_aqi_severity
+dt = decision_tree_aqi_severity()
+dt.prepare_data()
+dt.tune_depth()
+dt.train_tree()
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+# Loading the same, already tuned decision tree from the registry and warming it up
+CURRENT_DECISION_TREE = """
+import time, json
+start = time.perf_counter()
+import fastapi
+import joblib, pandas as pd
+from app.models.model_registry.model_registry import model_registry
+registry = model_registry()
+clf = joblib.load(registry.registry_path / registry.latest_version() / "decision_tree.pkl")["model"]
+clf.predict(pd.DataFrame([[0.0] * 6], columns=clf.feature_names_in_))
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+# Current startup: import the app, which loads the registry and warms the models up
+CURRENT_STARTUP = """
+import time, json
+start = time.perf_counter()
+from app.main import global_combined_model
+assert global_combined_model is not None and global_combined_model.ready
+print(json.dumps({"seconds": time.perf_counter() - start}))
+"""
+
+def measure(code):
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])["seconds"]
+
+def run(repeats=3):
+    # The first current run trains the registry if it is empty; it is not counted
+    measure(CURRENT_STARTUP)
+    return {
+        "legacy_decision_tree_s": min(measure(LEGACY_STARTUP) for _ in range(repeats)),
+        "registry_decision_tree_s": min(measure(CURRENT_DECISION_TREE) for _ in range(repeats)),
+        "current_startup_s": min(measure(CURRENT_STARTUP) for _ in range(repeats)),
+    }
+
+# python -m app.benchmarks.startup_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark service startup time.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    result = run(args.repeats)
+    print(f"Decision tree tuning at startup (previous behaviour): {result['legacy_decision_tree_s']:.2f}s")
+    print(f"Loading the tuned decision tree from the registry: {result['registry_decision_tree_s']:.2f}s")
+    print(f"Full startup from the model registry, including warm-up: {result['current_startup_s']:.2f}s")
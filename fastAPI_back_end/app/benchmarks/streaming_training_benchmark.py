@@ -0,0 +1,97 @@
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import pandas as pd
+from pathlib import Path
+
+MAIN_PATH = Path("app")
+
+DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+
+# Peak and current resident memory of this process in MB, from /proc (Linux only)
+def resident_memory():
+    memory = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmHWM", "VmRSS"):
+                memory[name] = int(value.split()[0]) / 1024
+    return memory
+
+# Child process: trains every city's Linear Regression and the forests of one pollutant through the
+# training tasks, in memory or streaming, and sends back the time and the memory used
+def train(connection, data_path, streaming, chunksize, max_forest_rows, pollutant, n_estimators):
+    from app.models.model_registry import training_tasks
+    from app.models.model_registry.model_registry import model_registry
+    from app.datasets.dataset_store import dataset_store
+
+    start_memory = resident_memory()["VmRSS"]
+    start = time.perf_counter()
+    registry = model_registry(data_path=data_path)
+    options = registry.streaming_options(dataset_store.hash_file(data_path), chunksize, max_forest_rows) if streaming else None
+    training_tasks.init_worker(data_path, registry.dt_data_path, {"n_estimators": n_estimators, "max_depth": None, "n_jobs": 1}, options)
+    tasks = [task for task in training_tasks.training_tasks([pollutant]) if task[0] != "decision_tree"]
+    version_path = Path(tempfile.mkdtemp(prefix="streaming_training_"))
+    try:
+        (version_path / "random_forest").mkdir()
+        outputs = [training_tasks.run_task(task, version_path, "benchmark", "") for task in tasks]
+    finally:
+        shutil.rmtree(version_path, ignore_errors=True)
+    lr_results = pd.DataFrame([row for output in outputs if output["task"][0] == "linear_regression" for row in output["results"]])
+    connection.send({
+        "seconds": time.perf_counter() - start,
+        "peak_mb": resident_memory()["VmHWM"] - start_memory,
+        "mean_r2": float(lr_results["Linear_R2"].mean()),
+    })
+
+def measure(data_path, streaming, chunksize, max_forest_rows, pollutant, n_estimators):
+    context = multiprocessing.get_context("spawn") # A fresh interpreter per run, so peaks do not carry over
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=train, args=(sender, data_path, streaming, chunksize, max_forest_rows, pollutant, n_estimators))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+# Trains on copies of the dataset stacked into larger csv files. The in-memory path is skipped above
+# in_memory_copies, where it needs more memory than the run is meant to take.
+def run(copies=(1, 10, 40), in_memory_copies=10, chunksize=100_000, max_forest_rows=50_000, pollutant="pm10", n_estimators=10):
+    from app.datasets.dataset_store import shared_dataset_store
+    from app.datasets.partitioned_dataset import partitioned_dataset
+
+    df = shared_dataset_store.frame(DATA_PATH)
+    results = []
+    for copy_count in copies:
+        data_path = Path(tempfile.gettempdir()) / f"streaming_training_benchmark_{copy_count}.csv"
+        pd.concat([df] * copy_count, ignore_index=True).to_csv(data_path, index=False, date_format="%Y-%m-%d")
+        try:
+            result = {"rows": len(df) * copy_count}
+            result["streaming"] = measure(data_path, True, chunksize, max_forest_rows, pollutant, n_estimators)
+            if copy_count <= in_memory_copies:
+                result["in_memory"] = measure(data_path, False, chunksize, max_forest_rows, pollutant, n_estimators)
+            results.append(result)
+        finally:
+            data_path.unlink()
+            for path in shared_dataset_store.cache.paths(data_path): # Parquet copy made by the in-memory run
+                path.unlink(missing_ok=True)
+            shutil.rmtree(partitioned_dataset.PARTITIONS_PATH / data_path.stem, ignore_errors=True)
+    return results
+
+# python -m app.benchmarks.streaming_training_benchmark (run from fastAPI_back_end, Linux only)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the peak memory of streaming training against in-memory training as the data grows.")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 10, 40], help="copies of the dataset in each run")
+    parser.add_argument("--in-memory-copies", type=int, default=10, help="largest run also trained in memory")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--forest-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    for result in run(args.copies, args.in_memory_copies, args.chunksize, args.forest_rows):
+        line = f"{result['rows']:>10} rows"
+        for mode in ("streaming", "in_memory"):
+            if mode in result:
+                line += (f"  {mode.replace('_', ' ')}: {result[mode]['seconds']:.1f}s, {result[mode]['peak_mb']:.0f}MB peak, "
+                         f"LR mean R2 {result[mode]['mean_r2']:.4f}")
+        print(line)
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+from app.benchmarks.service_benchmark import service_environment, free_port
+
+# Memory of app.serve with the models preloaded once in the parent and shared by the forked workers,
+# against every worker loading its own copy (--no-preload). Linux only: it reads /proc/<pid>/smaps_rollup.
+#
+# Pss (proportional set size) splits every shared page between the processes sharing it, so the sum of
+# Pss over the parent and the workers is the memory the whole server really uses.
+
+SMAPS_FIELDS = ["Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"]
+
+# smaps_rollup fields of one process, in MB
+def memory_of(pid):
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0]) / 1024
+    return values
+
+def children_of(pid):
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children += [int(child) for child in f.read().split()]
+    return children
+
+# Starts app.serve, sends `rounds` requests for every (city, pollutant) forest so every worker has
+# served (and copied whatever it writes to) the whole model set, then reads the memory of each process
+def measure(workers, preload, keys, rounds, env, startup_timeout=600):
+    import httpx
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-m", "app.serve", "--workers", str(workers), "--port", str(port), "--log-level", "info"]
+    if not preload:
+        command.append("--no-preload")
+
+    start = time.perf_counter()
+    log = tempfile.TemporaryFile(mode="w+")
+    server = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        # Ready once every worker has finished its startup (and, without preload, loaded the models)
+        deadline = start + startup_timeout
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"app.serve exited with code {server.returncode} before serving")
+            log.seek(0)
+            if log.read().count("Application startup complete") >= workers:
+                break
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"app.serve did not start within {startup_timeout}s")
+            time.sleep(0.2)
+        startup = time.perf_counter() - start
+
+        # A new connection per round spreads the requests over the workers
+        for round in range(rounds * workers):
+            with httpx.Client(base_url=url, timeout=60) as client:
+                for city, pollutant in keys:
+                    client.post("/predict", json={"date": f"2025-06-{round % 28 + 1:02d}", "city": city, "pollutant": pollutant})
+
+        parent = memory_of(server.pid)
+        per_worker = [memory_of(pid) for pid in children_of(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+        log.close()
+
+    mean = {field: sum(w[field] for w in per_worker) / len(per_worker) for field in SMAPS_FIELDS}
+    return {
+        "workers": workers,
+        "preload": preload,
+        "startup_s": startup,
+        "worker_mean_mb": mean,
+        "parent_mb": parent,
+        "total_pss_mb": parent["Pss"] + sum(w["Pss"] for w in per_worker),
+    }
+
+def run(worker_counts=(1, 2, 4), rounds=2):
+    from app.models.model_registry.model_registry import model_registry
+
+    env = service_environment(cache=False, audit=False)
+    registry = model_registry()
+    registry.load_or_train()
+    keys = list(registry.rf_models)
+    results = []
+    for workers in worker_counts:
+        for preload in [True, False]:
+            results.append(measure(workers, preload, keys, rounds, env))
+    return results
+
+# python -m app.benchmarks.worker_memory_benchmark (run from fastAPI_back_end)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark memory per worker with and without preloading the models.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rounds", type=int, default=2, help="requests per forest and worker before measuring")
+    args = parser.parse_args()
+
+    for result in run(args.workers, args.rounds):
+        worker = result["worker_mean_mb"]
+        print(f"{result['workers']} workers, preload {'on ' if result['preload'] else 'off'}: "
+              f"per worker Rss {worker['Rss']:.0f}MB  Pss {worker['Pss']:.0f}MB  "
+              f"private {worker['Private_Clean'] + worker['Private_Dirty']:.0f}MB  "
+              f"shared {worker['Shared_Clean'] + worker['Shared_Dirty']:.0f}MB  |  "
+              f"total Pss {result['total_pss_mb']:.0f}MB  startup {result['startup_s']:.1f}s")
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# In-process LRU cache whose entries also expire after a TTL
+class memory_cache_backend:
+
+    def __init__(self, max_entries = 4096, ttl = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (expiry time, value), least recently used first
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {"backend": "memory", "entries": len(self.entries), "max_entries": self.max_entries,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+# Redis-backed cache shared by every worker; needs the optional redis package
+class redis_cache_backend:
+
+    def __init__(self, url, ttl = 3600, prefix = "aqi-prediction:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = 0
+
+    # Redis failures degrade to cache misses rather than failing the request
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Result cache read failed: {e}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        try:
+            self.client.setex(self.prefix + key, self.ttl, json.dumps(value))
+        except Exception as e:
+            self.errors += 1
+            print(f"Result cache write failed: {e}")
+
+    def stats(self):
+        return {"backend": "redis", "errors": self.errors}
+
+# Caches prediction results by (model version, date, city, pollutant). Keys carry the model version,
+# so a new version never reads results of an older one; those are not cleared (a request still running
+# on the old models may store one after the switch) but age out through the LRU limit or the TTL.
+class result_cache:
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.version = None # Version of the latest lookup, reported in stats
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(version, date, city, pollutant):
+        return f"{version}|{date}|{city}|{pollutant}"
+
+    def get(self, version, date, city, pollutant):
+        self.version = version
+        value = self.backend.get(result_cache.key(version, date, city, pollutant))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, version, date, city, pollutant, value):
+        self.backend.set(result_cache.key(version, date, city, pollutant), value)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses, "model_version": self.version}
+        stats.update(self.backend.stats())
+        return stats
+
+    # Builds the cache configured by RESULT_CACHE_BACKEND (memory, redis or none), RESULT_CACHE_SIZE,
+    # RESULT_CACHE_TTL and RESULT_CACHE_REDIS_URL; returns None when caching is disabled
+    @staticmethod
+    def from_environment():
+        backend_name = os.environ.get("RESULT_CACHE_BACKEND", "memory")
+        ttl = float(os.environ.get("RESULT_CACHE_TTL", 3600))
+        if backend_name == "none":
+            return None
+        if backend_name == "redis":
+            url = os.environ.get("RESULT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+            return result_cache(redis_cache_backend(url, int(ttl)))
+        return result_cache(memory_cache_backend(int(os.environ.get("RESULT_CACHE_SIZE", 4096)), ttl))
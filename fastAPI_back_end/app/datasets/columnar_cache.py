@@ -0,0 +1,72 @@
+import os
+import json
+import pandas as pd
+from pathlib import Path
+
+# Parquet support is optional; without pyarrow every read falls back to the csv
+try:
+    import pyarrow
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+MAIN_PATH = Path("app")
+
+class columnar_cache:
+
+    CACHE_PATH = MAIN_PATH / "data" / "cache"
+
+    def __init__(self, cache_path = CACHE_PATH, enabled = os.environ.get("DATASET_CACHE", "1") != "0"):
+        self.cache_path = Path(cache_path)
+        self.enabled = enabled and PARQUET_AVAILABLE
+        if enabled and not PARQUET_AVAILABLE:
+            print("pyarrow is not installed; datasets will be read from csv. Install pyarrow to enable the parquet cache.")
+
+    def paths(self, filepath):
+        stem = Path(filepath).stem
+        return self.cache_path / f"{stem}.parquet", self.cache_path / f"{stem}.json"
+
+    # Returns True if the cached copy was built from the file version with this hash
+    def is_fresh(self, filepath, file_hash):
+        cache_file, meta_file = self.paths(filepath)
+        if not (os.path.exists(cache_file) and os.path.exists(meta_file)):
+            return False
+        with open(meta_file) as f:
+            meta = json.load(f)
+        return meta.get("source_hash") == file_hash
+
+    # Reads a dataset from its parquet copy, or from the csv (rebuilding the copy) when the copy is stale.
+    # reader(filepath) must return the full typed frame of the csv.
+    def load(self, filepath, file_hash, reader, columns=None):
+        if not self.enabled:
+            dataframe = reader(filepath)
+            return dataframe[columns] if columns is not None else dataframe
+
+        cache_file, meta_file = self.paths(filepath)
+        if self.is_fresh(filepath, file_hash):
+            try:
+                return pd.read_parquet(cache_file, columns=columns)
+            except Exception as e:
+                print(f"Could not read cached {cache_file}, rebuilding it: {e}")
+
+        dataframe = reader(filepath)
+        self.write(dataframe, filepath, file_hash)
+        return dataframe[columns] if columns is not None else dataframe
+
+    # Writes the parquet copy and its metadata, each to a temporary file first and then renamed into place
+    def write(self, dataframe, filepath, file_hash):
+        cache_file, meta_file = self.paths(filepath)
+        os.makedirs(self.cache_path, exist_ok=True)
+        try:
+            temp_file = cache_file.with_suffix(f".parquet.{os.getpid()}.tmp")
+            dataframe.to_parquet(temp_file, index=False)
+            os.replace(temp_file, cache_file)
+
+            temp_meta = meta_file.with_suffix(f".json.{os.getpid()}.tmp")
+            with open(temp_meta, "w") as f:
+                json.dump({"source": str(filepath), "source_hash": file_hash, "rows": len(dataframe)}, f, indent=2)
+            os.replace(temp_meta, meta_file)
+            print(f"Cached {filepath} as {cache_file}")
+        except Exception as e:
+            # The cache is an optimisation only; the csv stays the source of truth
+            print(f"Could not cache {filepath}: {e}")
@@ -0,0 +1,170 @@
+import os
+import hashlib
+import threading
+import pandas as pd
+from pathlib import Path
+from app.datasets.columnar_cache import columnar_cache
+from app.datasets.outlier_filter import outlier_filter
+from app.datasets.partition_index import partition_index
+from app.metrics.service_metrics import shared_metrics
+
+MAIN_PATH = Path("app")
+
+# Frames handed out by the store are shallow views of the cached ones. With copy-on-write any
+# change a caller makes is applied to its own copy, so the shared frames stay read-only
+# (always on from pandas 3).
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+class dataset_store:
+
+    AIR_QUALITY_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+    POLLUTANT_AQI_PATH = MAIN_PATH / "data" / "australia_air_quality_pollutant_aqi.csv"
+    CATEGORICAL_COLUMNS = ["Country", "City", "Pollutant"]
+
+    def __init__(self, cache=None):
+        self.lock = threading.RLock()
+        self.cache = cache if cache is not None else columnar_cache()
+        self.sources = {} # Typed frame, mtime and hash of every loaded file, keyed by (path, columns)
+        self.derived = {} # Cleaned and filtered frames, keyed by (path, kind, columns)
+
+    # Computes the SHA-256 hash of a file in 1 MB blocks
+    @staticmethod
+    def hash_file(filepath):
+        digest = hashlib.sha256()
+        with open(filepath, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    # Parses ISO dates directly, falling back to day-first dates such as 26/12/2022
+    @staticmethod
+    def parse_dates(dates):
+        try:
+            return pd.to_datetime(dates, format="ISO8601")
+        except ValueError:
+            return pd.to_datetime(dates, dayfirst=True)
+
+    # Reads a csv with typed columns: parsed dates and categorical City/Pollutant/Country
+    @staticmethod
+    def read(filepath):
+        dataframe = pd.read_csv(filepath)
+        if "Date" in dataframe.columns:
+            dataframe["Date"] = dataset_store.parse_dates(dataframe["Date"])
+        for col in dataset_store.CATEGORICAL_COLUMNS:
+            if col in dataframe.columns:
+                dataframe[col] = dataframe[col].astype("category")
+        return dataframe
+
+    # Returns the cached entry of a file, (re)loading it only if its contents changed.
+    # Passing columns reads only those columns from the columnar cache.
+    def _source(self, filepath, columns=None):
+        key = (str(filepath), tuple(columns) if columns is not None else None)
+        mtime = os.stat(filepath).st_mtime_ns
+        with self.lock:
+            source = self.sources.get(key)
+            if source is not None and source["mtime"] == mtime:
+                return source
+
+            # The mtime moved: only reload if the contents really changed
+            file_hash = dataset_store.hash_file(filepath)
+            if source is not None and source["hash"] == file_hash:
+                source["mtime"] = mtime
+                return source
+
+            print(f"Loading dataset {filepath}...")
+            with shared_metrics.stage("dataset_load"):
+                frame = self.cache.load(filepath, file_hash, dataset_store.read, columns)
+            source = {"mtime": mtime, "hash": file_hash, "frame": frame}
+            self.sources[key] = source
+            return source
+
+    # Extends the loaded frames of a file with rows this process just appended to it (e.g. ingested
+    # observations) instead of re-reading and re-hashing the whole file, so the cost follows the rows
+    # appended. previous_mtime is the file's mtime before the append: frames loaded from another version,
+    # or that the rows do not fit, are dropped and reloaded in full on next use. The file's hash is not
+    # recomputed, so the entry's hash becomes a version tag; the parquet copy is left as it is and
+    # rebuilt by the next full load.
+    def append(self, filepath, rows, previous_mtime):
+        mtime = os.stat(filepath).st_mtime_ns
+        with self.lock:
+            for key in [key for key in self.sources if key[0] == str(filepath)]:
+                source = self.sources[key]
+                try:
+                    if source["mtime"] != previous_mtime:
+                        raise ValueError("loaded from another version of the file")
+                    frame = dataset_store.concat(source["frame"], rows)
+                except (KeyError, ValueError, TypeError):
+                    del self.sources[key]
+                    continue
+                self.sources[key] = {"mtime": mtime, "hash": f"{source['hash']}+{mtime}", "frame": frame}
+
+    # Rows appended to a typed frame, with the columns and dtypes the frame would have if read again
+    @staticmethod
+    def concat(frame, rows):
+        rows = rows[list(frame.columns)].copy()
+        frame = frame.copy(deep=False)
+        for col in frame.columns:
+            dtype = frame[col].dtype
+            if isinstance(dtype, pd.CategoricalDtype):
+                categories = dtype.categories.union(pd.Index(rows[col].astype(str).unique(), dtype=dtype.categories.dtype))
+                frame[col] = frame[col].cat.set_categories(categories)
+                rows[col] = rows[col].astype(str).astype(pd.CategoricalDtype(categories))
+            elif col == "Date" and not pd.api.types.is_datetime64_any_dtype(rows[col]):
+                rows[col] = dataset_store.parse_dates(rows[col]).astype(dtype)
+            else:
+                rows[col] = rows[col].astype(dtype)
+        return pd.concat([frame, rows], ignore_index=True)
+
+    def _derive(self, filepath, kind, columns, build):
+        source = self._source(filepath)
+        key = (str(filepath), kind, tuple(columns))
+        with self.lock:
+            entry = self.derived.get(key)
+            if entry is None or entry["hash"] != source["hash"]:
+                with shared_metrics.stage(f"dataset_{kind}"):
+                    entry = {"hash": source["hash"], "frame": build(source["frame"])}
+                self.derived[key] = entry
+            value = entry["frame"]
+            return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+
+    # Hash of the currently loaded version of a file
+    def version(self, filepath):
+        return self._source(filepath)["hash"]
+
+    # Typed frame of a file, optionally restricted to some columns
+    def frame(self, filepath, columns=None):
+        return self._source(filepath, columns)["frame"].copy(deep=False)
+
+    # Typed frame without rows containing missing values
+    def clean(self, filepath):
+        return self._derive(filepath, "clean", [], lambda df: df.dropna())
+
+    # IQR outlier filter fitted on the clean frame's columns, once per version of the file.
+    # group_by (e.g. "City" or ["City", "Pollutant"]) fits separate bounds for every group.
+    def outlier_filter(self, filepath, columns, group_by=None):
+        columns = list(columns)
+        group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        kind = "iqr_bounds" + "".join(f"_by_{column}" for column in group_by)
+        return self._derive(filepath, kind, columns, lambda df: outlier_filter(columns, group_by=group_by).fit(df.dropna()))
+
+    # Outlier bounds used by iqr_filtered for the given columns of a file, as (lower, upper)
+    def iqr_bounds(self, filepath, columns, group_by=None):
+        return self.outlier_filter(filepath, columns, group_by).bounds
+
+    # Clean frame with rows outside 1.5 * IQR on any of the given columns removed
+    def iqr_filtered(self, filepath, columns, group_by=None):
+        columns = list(columns)
+        outliers = self.outlier_filter(filepath, columns, group_by)
+        kind = "iqr" + "".join(f"_by_{column}" for column in outliers.group_by)
+        return self._derive(filepath, kind, columns, lambda df: outliers.filter(df.dropna()))
+
+    # iqr_filtered rows held by (City, Pollutant) partition (see partition_index), built once per version
+    # of the file and shared by every caller, so a city's rows are found without scanning the frame
+    def partitioned(self, filepath, columns):
+        columns = list(columns)
+        filtered = self.iqr_filtered(filepath, columns)
+        return self._derive(filepath, "partitioned", columns, lambda df: partition_index(filtered))
+
+# Shared store used by every model class in this process
+shared_dataset_store = dataset_store()
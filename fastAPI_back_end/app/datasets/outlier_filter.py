@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+import pandas as pd
+
+# IQR outlier filter: a row is an outlier when any of the filtered columns lies more than
+# k * IQR below the first or above the third quartile. Bounds are fitted once (the dataset store
+# caches fitted filters per dataset version) and masks are computed in per-thread buffers that are
+# reused between calls. With group_by, every group (e.g. City or (City, Pollutant)) gets its own
+# bounds; rows of groups the filter was not fitted on use the bounds of all rows.
+class outlier_filter:
+
+    def __init__(self, columns, k = 1.5, group_by = None):
+        self.columns = list(columns)
+        self.k = k
+        self.group_by = [group_by] if isinstance(group_by, str) else list(group_by or [])
+        self.lower = None # (groups + 1, columns) bounds; the last row holds the bounds of all rows
+        self.upper = None
+        self.groups = None # Group keys of the first rows of lower/upper
+        self.buffers = threading.local()
+
+    # Fits the bounds on a frame; quantiles are pandas' linear interpolation, as DataFrame.quantile computes them
+    def fit(self, df):
+        lower, upper = self.bounds_of(df[self.columns].quantile(0.25), df[self.columns].quantile(0.75))
+        if not self.group_by:
+            return self._set_bounds(None, None, lower, upper)
+        grouped = df.groupby(self.group_by, observed=True, sort=True)[self.columns]
+        group_lower, group_upper = self.bounds_of(grouped.quantile(0.25), grouped.quantile(0.75))
+        return self._set_bounds(group_lower, group_upper, lower, upper)
+
+    # Fits the bounds of all rows without holding them in memory: make_chunks() returns a fresh
+    # iterator of frames (e.g. a chunked read_csv) on every call, and the quartiles are found by
+    # exact selection (see exact_quantiles), so they equal the in-memory ones
+    def fit_chunks(self, make_chunks, max_in_memory = 100_000):
+        if self.group_by:
+            raise ValueError("Per-group bounds need the frame in memory; fit a filter per group instead")
+        quartiles = exact_quantiles(make_chunks, self.columns, [0.25, 0.75], max_in_memory)
+        lower, upper = self.bounds_of(quartiles.loc[0.25], quartiles.loc[0.75])
+        return self._set_bounds(None, None, lower, upper)
+
+    def bounds_of(self, q1, q3):
+        iqr = q3 - q1
+        return q1 - self.k * iqr, q3 + self.k * iqr
+
+    def _set_bounds(self, group_lower, group_upper, lower, upper):
+        self.groups = group_lower.index if self.group_by else None
+        self.lower = np.vstack([group_lower[self.columns].to_numpy(dtype=float), lower[self.columns].to_numpy(dtype=float)]) \
+            if self.group_by else lower[self.columns].to_numpy(dtype=float)[None, :]
+        self.upper = np.vstack([group_upper[self.columns].to_numpy(dtype=float), upper[self.columns].to_numpy(dtype=float)]) \
+            if self.group_by else upper[self.columns].to_numpy(dtype=float)[None, :]
+        return self
+
+    # Fitted bounds as (lower, upper): Series indexed by column, or, with group_by, frames indexed by group
+    @property
+    def bounds(self):
+        if not self.group_by:
+            return pd.Series(self.lower[0], index=self.columns), pd.Series(self.upper[0], index=self.columns)
+        return (pd.DataFrame(self.lower[:-1], index=self.groups, columns=self.columns),
+                pd.DataFrame(self.upper[:-1], index=self.groups, columns=self.columns))
+
+    # Filter with bounds from `bounds` (e.g. stored with a model); grouped bounds restore their groups
+    # from the frames' index, but have no bounds of all rows, so unknown groups are never outliers
+    @staticmethod
+    def from_bounds(bounds, k = 1.5):
+        lower, upper = bounds
+        if isinstance(lower, pd.Series):
+            return outlier_filter(lower.index, k)._set_bounds(None, None, lower, upper)
+        groups = [name for name in lower.index.names]
+        every = pd.Series(np.inf, index=lower.columns)
+        return outlier_filter(lower.columns, k, groups)._set_bounds(lower, upper, -every, every)
+
+    # Row index into lower/upper of every row: its group's bounds, or the last row for unknown groups
+    def bound_rows(self, df):
+        if len(self.group_by) == 1:
+            rows = self.groups.get_indexer(df[self.group_by[0]])
+        else:
+            rows = self.groups.get_indexer(pd.MultiIndex.from_frame(df[self.group_by]))
+        rows[rows < 0] = len(self.lower) - 1
+        return rows
+
+    # Buffers of at least n rows for this thread, grown when needed
+    def _buffers(self, n):
+        buffers = getattr(self.buffers, "arrays", None)
+        if buffers is None or len(buffers[0]) < n:
+            size = max(n, 2 * len(buffers[0])) if buffers is not None else n
+            buffers = (np.empty(size, dtype=bool), np.empty(size, dtype=bool), np.empty(size), np.empty(size))
+            self.buffers.arrays = buffers
+        return [buffer[:n] for buffer in buffers]
+
+    # Boolean mask of the rows to keep. It lives in a buffer reused by this thread's next call,
+    # so use it (or copy it) before filtering again. Missing values are never outliers.
+    def mask(self, df):
+        if self.lower is None:
+            raise ValueError("The outlier filter has no bounds; call fit() first")
+        outlier, scratch, lower, upper = self._buffers(len(df))
+        outlier[:] = False
+        rows = self.bound_rows(df) if self.group_by else None
+        for i, column in enumerate(self.columns):
+            values = df[column].to_numpy(dtype=float)
+            if rows is None:
+                lower, upper = self.lower[0, i], self.upper[0, i]
+            else:
+                np.take(self.lower[:, i], rows, out=lower)
+                np.take(self.upper[:, i], rows, out=upper)
+            np.less(values, lower, out=scratch)
+            outlier |= scratch
+            np.greater(values, upper, out=scratch)
+            outlier |= scratch
+        return np.logical_not(outlier, out=outlier)
+
+    # Rows of df inside the bounds
+    def filter(self, df):
+        return df[self.mask(df)]
+
+# Out-of-core quantiles
+
+SIGN_BIT = np.uint64(1 << 63)
+MAGNITUDE_BITS = np.int64(0x7FFFFFFFFFFFFFFF)
+
+# uint64 keys ordered like the float64 values: negative floats have their magnitude bits flipped, then
+# the sign bit is flipped so negatives sort first. Ranges of keys can be split exactly, which float
+# ranges near their precision cannot.
+def sortable_keys(values):
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.int64)
+    return (bits ^ ((bits >> 63) & MAGNITUDE_BITS)).view(np.uint64) ^ SIGN_BIT
+
+def key_value(key):
+    bits = (np.asarray([key], dtype=np.uint64) ^ SIGN_BIT).view(np.int64)
+    return float((bits ^ ((bits >> 63) & MAGNITUDE_BITS)).view(np.float64)[0])
+
+# Exact quantiles (linear interpolation, bit-for-bit as numpy and pandas compute them) of columns
+# that do not fit in memory, as a frame indexed by quantile like DataFrame.quantile returns.
+# make_chunks() returns a fresh iterator of frames on every call; NaNs are ignored.
+#
+# Every wanted rank is found by selection: a pass histograms the keys inside the range known to
+# hold the rank and narrows the range to the bin holding it, until that bin is a single value or
+# holds at most max_in_memory values, which the next pass collects and partitions. Each pass serves
+# every column and rank at once, so with 1024 bins any number of quantiles takes at most 9 passes.
+def exact_quantiles(make_chunks, columns, quantiles, max_in_memory = 100_000, bins = 1024):
+    columns = list(columns)
+    count = dict.fromkeys(columns, 0)
+    low, high = {}, {}
+    for chunk in make_chunks():
+        for column in columns:
+            keys = sortable_keys(valid_values(chunk, column))
+            if len(keys):
+                count[column] += len(keys)
+                low[column] = min(low.get(column, int(keys.min())), int(keys.min()))
+                high[column] = max(high.get(column, int(keys.max())), int(keys.max()))
+
+    # One selection per (column, rank): both ranks around every quantile's position
+    selections = {}
+    for column in columns:
+        for q in quantiles:
+            if count[column]:
+                position = q * (count[column] - 1)
+                for rank in {int(np.floor(position)), int(np.ceil(position))}:
+                    selections[(column, rank)] = {"low": low[column], "high": high[column], "value": None, "collect": False}
+
+    while True:
+        pending = [(column, rank, selection) for (column, rank), selection in selections.items() if selection["value"] is None]
+        if not pending:
+            break
+        for _, _, selection in pending:
+            selection.update(counts=np.zeros(bins, dtype=np.int64), smaller=0, candidates=[],
+                             width=(selection["high"] - selection["low"]) // bins + 1)
+        for chunk in make_chunks():
+            for column in {column for column, _, _ in pending}:
+                values = valid_values(chunk, column)
+                keys = sortable_keys(values)
+                for _, _, selection in (entry for entry in pending if entry[0] == column):
+                    lower, upper = np.uint64(selection["low"]), np.uint64(selection["high"])
+                    inside = (keys >= lower) & (keys <= upper)
+                    if selection["collect"]:
+                        selection["candidates"].append(values[inside])
+                    else:
+                        selection["smaller"] += np.count_nonzero(keys < lower)
+                        selection["counts"] += np.bincount(((keys[inside] - lower) // np.uint64(selection["width"])).astype(np.int64), minlength=bins)
+
+        for column, rank, selection in pending:
+            if selection["collect"]:
+                selection["value"] = float(np.partition(np.concatenate(selection["candidates"]), selection["offset"])[selection["offset"]])
+                continue
+            cumulative = selection["smaller"] + np.cumsum(selection["counts"])
+            b = int(np.searchsorted(cumulative, rank, side="right"))
+            width = selection["width"]
+            selection["offset"] = rank - int(cumulative[b] - selection["counts"][b]) # Rank within the bin
+            selection["low"], selection["high"] = selection["low"] + b * width, min(selection["low"] + (b + 1) * width - 1, selection["high"])
+            if selection["low"] == selection["high"]:
+                selection["value"] = key_value(selection["low"])
+            elif selection["counts"][b] <= max_in_memory:
+                selection["collect"] = True
+
+    result = {}
+    for column in columns:
+        result[column] = []
+        for q in quantiles:
+            if not count[column]:
+                result[column].append(float("nan"))
+                continue
+            position = q * (count[column] - 1)
+            value = selections[(column, int(np.floor(position)))]["value"]
+            following = selections[(column, int(np.ceil(position)))]["value"]
+            result[column].append(interpolate(value, following, position - np.floor(position)))
+    return pd.DataFrame(result, index=list(quantiles), dtype=float)
+
+def valid_values(chunk, column):
+    values = np.asarray(chunk[column], dtype=np.float64)
+    return values[~np.isnan(values)]
+
+# numpy's linear interpolation between neighbouring order statistics
+def interpolate(value, following, fraction):
+    if value == following or fraction == 0:
+        return value
+    if fraction >= 0.5:
+        return following - (following - value) * (1 - fraction)
+    return value + (following - value) * fraction
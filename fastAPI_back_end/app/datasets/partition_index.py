@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+# A frame held sorted by (City, Pollutant), with a small index of where each partition lies, so the
+# history of one city or one (city, pollutant) is a slice instead of a boolean mask over every row.
+# Rows keep their relative order within a partition, so a partition's rows come out exactly as the
+# mask df[(df["City"] == city) & (df["Pollutant"] == pollutant)] returned them. Rows with a missing
+# City or Pollutant are not indexed.
+class partition_index:
+
+    PARTITION_BY = ["City", "Pollutant"]
+
+    def __init__(self, df, date_column = "Date"):
+        groups = df.groupby(partition_index.PARTITION_BY, observed=True, sort=True).indices
+        keys = list(groups)
+        positions = [groups[key] for key in keys]
+        self.order = np.concatenate(positions) if positions else np.empty(0, dtype=np.int64) # Row of df of every frame row
+        self.frame = df.take(self.order)
+
+        sizes = np.asarray([len(rows) for rows in positions], dtype=np.int64)
+        stops = np.cumsum(sizes)
+        starts = stops - sizes
+        dates = None
+        if date_column in df.columns and pd.api.types.is_datetime64_any_dtype(df[date_column]):
+            dates = df[date_column].to_numpy()
+        # Row range [start, stop) in self.frame and first and last date of every partition (None unless the dates are parsed)
+        self.index = pd.DataFrame({
+            "start": starts,
+            "stop": stops,
+            "rows": sizes,
+            "first_date": [dates[rows].min() if dates is not None else None for rows in positions],
+            "last_date": [dates[rows].max() if dates is not None else None for rows in positions],
+        }, index=pd.MultiIndex.from_tuples(keys, names=partition_index.PARTITION_BY))
+        self.ranges = {key: (int(start), int(stop)) for key, start, stop in zip(keys, starts, stops)}
+
+        # A city's partitions are next to each other, so its rows are one range too
+        self.city_ranges = {}
+        for (city, _), (start, stop) in self.ranges.items():
+            first = self.city_ranges.get(city, (start, stop))[0]
+            self.city_ranges[city] = (first, stop)
+        # Cities in order of their first row in df, as df["City"].unique() lists them
+        self.city_order = sorted(self.city_ranges, key=lambda city: self.order[self.city_ranges[city][0]:self.city_ranges[city][1]].min())
+        self.file_orders = {} # City -> positions restoring the df order of its rows, built on first use
+
+    # Cities in order of first appearance; with a pollutant, only the cities that have rows of it
+    def cities(self, pollutant = None):
+        if pollutant is None:
+            return list(self.city_order)
+        return [city for city in self.city_order if (city, pollutant) in self.ranges]
+
+    # Partition keys whose date range overlaps [start, end]; either end may be left open
+    def keys(self, start = None, end = None):
+        overlapping = np.ones(len(self.index), dtype=bool)
+        if start is not None:
+            overlapping &= self.index["last_date"].to_numpy() >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            overlapping &= self.index["first_date"].to_numpy() <= np.datetime64(pd.Timestamp(end))
+        return list(self.index.index[overlapping])
+
+    # Rows of one (city, pollutant) partition, or of every partition of a city in the order of df.
+    # Unknown keys give no rows.
+    def rows(self, city, pollutant = None):
+        if pollutant is not None:
+            start, stop = self.ranges.get((city, pollutant), (0, 0))
+            return self.frame.iloc[start:stop]
+        start, stop = self.city_ranges.get(city, (0, 0))
+        rows = self.frame.iloc[start:stop]
+        if city not in self.file_orders:
+            order = self.order[start:stop]
+            self.file_orders[city] = None if (np.diff(order) > 0).all() else np.argsort(order, kind="stable")
+        return rows if self.file_orders[city] is None else rows.take(self.file_orders[city])
@@ -0,0 +1,132 @@
+import os
+import json
+import pickle
+import shutil
+import pandas as pd
+from pathlib import Path
+from app.datasets.columnar_cache import PARQUET_AVAILABLE
+from app.datasets.dataset_store import dataset_store
+
+MAIN_PATH = Path("app")
+
+# A csv (or parquet) dataset split on disk into one file per partition, by City and Pollutant unless
+# told otherwise, written from a chunked read so the whole file is never held in memory. Every
+# partition file holds its cleaned rows (parsed dates, no missing values, as dataset_store.clean
+# returns them) as pickled frames appended chunk by chunk, in file order. manifest.json is the index:
+# the source hash and, for every partition in key order, its file, its row range [start, stop) in the
+# layout read in key order, and its first and last date, as partition_index keeps them in memory.
+# It is written last, so a half-written layout is never used.
+class partitioned_dataset:
+
+    PARTITIONS_PATH = MAIN_PATH / "data" / "partitions"
+    PARTITION_BY = ["City", "Pollutant"]
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "manifest.json") as f:
+            self.manifest = json.load(f)
+        self.partition_by = self.manifest["partition_by"]
+        self.partitions = {tuple(entry["key"]): entry for entry in self.manifest["partitions"]}
+
+    # Splits filepath into partitions under path (default: app/data/partitions/<file name>), reading
+    # chunksize rows at a time. An existing layout built from the same file version is reused.
+    @staticmethod
+    def write(filepath, path = None, partition_by = PARTITION_BY, chunksize = 500_000, file_hash = None):
+        partition_by = [partition_by] if isinstance(partition_by, str) else list(partition_by)
+        path = Path(path) if path is not None else partitioned_dataset.PARTITIONS_PATH / Path(filepath).stem
+        file_hash = file_hash or dataset_store.hash_file(filepath)
+        if partitioned_dataset.is_fresh(path, file_hash, partition_by):
+            return partitioned_dataset(path)
+
+        print(f"Partitioning {filepath} by {', '.join(partition_by)} into {path}...")
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        partitions = {}
+        for chunk in read_chunks(filepath, chunksize):
+            if "Date" in chunk.columns:
+                chunk["Date"] = dataset_store.parse_dates(chunk["Date"])
+            chunk = chunk.dropna()
+            for key, rows in chunk.groupby(partition_by, sort=False):
+                entry = partitions.setdefault(key, {"key": list(key), "file": f"{len(partitions):05d}.pkl", "rows": 0,
+                                                    "first_date": None, "last_date": None})
+                with open(path / entry["file"], "ab") as f:
+                    pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entry["rows"] += len(rows)
+                if "Date" in rows.columns:
+                    first, last = rows["Date"].min().strftime("%Y-%m-%d"), rows["Date"].max().strftime("%Y-%m-%d")
+                    entry["first_date"] = min(entry["first_date"] or first, first) # ISO dates compare as strings
+                    entry["last_date"] = max(entry["last_date"] or last, last)
+
+        entries = sorted(partitions.values(), key=lambda entry: entry["key"])
+        start = 0
+        for entry in entries:
+            entry["start"], entry["stop"] = start, start + entry["rows"]
+            start = entry["stop"]
+        manifest = {"source": str(filepath), "source_hash": file_hash, "partition_by": partition_by, "partitions": entries}
+        with open(path / "manifest.json.tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path / "manifest.json.tmp", path / "manifest.json")
+        return partitioned_dataset(path)
+
+    # Returns True if the layout under path was built from the file version with this hash
+    @staticmethod
+    def is_fresh(path, file_hash, partition_by):
+        manifest_path = Path(path) / "manifest.json"
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return manifest.get("source_hash") == file_hash and manifest.get("partition_by") == partition_by
+
+    # The manifest's partitions as a frame indexed by key, with the columns of partition_index.index
+    @property
+    def index(self):
+        entries = self.manifest["partitions"]
+        return pd.DataFrame({
+            "start": [entry["start"] for entry in entries],
+            "stop": [entry["stop"] for entry in entries],
+            "rows": [entry["rows"] for entry in entries],
+            "first_date": pd.to_datetime([entry["first_date"] for entry in entries]),
+            "last_date": pd.to_datetime([entry["last_date"] for entry in entries]),
+        }, index=pd.MultiIndex.from_tuples([tuple(entry["key"]) for entry in entries], names=self.partition_by))
+
+    # Partition keys as tuples in sorted order: those under a key prefix (e.g. a city), and with start
+    # or end, only those whose date range overlaps [start, end]
+    def keys(self, *prefix, start = None, end = None):
+        start = pd.Timestamp(start).strftime("%Y-%m-%d") if start is not None else None
+        end = pd.Timestamp(end).strftime("%Y-%m-%d") if end is not None else None
+        return [key for key, entry in self.partitions.items() if key[:len(prefix)] == prefix
+                and (start is None or entry["last_date"] is None or entry["last_date"] >= start)
+                and (end is None or entry["first_date"] is None or entry["first_date"] <= end)]
+
+    # Rows of the partitions under a key prefix, e.g. rows("Sydney") or rows("Sydney", "pm10")
+    def rows(self, *prefix):
+        return sum(self.partitions[key]["rows"] for key in self.keys(*prefix))
+
+    # Frames of the partitions under a key prefix (every partition when none is given), partition by
+    # partition in key order and in file order within each. Only those partitions' files are read, and
+    # each call returns a fresh iterator, as outlier_filter.fit_chunks expects.
+    def chunks(self, *prefix):
+        for key in self.keys(*prefix):
+            with open(self.path / self.partitions[key]["file"], "rb") as f:
+                while True:
+                    try:
+                        yield pickle.load(f)
+                    except EOFError:
+                        break
+
+    # Every partition under a key prefix as a single frame, None when there are none
+    def frame(self, *prefix):
+        frames = list(self.chunks(*prefix))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+# Frames of at most chunksize rows of a csv, or of the record batches of a parquet file
+def read_chunks(filepath, chunksize):
+    if Path(filepath).suffix == ".parquet":
+        if not PARQUET_AVAILABLE:
+            raise ImportError(f"Reading {filepath} needs pyarrow; install it or convert the file to csv")
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(filepath).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(filepath, chunksize=chunksize)
@@ -0,0 +1,95 @@
+import os
+import asyncio
+import functools
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Raised when the inference queue is full; the API turns it into a 429
+class executor_saturated_error(Exception):
+    pass
+
+# Raised when a job is already running in the training pool
+class executor_busy_error(Exception):
+    pass
+
+class prediction_executor:
+
+    def __init__(self,
+                 inference_workers = int(os.environ.get("INFERENCE_WORKERS", os.cpu_count() or 1)),
+                 queue_depth = int(os.environ.get("INFERENCE_QUEUE_DEPTH", 64)),
+                 timeout = float(os.environ.get("INFERENCE_TIMEOUT", 30)),
+                 training_workers = int(os.environ.get("TRAINING_WORKERS", 1))):
+        self.inference_workers = inference_workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.training_workers = training_workers
+
+        # Cheap inference runs on threads; sklearn and numpy release the GIL for the heavy parts
+        self.inference_pool = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="inference")
+        # Retraining is CPU-bound pure Python as well, so it gets its own processes (created on first use)
+        self.training_pool = None
+
+        self.max_pending = inference_workers + queue_depth
+        self.pending = 0 # Jobs submitted to the inference pool that have not finished yet
+        self.training_running = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    # Runs fn(*args) on the inference thread pool without blocking the event loop
+    async def run_inference(self, fn, *args, **kwargs):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise executor_saturated_error(f"{self.pending} inference jobs pending (limit {self.max_pending})")
+
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        # The job runs in a copy of the request's context, so its stage timings reach the request
+        future = self.inference_pool.submit(contextvars.copy_context().run, functools.partial(fn, *args, **kwargs))
+        # The slot is only released once the worker is really done, even if the caller timed out
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release_inference))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            future.cancel() # Only succeeds if the job is still queued
+            raise
+
+    def _release_inference(self):
+        self.pending -= 1
+
+    # Starts fn(*args) in the training process pool and returns an awaitable future;
+    # fn and its arguments must be picklable
+    def submit_training(self, fn, *args):
+        if self.training_running >= self.training_workers:
+            raise executor_busy_error("A training job is already running.")
+
+        if self.training_pool is None:
+            # Spawn rather than fork, since the parent already runs threads
+            self.training_pool = ProcessPoolExecutor(max_workers=self.training_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+
+        loop = asyncio.get_running_loop()
+        self.training_running += 1
+        future = loop.run_in_executor(self.training_pool, functools.partial(fn, *args))
+        future.add_done_callback(lambda _: self._release_training())
+        return future
+
+    def _release_training(self):
+        self.training_running -= 1
+
+    def status(self):
+        return {
+            "inference_workers": self.inference_workers,
+            "inference_pending": self.pending,
+            "inference_capacity": self.max_pending,
+            "inference_rejected": self.rejected,
+            "inference_timed_out": self.timed_out,
+            "training_running": self.training_running > 0,
+        }
+
+    def shutdown(self):
+        self.inference_pool.shutdown(wait=False, cancel_futures=True)
+        if self.training_pool is not None:
+            self.training_pool.shutdown(wait=False, cancel_futures=True)
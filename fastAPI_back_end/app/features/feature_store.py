@@ -0,0 +1,111 @@
+import os
+import numpy as np
+import pandas as pd
+from app.aqi_calculation.aqi_conversion import POLLUTANTS
+from app.datasets.dataset_store import dataset_store
+
+# Model features of (date, pollutant) rows without per-call datetime parsing or get_dummies:
+# a calendar table holds the date features of every day in a fixed range, looked up by ISO date
+# string or by day number, and pollutants map to a fixed one-hot encoding. Used for both training
+# and inference, so the two always build the same columns.
+class feature_store:
+
+    DATE_FEATURES = ["dayofyear", "year", "month", "weekday"]
+    POLLUTANT_PREFIX = "pollutant_"
+    SCALAR_ROWS = 64 # Inputs up to this size are looked up in dicts; building a pandas Index costs more
+
+    def __init__(self, start = "2000-01-01", end = "2050-12-31", pollutants = POLLUTANTS):
+        self.start = np.datetime64(start, "D")
+        days = np.arange(self.start, np.datetime64(end, "D") + 1)
+        self.calendar = feature_store.date_features(days) # One row per day, DATE_FEATURES columns
+        self.iso_dates = pd.Index(np.datetime_as_string(days)) # "YYYY-MM-DD" -> calendar row
+        self.iso_rows = {date: row for row, date in enumerate(self.iso_dates)}
+        self.pollutants = list(pollutants)
+        self.pollutant_index = pd.Index(self.pollutants)
+        self.pollutant_codes = {name: code for code, name in enumerate(self.pollutants)}
+        # Features of the fixed encoding, in the order get_dummies used to produce them
+        self.feature_names = feature_store.DATE_FEATURES + [feature_store.POLLUTANT_PREFIX + name for name in sorted(self.pollutants)]
+        self.layouts = {} # Feature list -> where its columns come from, see layout()
+
+    # DATE_FEATURES of datetime64[D] days, as the pandas .dt accessors compute them; NaT gives NaN
+    @staticmethod
+    def date_features(days):
+        years = days.astype("datetime64[Y]")
+        features = np.column_stack([
+            (days - years).astype(np.int64) + 1, # dayofyear
+            years.astype(np.int64) + 1970, # year
+            (days.astype("datetime64[M]") - years).astype(np.int64) + 1, # month
+            (days.astype(np.int64) + 3) % 7, # weekday: 1970-01-01 was a Thursday
+        ]).astype(float)
+        features[np.isnat(days)] = np.nan
+        return features
+
+    # Calendar row of every date, and the datetime64[D] days when some fall outside the calendar.
+    # ISO date strings are found by lookup; other formats (e.g. day-first) are parsed.
+    def calendar_rows(self, dates):
+        if not isinstance(dates, (pd.Series, pd.Index)):
+            dates = np.asarray(dates)
+        if not pd.api.types.is_datetime64_dtype(dates):
+            rows = feature_store.lookup(dates, self.iso_rows, self.iso_dates)
+            if (rows >= 0).all():
+                return rows, None
+            dates = dataset_store.parse_dates(pd.Series(np.asarray(dates, dtype=object)))
+        days = np.asarray(dates, dtype="datetime64[D]")
+        rows = (days - self.start).astype(np.int64)
+        outside = (rows < 0) | (rows >= len(self.calendar))
+        return rows, days if outside.any() else None
+
+    # Position of every value in index (given as a dict too), -1 for values not in it. Small inputs
+    # use the dict, as building a pandas Index costs more; larger ones look up each distinct value once.
+    @staticmethod
+    def lookup(values, positions, index):
+        if len(values) <= feature_store.SCALAR_ROWS:
+            return np.asarray([positions.get(value, -1) for value in list(values)], dtype=np.int64)
+        codes, uniques = pd.factorize(values)
+        return np.where(codes >= 0, index.get_indexer(uniques)[codes], -1)
+
+    # Index of every pollutant in the encoding, -1 for unknown pollutants
+    def codes(self, pollutants):
+        if not isinstance(pollutants, (pd.Series, pd.Index)):
+            pollutants = np.asarray(pollutants, dtype=object)
+        return feature_store.lookup(pollutants, self.pollutant_codes, self.pollutant_index)
+
+    # Tables of a feature list, built once: a (DATE_FEATURES, features) 0/1 selector, the calendar in
+    # the list's columns, and the pollutant encoding in the list's columns (last row all zeros).
+    # Names that are neither date nor known pollutant features stay zero, as the old zero-filled dummies did.
+    def layout(self, features):
+        key = tuple(features)
+        if key not in self.layouts:
+            selector = np.zeros((len(feature_store.DATE_FEATURES), len(features)))
+            encoding = np.zeros((len(self.pollutants) + 1, len(features)))
+            for position, name in enumerate(features):
+                pollutant = name[len(feature_store.POLLUTANT_PREFIX):] if name.startswith(feature_store.POLLUTANT_PREFIX) else None
+                if name in feature_store.DATE_FEATURES:
+                    selector[feature_store.DATE_FEATURES.index(name), position] = 1.0
+                elif pollutant in self.pollutants:
+                    encoding[self.pollutants.index(pollutant), position] = 1.0
+            self.layouts[key] = (selector, self.calendar @ selector, encoding)
+        return self.layouts[key]
+
+    # (rows, features) float matrix of dates and pollutants, with columns in the given feature order:
+    # one row gather from the calendar and one from the pollutant encoding
+    def feature_matrix(self, dates, pollutants, features):
+        rows, days = self.calendar_rows(dates)
+        selector, calendar, encoding = self.layout(features)
+        if days is None:
+            X = calendar[rows]
+        else:
+            X = feature_store.date_features(days) @ selector # Days outside the calendar are computed directly
+        X += encoding[self.codes(pollutants)]
+        return X
+
+    # FEATURE_CALENDAR_START and FEATURE_CALENDAR_END set the range of days held in the calendar
+    @staticmethod
+    def from_environment():
+        return feature_store(
+            start=os.environ.get("FEATURE_CALENDAR_START", "2000-01-01"),
+            end=os.environ.get("FEATURE_CALENDAR_END", "2050-12-31"),
+        )
+
+# Shared feature store used by the models in this process
+shared_feature_store = feature_store.from_environment()
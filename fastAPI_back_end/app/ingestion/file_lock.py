@@ -0,0 +1,39 @@
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError: # Windows: only threads of the same process are serialized
+    fcntl = None
+
+# Exclusive lock shared by the threads of a process and, through flock on a lock file, by every
+# process on the machine (e.g. the workers of app.serve). Used as a context manager.
+class file_lock:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.file = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.file = open(self.path, "a")
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        except BaseException:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        finally:
+            self.file = None
+            self.lock.release()
@@ -0,0 +1,142 @@
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from app.datasets.dataset_store import dataset_store, shared_dataset_store
+from app.aqi_calculation.aqi_conversion import calculate_aqi_array
+from app.ingestion.file_lock import file_lock
+
+MAIN_PATH = Path("app")
+
+# Appends new daily observations to the datasets without recomputing them from scratch:
+# AQI is calculated for the new rows only, the per-(Date, City) highest AQI table is updated for
+# the affected keys only, and the loaded models are updated in place where they can be
+class observation_ingestor:
+
+    DATA_PATH = dataset_store.AIR_QUALITY_PATH
+    AQI_PATH = dataset_store.POLLUTANT_AQI_PATH
+    FINAL_AQI_PATH = MAIN_PATH / "data" / "australia_air_quality_final_aqi.csv"
+    COLUMNS = ["Date", "Country", "City", "Pollutant", "count", "min", "max", "median", "variance"]
+    NUMERIC_COLUMNS = ["count", "min", "max", "median", "variance"]
+
+    # registry (optional) is the loaded model_registry whose models are updated with the new rows
+    def __init__(self, registry = None, data_path = DATA_PATH, aqi_path = AQI_PATH, final_aqi_path = FINAL_AQI_PATH):
+        self.registry = registry
+        self.data_path = Path(data_path)
+        self.aqi_path = Path(aqi_path)
+        self.final_aqi_path = Path(final_aqi_path)
+        # One batch at a time across threads and processes, as every batch appends to the same files and
+        # dedupes against them; the lock file sits next to the data
+        self.lock = file_lock(self.data_path.with_name(self.data_path.name + ".lock"))
+
+    # Parses ISO dates (2025-10-09) and day-first dates (9/10/2025), which may be mixed within a batch
+    @staticmethod
+    def parse_dates(dates):
+        dates = dates.astype(str)
+        iso = dates.str.match(r"^\d{4}-")
+        parsed = pd.Series(pd.NaT, index=dates.index, dtype="datetime64[ns]")
+        if iso.any():
+            parsed[iso] = pd.to_datetime(dates[iso], format="ISO8601")
+        if (~iso).any():
+            parsed[~iso] = pd.to_datetime(dates[~iso], dayfirst=True)
+        return parsed.dt.normalize()
+
+    # Validates a batch in the australia_air_quality.csv format and drops rows whose
+    # (Date, City, Pollutant) is already in the dataset or repeated within the batch
+    def prepare(self, observations):
+        missing = [col for col in observation_ingestor.COLUMNS if col not in observations.columns]
+        if missing:
+            raise ValueError(f"Missing columns: {missing}")
+
+        batch = observations[observation_ingestor.COLUMNS].copy()
+        batch["Date"] = observation_ingestor.parse_dates(batch["Date"])
+        for col in ["Country", "City", "Pollutant"]:
+            batch[col] = batch[col].astype(str)
+        for col in observation_ingestor.NUMERIC_COLUMNS:
+            batch[col] = pd.to_numeric(batch[col])
+
+        batch = batch.drop_duplicates(subset=["Date", "City", "Pollutant"])
+        existing = shared_dataset_store.frame(self.data_path, columns=["Date", "City", "Pollutant"])
+        existing_keys = pd.MultiIndex.from_arrays([existing["Date"].astype("datetime64[ns]"),
+                                                   existing["City"].astype(str), existing["Pollutant"].astype(str)])
+        batch_keys = pd.MultiIndex.from_arrays([batch["Date"].astype("datetime64[ns]"), batch["City"], batch["Pollutant"]])
+        return batch[~batch_keys.isin(existing_keys)].reset_index(drop=True)
+
+    def ingest(self, observations):
+        with self.lock:
+            # Batches other processes applied are loaded first, while the data files still match them
+            if self.registry is not None:
+                self.registry.reload_updates()
+            batch = self.prepare(observations)
+            summary = {"received": len(observations), "ingested": len(batch), "duplicates": len(observations) - len(batch)}
+            if batch.empty:
+                return summary
+
+            previous_mtimes = {path: os.stat(path).st_mtime_ns for path in [self.data_path, self.aqi_path]}
+            self.append_observations(batch)
+            aqi_rows = self.append_pollutant_aqi(batch)
+            # Loaded copies are extended with the new rows rather than re-read and re-hashed
+            shared_dataset_store.append(self.data_path, batch, previous_mtimes[self.data_path])
+            shared_dataset_store.append(self.aqi_path, aqi_rows, previous_mtimes[self.aqi_path])
+            summary["updated_days"] = self.update_final_aqi(aqi_rows)
+            if self.registry is not None:
+                summary.update(self.registry.apply_observations(batch))
+                summary["model_version"] = self.registry.version
+            return summary
+
+    # Appends the raw rows, keeping the file's day-first date format
+    def append_observations(self, batch):
+        rows = batch.copy()
+        rows["Date"] = [f"{date.day}/{date.month}/{date.year}" for date in rows["Date"]]
+        rows.to_csv(self.data_path, mode="a", header=False, index=False)
+
+    # Calculates AQI for the new rows only and appends them to the pollutant AQI dataset
+    def append_pollutant_aqi(self, batch):
+        rows = batch.copy()
+        aqi = calculate_aqi_array(rows["median"], rows["Pollutant"])
+        rows["AQI"] = aqi
+        rows["Rounded AQI"] = pd.Series(np.round(aqi), index=rows.index).astype("Int64")
+        rows["Date"] = rows["Date"].dt.strftime("%Y-%m-%d")
+        rows.to_csv(self.aqi_path, mode="a", header=False, index=False)
+        return rows
+
+    # Updates the highest AQI of every (Date, City) that received rows. Existing rows only ever gain
+    # new pollutants, so a new row only replaces the current highest when it is strictly greater,
+    # which keeps the first-occurrence tie-break of final_aqi_determinator. Only those keys change:
+    # new (Date, City) keys are appended, and existing rows are changed where they are, so a batch
+    # that only adds new days is a plain append.
+    # Returns the number of (Date, City) keys that were added or changed.
+    def update_final_aqi(self, aqi_rows):
+        valid = aqi_rows.dropna(subset=["AQI"])
+        if valid.empty:
+            return 0
+        candidates = (
+            valid.loc[valid.groupby(["Date", "City"], sort=False)["AQI"].idxmax()]
+            [["Date", "City", "AQI", "Rounded AQI"]]
+            .rename(columns={"AQI": "Highest AQI"})
+            .sort_values(["Date", "City"], kind="stable")
+            .reset_index(drop=True)
+        )
+
+        final = pd.read_csv(self.final_aqi_path, dtype={"Date": str, "City": str})
+        positions = pd.MultiIndex.from_frame(final[["Date", "City"]]).get_indexer(
+            pd.MultiIndex.from_frame(candidates[["Date", "City"]]))
+        new = candidates[positions < 0]
+        existing = positions >= 0
+        current = final["Highest AQI"].to_numpy()[positions[existing]]
+        greater = candidates["Highest AQI"].to_numpy()[existing] > current
+        changed = candidates[existing][greater]
+        changed_positions = positions[existing][greater]
+
+        if len(changed):
+            final["Rounded AQI"] = final["Rounded AQI"].astype("Int64")
+            final.loc[changed_positions, "Highest AQI"] = changed["Highest AQI"].to_numpy()
+            final.loc[changed_positions, "Rounded AQI"] = changed["Rounded AQI"].to_numpy()
+            final = pd.concat([final, new], ignore_index=True)
+            temp_path = self.final_aqi_path.with_suffix(f".csv.{os.getpid()}.tmp")
+            final.to_csv(temp_path, index=False)
+            os.replace(temp_path, self.final_aqi_path)
+        elif len(new):
+            new.to_csv(self.final_aqi_path, mode="a", header=False, index=False)
+        return len(new) + len(changed)
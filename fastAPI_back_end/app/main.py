@@ -1,8 +1,16 @@
 import os
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+import time
+import itertools
+import pandas as pd
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from pathlib import Path
+from typing import List, Optional
 
 # Set the MAIN_PATH environment variable for the combined_model to use
 # The model will save its CSV output to 'app/data/combined_model'
@@ -10,16 +18,140 @@ os.environ['MAIN_PATH'] = str(Path("./models").parent)
 
 # Import the core model logic
 from .models.combined_model.combined_model import combined_model
+from .models.model_registry.model_registry import model_registry, train_registry
+from .executors.prediction_executor import prediction_executor, executor_saturated_error, executor_busy_error
+from .caching.result_cache import result_cache
+from .audit.prediction_audit_sink import prediction_audit_sink
+from .ingestion.observation_ingestor import observation_ingestor
+from .metrics.service_metrics import shared_metrics
+from .datasets.dataset_store import dataset_store
+
+# Rejects dates the models cannot parse (422), keeping the string as given, as it is part of the cache key
+def check_date(value):
+    try:
+        dataset_store.parse_dates(pd.Series([value]))
+    except (ValueError, OverflowError) as e:
+        raise ValueError(f"Invalid date '{value}': {e}")
+    return value
 
 class PredictionRequest(BaseModel):
     date: str     # e.g., "2025-10-14"
     city: str     # e.g., "Sydney"
     pollutant: str  # e.g., "pm2.5"
 
+    @field_validator("date")
+    @classmethod
+    def validate_date(cls, value):
+        return check_date(value)
+
+# Either an explicit list of items, or a cartesian grid of dates x cities x pollutants
+class BatchPredictionRequest(BaseModel):
+    items: Optional[List[PredictionRequest]] = None
+    dates: Optional[List[str]] = None       # e.g., ["2025-10-14", "2025-10-15"]
+    cities: Optional[List[str]] = None      # e.g., ["Sydney", "Perth"]
+    pollutants: Optional[List[str]] = None  # e.g., ["pm2.5", "o3"]
+
+    @field_validator("dates")
+    @classmethod
+    def validate_dates(cls, values):
+        return [check_date(value) for value in values] if values is not None else values
+
+# A series of consecutive days for one city, starting at start_date
+class ForecastRequest(BaseModel):
+    start_date: str          # e.g., "2025-11-21"
+    horizon: int = 7         # number of days, including start_date
+    city: str                # e.g., "Sydney"
+    pollutants: List[str]    # e.g., ["pm2.5", "o3"]
+    stream: Optional[bool] = None  # NDJSON streaming; by default only for horizons above FORECAST_STREAM_THRESHOLD
+
+    @field_validator("start_date")
+    @classmethod
+    def validate_start_date(cls, value):
+        return check_date(value)
+
+# One daily observation in the australia_air_quality.csv format
+class Observation(BaseModel):
+    Date: str      # e.g., "2025-10-09" or "9/10/2025"
+    Country: str = "AU"
+    City: str      # e.g., "Sydney"
+    Pollutant: str # e.g., "pm2.5"
+    count: int
+    min: float
+    max: float
+    median: float
+    variance: float
+
+class IngestionRequest(BaseModel):
+    observations: List[Observation]
+
+# Training options of /models/retrain, as app/train.py takes them; those left out are the ones
+# the served version was trained with
+class RetrainRequest(BaseModel):
+    workers: Optional[int] = None       # training processes
+    streaming: Optional[bool] = None    # out-of-core training from per-city partitions
+    chunksize: Optional[int] = None     # rows read at a time when partitioning
+    forest_rows: Optional[int] = None   # most rows sampled for each forest when streaming
+    n_estimators: Optional[int] = None  # trees per forest
+    max_depth: Optional[int] = None     # maximum depth of each tree, null for unlimited
+    n_jobs: Optional[int] = None        # cores used to fit each forest (-1 for all)
+
+    @field_validator("workers", "chunksize", "forest_rows", "n_estimators", "max_depth")
+    @classmethod
+    def validate_positive(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("must be at least 1")
+        return value
+
+    @field_validator("n_jobs")
+    @classmethod
+    def validate_n_jobs(cls, value):
+        if value is not None and value != -1 and value < 1:
+            raise ValueError("must be -1 or at least 1")
+        return value
+
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+MAX_FORECAST_HORIZON = int(os.environ.get("MAX_FORECAST_HORIZON", 3660))
+FORECAST_STREAM_THRESHOLD = int(os.environ.get("FORECAST_STREAM_THRESHOLD", 31))
+FORECAST_CHUNK_DAYS = int(os.environ.get("FORECAST_CHUNK_DAYS", 31))
+
+# Thread pool for inference and process pool for retraining, configured through
+# INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH, INFERENCE_TIMEOUT and TRAINING_WORKERS
+global_executor = prediction_executor()
+
+# Cache of prediction results keyed by (model version, date, city, pollutant), configured through
+# RESULT_CACHE_BACKEND, RESULT_CACHE_SIZE, RESULT_CACHE_TTL and RESULT_CACHE_REDIS_URL
+global_result_cache = result_cache.from_environment()
+
+PREDICTION_FIELDS = ['count', 'variance', 'min', 'max', 'median', 'AQI', 'Rounded_AQI', 'AQI_Severity']
+
+# False for the all-null records of rows no model knows (an unknown city or pollutant)
+def has_prediction(record):
+    return any(record.get(field) is not None for field in PREDICTION_FIELDS)
+
+# Only records with a prediction are cached. Nothing is cached once the models were reloaded during
+# the request, as the record may come from the new ones.
+def cache_result(version, date, city, pollutant, record):
+    if global_result_cache is None or global_combined_model.registry.version != version:
+        return
+    if has_prediction(record):
+        global_result_cache.set(version, date, city, pollutant, record)
+
+# Background audit trail of computed predictions, configured through AUDIT_SINK, AUDIT_PATH,
+# AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL and AUDIT_MAX_BYTES
+global_audit_sink = prediction_audit_sink.from_environment()
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    global_executor.shutdown()
+    if global_audit_sink is not None:
+        global_audit_sink.close()
+
 app = FastAPI(
     title="Air Quality Prediction Service",
     description="A service for combining predictions from various AQI models.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 origins = ["http://localhost:3000"] 
@@ -32,15 +164,73 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+# Request counters and latency histograms, with stage timings in a Server-Timing header when
+# SERVER_TIMING is set. Only registered when metrics are enabled (METRICS, on by default).
+# Streaming responses are timed up to their first byte.
+async def record_request_metrics(request: Request, call_next):
+    token = shared_metrics.begin_request()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        seconds = time.perf_counter() - start
+        timings = shared_metrics.end_request(token)
+        route = request.scope.get("route")
+        shared_metrics.observe_request(request.method, route.path if route is not None else "unmatched", status, seconds)
+    if shared_metrics.server_timing:
+        response.headers["Server-Timing"] = shared_metrics.server_timing_header(timings, seconds)
+    return response
+
+if shared_metrics.enabled:
+    app.middleware("http")(record_request_metrics)
+
 try:
     print("Initializing global combined model...")
-    global_combined_model = combined_model()
+    global_combined_model = combined_model(audit_sink=global_audit_sink)
     print("Combined model initialized successfully.")
 except Exception as e:
     # If the model fails to load, raise an alert but allow the app to technically start
     print(f"CRITICAL ERROR: Failed to initialize combined_model: {e}")
     global_combined_model = None
-    
+
+global_ingestor = observation_ingestor(global_combined_model.registry if global_combined_model else None)
+
+# Serializes model reloads within a worker
+models_reload_lock = asyncio.Lock()
+
+# Every worker of app.serve holds its own copy of the models. Before serving, a worker checks the
+# registry on disk and reloads when another worker retrained (LATEST moved) or ingested observations
+# (the Linear Regression updates file changed), so all workers serve the same version.
+async def refresh_models():
+    if global_combined_model is None or not global_combined_model.registry.changed():
+        return
+    registry = global_combined_model.registry
+    async with models_reload_lock:
+        if not registry.changed(): # Reloaded by another request while this one waited
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, registry.refresh)
+        except Exception as e:
+            print(f"Reloading the models failed, still serving registry version {registry.version}: {e}")
+
+# Runs blocking model code off the event loop, translating back-pressure into HTTP errors
+async def run_inference(fn, *args):
+    try:
+        return await global_executor.run_inference(fn, *args)
+    except executor_saturated_error as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Prediction service is saturated: {e}",
+            headers={"Retry-After": "1"}
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Prediction timed out after {global_executor.timeout} seconds."
+        )
+
 @app.get("/")
 def read_root():
     """Provides a basic welcome message and API status."""
@@ -49,7 +239,8 @@ def read_root():
         "version": app.version,
         "documentation_url": "/docs",
         "status": "Running",
-        "model_loaded": global_combined_model is not None
+        "model_loaded": global_combined_model is not None,
+        "model_version": global_combined_model.registry.version if global_combined_model else None
     }
 
 @app.post("/predict")
@@ -61,23 +252,41 @@ async def get_prediction(request: PredictionRequest):
             detail="Model service is unavailable due to a startup error."
         )
 
+    await refresh_models()
+    version = global_combined_model.registry.version
+    if global_result_cache is not None:
+        with shared_metrics.stage("cache_lookup"):
+            cached = global_result_cache.get(version, request.date, request.city, request.pollutant)
+        if cached is not None:
+            return {
+                "message": "Prediction served from cache.",
+                "data": cached
+            }
+
     try:
         # Call the compute method on the globally initialized model instance
         # The modified combined_model.py now returns the result as a list of dicts.
-        prediction_result = global_combined_model.compute(
+        prediction_result = await run_inference(
+            global_combined_model.compute,
             request.date, 
             request.city, 
             request.pollutant
         )
         
-        if prediction_result:
+        if prediction_result and has_prediction(prediction_result[0]):
+            cache_result(version, request.date, request.city, request.pollutant, prediction_result[0])
             return {
-                "message": "Prediction computed successfully and CSV saved.",
+                "message": "Prediction computed successfully.",
                 "data": prediction_result[0] 
             }
         else:
-            raise HTTPException(status_code=404, detail="No prediction data generated.")
+            raise HTTPException(
+                status_code=404,
+                detail=f"No prediction data generated for {request.city} ({request.pollutant})."
+            )
 
+    except HTTPException:
+        raise
     except Exception as e:
         # Catch any runtime errors from the compute logic
         print(f"Runtime computation error: {e}")
@@ -86,6 +295,250 @@ async def get_prediction(request: PredictionRequest):
             detail=f"Prediction computation failed due to internal error: {e}"
         )
 
+@app.post("/predict/batch")
+async def get_batch_prediction(request: BatchPredictionRequest):
+
+    if global_combined_model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model service is unavailable due to a startup error."
+        )
+
+    if request.items is not None:
+        rows = [(item.date, item.city, item.pollutant) for item in request.items]
+    elif request.dates and request.cities and request.pollutants:
+        rows = list(itertools.product(request.dates, request.cities, request.pollutants))
+    else:
+        raise HTTPException(
+            status_code=422,
+            detail="Provide either 'items' or all of 'dates', 'cities' and 'pollutants'."
+        )
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="No prediction data generated.")
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(rows)} rows exceeds the limit of {MAX_BATCH_SIZE}."
+        )
+
+    # Only rows missing from the result cache are sent to the models
+    await refresh_models()
+    version = global_combined_model.registry.version
+    prediction_result = [None] * len(rows)
+    if global_result_cache is not None:
+        for i, row in enumerate(rows):
+            prediction_result[i] = global_result_cache.get(version, *row)
+    missing = [i for i, record in enumerate(prediction_result) if record is None]
+
+    try:
+        if missing:
+            # Results come back in the same order as the requested rows
+            computed = await run_inference(
+                global_combined_model.compute_batch,
+                pd.DataFrame([rows[i] for i in missing], columns=['Date', 'City', 'Pollutant'])
+            )
+            for i, record in zip(missing, computed):
+                prediction_result[i] = record
+                cache_result(version, *rows[i], record)
+
+        # Rows no model knows are listed under "unknown" rather than returned as all-null records
+        data = [record for record in prediction_result if has_prediction(record)]
+        unknown = [{"Date": date, "City": city, "Pollutant": pollutant}
+                   for (date, city, pollutant), record in zip(rows, prediction_result) if not has_prediction(record)]
+        if not data:
+            raise HTTPException(status_code=404, detail="No prediction data generated.")
+        return {
+            "message": "Batch prediction computed successfully.",
+            "count": len(data),
+            "data": data,
+            "unknown": unknown
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Runtime computation error: {e}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Prediction computation failed due to internal error: {e}"
+        )
+
+@app.post("/forecast")
+async def get_forecast(request: ForecastRequest):
+
+    if global_combined_model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model service is unavailable due to a startup error."
+        )
+
+    if not 1 <= request.horizon <= MAX_FORECAST_HORIZON:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Horizon must be between 1 and {MAX_FORECAST_HORIZON} days."
+        )
+    if not request.pollutants:
+        raise HTTPException(status_code=422, detail="Provide at least one pollutant.")
+    await refresh_models()
+    rows = combined_model.forecast_rows(request.start_date, request.horizon, request.city, request.pollutants)
+
+    stream = request.stream if request.stream is not None else request.horizon > FORECAST_STREAM_THRESHOLD
+    if stream:
+        return StreamingResponse(stream_forecast(rows, len(request.pollutants)), media_type="application/x-ndjson")
+
+    try:
+        # The whole horizon is stacked into one frame, so each model runs once over all days
+        prediction_result = await run_inference(global_combined_model.compute_batch, rows)
+        return {
+            "message": "Forecast computed successfully.",
+            "city": request.city,
+            "start_date": rows['Date'].iloc[0],
+            "horizon": request.horizon,
+            "count": len(prediction_result),
+            "data": prediction_result
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Runtime computation error: {e}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Forecast computation failed due to internal error: {e}"
+        )
+
+# Computes a forecast FORECAST_CHUNK_DAYS days at a time and writes one JSON record per line,
+# so the first days reach the client while later ones are still being predicted.
+# Errors after the response has started are sent as a final {"error": ...} line.
+async def stream_forecast(rows, rows_per_day):
+    chunk_size = FORECAST_CHUNK_DAYS * rows_per_day
+    for start in range(0, len(rows), chunk_size):
+        try:
+            records = await run_inference(global_combined_model.compute_batch, rows.iloc[start:start + chunk_size])
+        except HTTPException as e:
+            yield json.dumps({"error": e.detail}) + "\n"
+            return
+        except Exception as e:
+            print(f"Runtime computation error: {e}")
+            yield json.dumps({"error": f"Forecast computation failed due to internal error: {e}"}) + "\n"
+            return
+        yield "".join(json.dumps(record) + "\n" for record in records)
+
+@app.post("/ingest")
+async def ingest_observations(request: IngestionRequest):
+
+    if not request.observations:
+        raise HTTPException(status_code=422, detail="Provide at least one observation.")
+    if len(request.observations) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(request.observations)} observations exceeds the limit of {MAX_BATCH_SIZE}."
+        )
+
+    await refresh_models()
+    observations = pd.DataFrame([observation.model_dump() for observation in request.observations])
+    try:
+        # File appends and model updates run off the event loop; batches are applied one at a time, and
+        # never while this worker reloads its models
+        async with models_reload_lock:
+            summary = await asyncio.get_running_loop().run_in_executor(None, global_ingestor.ingest, observations)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid observations: {e}")
+    except Exception as e:
+        print(f"Ingestion error: {e}")
+        raise HTTPException(status_code=500, detail=f"Ingestion failed due to internal error: {e}")
+
+    return {
+        "message": "Observations ingested successfully.",
+        **summary
+    }
+
+# Retrains every model in a separate process, then swaps the new registry version in
+async def retrain_and_reload(training):
+    try:
+        version = await training
+        registry = global_combined_model.registry
+        async with models_reload_lock:
+            await asyncio.get_running_loop().run_in_executor(None, registry.load, version)
+        print(f"Retraining finished, now serving registry version {version}")
+    except Exception as e:
+        print(f"Retraining failed: {e}")
+
+retraining_tasks = set()
+
+@app.post("/models/retrain", status_code=202)
+async def retrain_models(request: Optional[RetrainRequest] = None):
+
+    if global_combined_model is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Model service is unavailable due to a startup error."
+        )
+
+    await refresh_models()
+    registry = global_combined_model.registry
+    options = model_registry.training_options(registry.manifest)
+    requested = request.model_dump(exclude_unset=True) if request is not None else {}
+    for name, option in [("workers", "workers"), ("streaming", "streaming"), ("chunksize", "chunksize"), ("forest_rows", "max_forest_rows")]:
+        if requested.get(name) is not None:
+            options[option] = requested[name]
+    for name, option in [("n_estimators", "rf_n_estimators"), ("max_depth", "rf_max_depth"), ("n_jobs", "rf_training_jobs")]:
+        if requested.get(name) is not None or (name == "max_depth" and name in requested):
+            options["rf_options"][option] = requested[name]
+
+    try:
+        training = global_executor.submit_training(train_registry, registry.registry_path, registry.data_path, registry.dt_data_path,
+                                                   options["workers"], options["streaming"], options["chunksize"],
+                                                   options["max_forest_rows"], options["rf_options"])
+    except executor_busy_error as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Keep a reference so the task is not garbage collected while it runs
+    task = asyncio.create_task(retrain_and_reload(training))
+    retraining_tasks.add(task)
+    task.add_done_callback(retraining_tasks.discard)
+
+    return {
+        "message": "Retraining started.",
+        "model_version": registry.version,
+        "training_options": options
+    }
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "model_loaded": global_combined_model is not None}
\ No newline at end of file
+    health = {"status": "ok", "model_loaded": global_combined_model is not None}
+    if global_combined_model is not None:
+        health["ready"] = global_combined_model.ready
+        health["startup_seconds"] = global_combined_model.startup_seconds
+        health.update(global_combined_model.registry.status())
+    health["executor"] = global_executor.status()
+    health["result_cache"] = global_result_cache.stats() if global_result_cache is not None else None
+    health["audit"] = global_audit_sink.status() if global_audit_sink is not None else None
+    return health
+
+@app.get("/metrics")
+def metrics():
+    """Request, latency and per-stage timing metrics in the Prometheus text format."""
+    if not shared_metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS=0).")
+
+    executor = global_executor.status()
+    gauges = {
+        "aqi_model_loaded": int(global_combined_model is not None),
+        "aqi_inference_pending": executor["inference_pending"],
+    }
+    counters = {
+        "aqi_inference_rejected_total": executor["inference_rejected"],
+        "aqi_inference_timed_out_total": executor["inference_timed_out"],
+    }
+    if global_combined_model is not None:
+        gauges["aqi_model_info"] = {(("version", global_combined_model.registry.version),): 1}
+    if global_result_cache is not None:
+        cache = global_result_cache.stats()
+        gauges["aqi_result_cache_entries"] = cache.get("entries", 0)
+        counters["aqi_result_cache_hits_total"] = cache["hits"]
+        counters["aqi_result_cache_misses_total"] = cache["misses"]
+    if global_audit_sink is not None:
+        counters["aqi_audit_dropped_total"] = global_audit_sink.status()["dropped"]
+    return PlainTextResponse(shared_metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,175 @@
+import os
+import time
+import bisect
+import functools
+import threading
+import contextvars
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond model stages to slow batch requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the request being served, collected for its Server-Timing header.
+# The list is shared with every thread the request's context is copied to.
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+class histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot counts values above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+# Times one stage into service_metrics.observe_stage
+class stage_timer:
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+# Shared by every stage() call while metrics are disabled, so a disabled timer costs one method call
+class noop_timer:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NOOP_TIMER = noop_timer()
+
+# Request counters, request latency histograms and per-stage timers of the service, rendered in the
+# Prometheus text format. Stages are timed with `with shared_metrics.stage("name"):` around each step.
+class service_metrics:
+
+    def __init__(self, enabled = True, server_timing = False, buckets = LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.stages = {} # stage -> histogram
+        self.requests = {} # (method, path, status) -> count
+        self.request_latency = {} # (method, path) -> histogram
+
+    def stage(self, name):
+        return stage_timer(self, name) if self.enabled else NOOP_TIMER
+
+    # Decorator form of stage() for whole methods; when metrics are disabled fn is returned unchanged
+    def timed(self, name):
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with stage_timer(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe_stage(self, name, seconds):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = histogram(self.buckets)
+            self.stages[name].observe(seconds)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    # path is the route template (/predict), never the raw URL, so the label set stays bounded
+    def observe_request(self, method, path, status, seconds):
+        with self.lock:
+            key = (method, path, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if (method, path) not in self.request_latency:
+                self.request_latency[(method, path)] = histogram(self.buckets)
+            self.request_latency[(method, path)].observe(seconds)
+
+    # Starts collecting the stage timings of the current request; returns the token for end_request
+    def begin_request(self):
+        return request_timings.set([])
+
+    def end_request(self, token):
+        timings = request_timings.get()
+        request_timings.reset(token)
+        return timings or []
+
+    # Server-Timing header value: every stage of the request summed by name, then the total, in ms
+    @staticmethod
+    def server_timing_header(timings, total_seconds):
+        totals = {}
+        for name, seconds in timings:
+            totals[name] = totals.get(name, 0.0) + seconds
+        entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in totals.items()]
+        entries.append(f"total;dur={total_seconds * 1000:.3f}")
+        return ", ".join(entries)
+
+    # Prometheus text exposition. gauges and counters map extra metric names, read by the caller at
+    # scrape time, to a single value or to {labels tuple: value}.
+    def render(self, gauges = None, counters = None):
+        lines = []
+        with self.lock:
+            lines += ["# HELP aqi_http_requests_total Requests served, by route and status.",
+                      "# TYPE aqi_http_requests_total counter"]
+            for (method, path, status), count in sorted(self.requests.items()):
+                lines.append(f'aqi_http_requests_total{{method="{method}",path="{path}",status="{status}"}} {count}')
+
+            lines += ["# HELP aqi_http_request_duration_seconds Request latency, by route.",
+                      "# TYPE aqi_http_request_duration_seconds histogram"]
+            for (method, path), hist in sorted(self.request_latency.items()):
+                lines += self._histogram_lines("aqi_http_request_duration_seconds", f'method="{method}",path="{path}"', hist)
+
+            lines += ["# HELP aqi_stage_duration_seconds Time spent in each prediction and model stage.",
+                      "# TYPE aqi_stage_duration_seconds histogram"]
+            for name, hist in sorted(self.stages.items()):
+                lines += self._histogram_lines("aqi_stage_duration_seconds", f'stage="{name}"', hist)
+
+        for metric_type, samples in [("gauge", gauges or {}), ("counter", counters or {})]:
+            for name, value in samples.items():
+                lines.append(f"# TYPE {name} {metric_type}")
+                if isinstance(value, dict):
+                    for labels, sample in value.items():
+                        label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                        lines.append(f"{name}{{{label_text}}} {sample}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name, labels, hist):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, hist.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+        lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+        lines.append(f"{name}_count{{{labels}}} {hist.count}")
+        return lines
+
+    # METRICS=0 turns every timer and counter into a no-op; SERVER_TIMING=1 adds the Server-Timing header
+    @staticmethod
+    def from_environment():
+        return service_metrics(
+            enabled=os.environ.get("METRICS", "1").lower() not in ("0", "false", "off"),
+            server_timing=os.environ.get("SERVER_TIMING", "0").lower() in ("1", "true", "on"),
+        )
+
+# Shared metrics of this process, used by main.py and the model classes
+shared_metrics = service_metrics.from_environment()
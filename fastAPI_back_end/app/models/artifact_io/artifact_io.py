@@ -0,0 +1,23 @@
+import os
+import joblib
+from pathlib import Path
+
+# Standalone helpers for reading and writing model artifacts
+
+# Writes an artifact to a temporary file next to its destination, then renames it into place,
+# so readers only ever see a complete file. Artifacts are stored uncompressed so that their
+# numpy arrays can be memory-mapped on load.
+def dump_artifact(artifact, path):
+    path = Path(path)
+    os.makedirs(path.parent, exist_ok=True)
+    temp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    try:
+        joblib.dump(artifact, temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+# Loads an artifact, memory-mapping its numpy arrays read-only when mmap is True
+def load_artifact(path, mmap=True):
+    return joblib.load(path, mmap_mode="r" if mmap else None)
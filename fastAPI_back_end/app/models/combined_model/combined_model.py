@@ -1,26 +1,49 @@
-import os
+import time
+import numpy as np
 import pandas as pd
 from pathlib import Path
 
 # Import models
-from app.models.linear_regression.linear_regression_pollutant_predictor import linear_regression_pollutant_predictor
+from app.models.model_registry.model_registry import model_registry
 from app.models.random_forest.random_forest_pollutant_median import random_forest_pollutant_median
-from app.models.decision_tree.decision_tree_aqi_severity import decision_tree_aqi_severity
-from app.aqi_calculation.pollutant_aqi_calculator import calculate_aqi, CONCENTRATION_BREAKPOINTS
+from app.aqi_calculation.aqi_conversion import calculate_aqi_array
+from app.metrics.service_metrics import shared_metrics
+from app.datasets.dataset_store import dataset_store
 
 MAIN_PATH = Path("app")
 
 class combined_model:
 
-    def __init__(self):
-        # Initialize model instances for Linear Regression and Random Forest models
-        self.lr_model = None
-        self.rf_model = None
-        self.dt = decision_tree_aqi_severity()
-        self.dt.prepare_data()
-        self.dt.tune_depth()
-        self.dt.train_tree()
-        self.dt_model = self.dt
+    # audit_sink (optional) receives every computed prediction, see app/audit/prediction_audit_sink.py
+    def __init__(self, registry=None, audit_sink=None):
+        start = time.perf_counter()
+        self.ready = False
+        self.audit_sink = None # Set after warm-up so the dummy prediction is not audited
+
+        # Load the pre-trained models once; compute() only runs inference
+        self.registry = registry if registry is not None else model_registry()
+        self.registry.load_or_train()
+
+        self.warm_up()
+        self.audit_sink = audit_sink
+        self.ready = True
+        self.startup_seconds = time.perf_counter() - start
+        print(f"Combined model ready in {self.startup_seconds:.2f}s")
+
+    # The decision tree is tuned and fitted offline, so startup only deserializes it. It is read from
+    # the registry on every use, so a reloaded version replaces it too.
+    @property
+    def dt(self):
+        return self.registry.decision_tree
+
+    @property
+    def dt_model(self):
+        return self.registry.decision_tree
+
+    # Runs one dummy prediction through every model so the first request does not pay for lazy initialisation
+    def warm_up(self):
+        city, pollutant = next(iter(self.registry.rf_models))
+        self.predict_frame(pd.DataFrame({'Date': ['2025-01-01'], 'City': [city], 'Pollutant': [pollutant]}))
 
     def compute(self, date, city, pollutant):
         # Load original input
@@ -34,63 +57,89 @@ class combined_model:
         except Exception as e:
             print(f"Error processing data: {e}")
             return None
-        # Train and predict using Linear Regression
-        self.lr_model = linear_regression_pollutant_predictor()
-        self.lr_model.compute()
-        self.lr_model.process_city(city)
-        lr_predictions = self.lr_model.predict(city, df)
-
-        # Append Linear Regression predictions to original data
-        for col in ['count', 'variance', 'min', 'max']:
-            if col in lr_predictions.columns:
-                df[col] = lr_predictions[col]
-
-        # Train and predict using Random Forest
-        self.rf_model = random_forest_pollutant_median(pollutant)
-        self.rf_model.compute()
-        self.rf_model.process_city(city)
-        rf_predictions = self.rf_model.predict(city, df)
-
-        # Append Random Forest median prediction to data
-        if 'median' in rf_predictions.columns:
-            df['median'] = rf_predictions['median']
-
-        #Calculate Rounded AQI
-        if 'median' in df.columns and pollutant in CONCENTRATION_BREAKPOINTS:
-            # Since the input 'df' only has one row, we can access the value directly
-            median_concentration = df['median'].iloc[0]
-            
-            # Calculate the raw AQI using the imported static method
-            aqi = calculate_aqi(median_concentration, pollutant)
-            
-            # Append AQI and Rounded AQI to the DataFrame
-            df['AQI'] = aqi
-            df['Rounded_AQI'] = round(aqi)
-        else:
-            # Set to None if prediction failed or pollutant is invalid
-            df['AQI'] = None
-            df['Rounded_AQI'] = None
-
-        # Prepare pivot for AQI severity
-        pivot = df.pivot_table(index=['Date', 'City'], columns='Pollutant', values='median', aggfunc='mean').reset_index()
-        for p in self.dt_model.pollutants:
-            if p not in pivot.columns:
-                pivot[p] = 0
-        input_data = pivot[self.dt_model.pollutants]
-        pivot['AQI_Severity'] = self.dt_model.clf.predict(input_data)
-
-        # Merge severity back
-        severity_map = pivot.set_index(['Date', 'City'])['AQI_Severity']
-        df['AQI_Severity'] = df.set_index(['Date', 'City']).index.map(severity_map)
-
-        # Final output
-        filepath = MAIN_PATH / "data/combined_model/"
-        dynamic_file_name = f"{city}_step3_dt_final_combined.csv"
-        filename = filepath / dynamic_file_name
-
-        os.makedirs(filepath, exist_ok=True)
-        df.to_csv(filename, index=False)
-        print(f"Final combined predictions saved to {filename}")
-
-        return df.to_dict('records')
 
+        df = self.predict_frame(df)
+        return self.audit(combined_model.to_records(df))
+
+    # Predicts many (Date, City, Pollutant) rows at once and returns them in request order
+    def compute_batch(self, dataframe):
+        df = self.predict_frame(dataframe[['Date', 'City', 'Pollutant']])
+        return self.audit(combined_model.to_records(df))
+
+    # Rows for every day of a forecast horizon and every pollutant, ordered by date then pollutant.
+    # start_date is read like the dates of /predict: ISO, otherwise day-first (03/04/2025 is 3 April).
+    @staticmethod
+    def forecast_rows(start_date, horizon, city, pollutants):
+        start = dataset_store.parse_dates(pd.Series([start_date])).iloc[0]
+        dates = pd.date_range(start, periods=horizon, freq='D').strftime('%Y-%m-%d')
+        return pd.DataFrame(
+            [(date, city, pollutant) for date in dates for pollutant in pollutants],
+            columns=['Date', 'City', 'Pollutant']
+        )
+
+    # Hands the records to the audit sink, which writes them in the background
+    def audit(self, records):
+        if self.audit_sink is not None:
+            with shared_metrics.stage("audit"):
+                self.audit_sink.submit(records, self.registry.version)
+        return records
+
+    # Runs every model once per group of rows instead of once per row:
+    # Linear Regression per city, Random Forest per (city, pollutant) and the decision tree once overall
+    def predict_frame(self, dataframe):
+        df = dataframe.reset_index(drop=True).copy()
+        for col in ['count', 'variance', 'min', 'max', 'median']:
+            df[col] = np.nan
+
+        for city, city_index in df.groupby('City', sort=False).groups.items():
+            city_rows = df.loc[city_index, ['Date', 'City', 'Pollutant']]
+            city_rows = city_rows[city_rows['Pollutant'].isin(self.registry.POLLUTANTS)]
+            if city_rows.empty:
+                continue
+
+            # Predict using the registry's Linear Regression pipelines
+            with shared_metrics.stage("linear_regression"):
+                lr_predictions = self.registry.predict_linear_regression(city, city_rows)
+
+            # Append Linear Regression predictions to original data
+            for col in ['count', 'variance', 'min', 'max']:
+                if col in lr_predictions.columns:
+                    df.loc[lr_predictions.index, col] = lr_predictions[col]
+
+            # Predict using the registry's Random Forest for each pollutant of this city
+            for pollutant, pollutant_index in city_rows.groupby('Pollutant', sort=False).groups.items():
+                rf_input = df.loc[pollutant_index].dropna(subset=random_forest_pollutant_median.FEATURES)
+                if rf_input.empty:
+                    continue
+                with shared_metrics.stage("random_forest"):
+                    rf_predictions = self.registry.predict_random_forest(city, pollutant, rf_input)
+
+                # Append Random Forest median prediction to data
+                if 'median' in rf_predictions.columns:
+                    df.loc[rf_predictions.index, 'median'] = rf_predictions['median']
+
+        # Calculate AQI and Rounded AQI where a median was predicted for a known pollutant; the rest stay None
+        with shared_metrics.stage("aqi"):
+            aqi_values = calculate_aqi_array(df['median'], df['Pollutant'])
+            df['AQI'] = aqi_values
+            df['Rounded_AQI'] = pd.Series([round(aqi) if aqi == aqi else None for aqi in aqi_values.tolist()], index=df.index, dtype=object)
+
+        # Classify AQI severity: each row only carries the median of its own pollutant, the others stay 0
+        df['AQI_Severity'] = None
+        predicted = np.flatnonzero(df['median'].notna().to_numpy())
+        if len(predicted):
+            tree = self.dt_model.compiled
+            columns = pd.Index(tree.feature_names).get_indexer(df['Pollutant'].iloc[predicted])
+            known = columns >= 0
+            input_data = np.zeros((len(predicted), len(tree.feature_names)))
+            input_data[np.flatnonzero(known), columns[known]] = df['median'].to_numpy()[predicted[known]]
+            with shared_metrics.stage("decision_tree"):
+                severity = tree.predict(input_data)
+            df.loc[df.index[predicted], 'AQI_Severity'] = severity
+
+        return df
+
+    # Converts the prediction frame to JSON-safe records, replacing NaN with None
+    @staticmethod
+    def to_records(df):
+        return df.astype(object).where(df.notna(), None).to_dict('records')
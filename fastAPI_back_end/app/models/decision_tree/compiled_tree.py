@@ -0,0 +1,103 @@
+import numpy as np
+
+# A fitted DecisionTreeClassifier flattened into one array per node field:
+# split feature, threshold, left and right child (-1 for leaves) and the class a leaf predicts.
+# Predictions match sklearn's exactly: like sklearn, inputs are compared as float32 against the
+# float64 thresholds, and a missing value follows the node's missing_go_to_left.
+class compiled_tree:
+
+    SCALAR_BATCH = 32 # Batches up to this size skip the numpy setup, which costs more than the walk
+
+    def __init__(self, feature, threshold, left, right, missing_left, leaf_class, classes, feature_names):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.leaf_class = leaf_class # Index into classes, only meaningful on leaves
+        self.classes = classes
+        self.feature_names = list(feature_names)
+        self.node_classes = classes[leaf_class] # Class of every node, for a single gather per batch
+
+        # x <= threshold for a float32 x holds exactly when x <= the largest float32 not above the
+        # threshold, so batches compare in float32 without widening every value to float64
+        threshold32 = threshold.astype(np.float32)
+        above = threshold32.astype(np.float64) > threshold
+        threshold32[above] = np.nextafter(threshold32[above], np.float32(-np.inf))
+        self.threshold32 = threshold32
+
+        # Plain lists for the scalar path, where indexing numpy arrays would cost more than the walk
+        self.node_feature = feature.tolist()
+        self.node_threshold = threshold.tolist()
+        self.node_left = left.tolist()
+        self.node_right = right.tolist()
+        self.node_missing_left = missing_left.tolist()
+        self.node_class = self.node_classes.tolist()
+
+    # Flattens a fitted classifier; feature_names are its input columns, in training order
+    @staticmethod
+    def from_classifier(clf, feature_names):
+        tree = clf.tree_
+        if tree.n_outputs != 1:
+            raise ValueError("Only single-output decision trees can be compiled")
+        missing_left = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8))
+        return compiled_tree(
+            feature=np.asarray(tree.feature, dtype=np.int64),
+            threshold=np.asarray(tree.threshold, dtype=np.float64),
+            left=np.asarray(tree.children_left, dtype=np.int64),
+            right=np.asarray(tree.children_right, dtype=np.int64),
+            missing_left=np.asarray(missing_left, dtype=bool),
+            leaf_class=np.argmax(tree.value[:, 0, :], axis=1),
+            classes=np.asarray(clf.classes_),
+            feature_names=feature_names,
+        )
+
+    # Classifies one row given as {feature name: value}; absent features count as 0
+    def predict_one(self, values):
+        return self.node_class[self.leaf_of([float(np.float32(values.get(name, 0.0))) for name in self.feature_names])]
+
+    # Leaf reached by a row given as a list of float32-rounded values in feature_names order
+    def leaf_of(self, row):
+        node = 0
+        left = self.node_left
+        while left[node] != -1:
+            x = row[self.node_feature[node]]
+            if x != x: # NaN
+                node = left[node] if self.node_missing_left[node] else self.node_right[node]
+            elif x <= self.node_threshold[node]:
+                node = left[node]
+            else:
+                node = self.node_right[node]
+        return node
+
+    # Classifies a (rows, features) array with columns in feature_names order.
+    # Small batches walk row by row; larger ones are partitioned down the tree, so every level
+    # costs one comparison per row on a contiguous feature column.
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) <= compiled_tree.SCALAR_BATCH:
+            leaves = [self.leaf_of(row) for row in X.astype(np.float64).tolist()]
+            return self.node_classes[leaves] if leaves else self.classes[:0]
+        return self.node_classes[self.leaves(X)]
+
+    # Leaf index of every row of a float32 array
+    def leaves(self, X):
+        has_missing = bool(np.isnan(X).any())
+        leaves = np.empty(len(X), dtype=np.int32)
+        pending = [(0, None)] # None stands for every row, so the root reads a column without a gather
+        while pending:
+            node, rows = pending.pop()
+            if self.left[node] == -1:
+                leaves[slice(None) if rows is None else rows] = node
+                continue
+            x = X[:, self.feature[node]] if rows is None else X[rows, self.feature[node]]
+            go_left = x <= self.threshold32[node]
+            if has_missing:
+                go_left[np.isnan(x)] = self.missing_left[node]
+            if rows is None:
+                pending.append((self.left[node], np.flatnonzero(go_left)))
+                pending.append((self.right[node], np.flatnonzero(~go_left)))
+            else:
+                pending.append((self.left[node], rows[go_left]))
+                pending.append((self.right[node], rows[~go_left]))
+        return leaves
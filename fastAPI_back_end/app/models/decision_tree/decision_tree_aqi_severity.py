@@ -1,11 +1,14 @@
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
 from sklearn.tree import DecisionTreeClassifier, plot_tree, export_text
 from sklearn.model_selection import train_test_split
 from sklearn.model_selection import GridSearchCV
 from sklearn.model_selection import StratifiedShuffleSplit
 from app.evaluation.evaluator import evaluator
+from app.aqi_calculation.aqi_conversion import classify_severity, classify_severity_array
+from app.models.decision_tree.compiled_tree import compiled_tree
+from app.datasets.dataset_store import shared_dataset_store
+from app.metrics.service_metrics import shared_metrics
 from pathlib import Path
 
 MAIN_PATH = Path("app")
@@ -14,41 +17,35 @@ class decision_tree_aqi_severity:
     
     DATA_PATH = MAIN_PATH / "data" / "australia_air_quality_pollutant_aqi.csv"
 
-    def __init__(self, filepath = DATA_PATH):
+    # load_data=False skips reading the dataset, for instances that only serve a pre-trained classifier
+    def __init__(self, filepath = DATA_PATH, load_data = True):
         self.filepath = filepath
         self.pollutants = ['co', 'no2', 'o3', 'pm10', 'pm2.5', 'so2']
-        self.df = pd.read_csv(self.filepath)
+        self.df = shared_dataset_store.frame(self.filepath, columns=['Date', 'City', 'Pollutant', 'median', 'AQI']) if load_data else None
         self.dataset = None
         self.clf = None # Decision tree classifier
+        self.compiled = None # clf flattened for serving, see compile()
         self.grid = None # Grid search object
+        self.best_depth = None # Depth chosen by tune_depth()
         self.results = [] # Store evaluation results
 
     # Maps AQI values to severity categories
     # https://soe.dcceew.gov.au/air-quality/about-chapter/approach
     def classify_severity(self, aqi):
-        if aqi <= 32:
-            return "1 (Very Good)"
-        elif aqi <= 65:
-            return "2 (Good)"
-        elif aqi <= 98:
-            return "3 (Fair)"
-        elif aqi <= 148:
-            return "4 (Poor)"
-        elif aqi <= 199:
-            return "5 (Very Poor)"
-        else:
-            return "6 (Extremely Poor)"
+        return classify_severity(aqi)
 
+    @shared_metrics.timed("decision_tree_pivot")
     def prepare_data(self):
         # Pivot pollutant medians to wide format: one row per index (Date and City) with pollutant columns
-        pivot_medians = self.df.pivot_table(index=['Date', 'City'], columns='Pollutant', values='median', aggfunc='mean')
+        pivot_medians = self.df.pivot_table(index=['Date', 'City'], columns='Pollutant', values='median', aggfunc='mean', observed=True)
         # Get max AQI per  group
-        max_aqi = self.df.groupby(['Date', 'City'])['AQI'].max().rename('Max_AQI')
+        max_aqi = self.df.groupby(['Date', 'City'], observed=True)['AQI'].max().rename('Max_AQI')
         # Merge pollutant data with AQI values
         self.dataset = pivot_medians.merge(max_aqi, left_index=True, right_index=True).reset_index()
         # Add severity classification
-        self.dataset['Severity'] = self.dataset['Max_AQI'].apply(self.classify_severity)
+        self.dataset['Severity'] = classify_severity_array(self.dataset['Max_AQI'])
 
+    @shared_metrics.timed("decision_tree_fit")
     def train_tree(self, max_depth=4):
         # Prepare features(X) and target(Y)
         X = self.dataset[self.pollutants]
@@ -63,6 +60,7 @@ class decision_tree_aqi_severity:
         # Train decision tree with balanced class weights
         self.clf = DecisionTreeClassifier(max_depth=max_depth, class_weight='balanced', random_state=42)
         self.clf.fit(X_train, y_train)
+        self.compile()
         y_pred = self.clf.predict(X_test)
 
         # Evaluate predictions using evaluator class
@@ -79,6 +77,11 @@ class decision_tree_aqi_severity:
             "Classification Report": classification,
         })
 
+    # Flattens the fitted classifier into the compiled_tree that serves predictions
+    def compile(self):
+        self.compiled = compiled_tree.from_classifier(self.clf, self.pollutants)
+        return self.compiled
+
     # Prints decision tree rules in text format
     def show_rules(self):
         if self.clf:
@@ -94,6 +97,7 @@ class decision_tree_aqi_severity:
         print(self.dataset['Severity'].value_counts())
 
     # Performs grid searching to find the optimal tree depth
+    @shared_metrics.timed("decision_tree_tuning")
     def tune_depth(self, min_depth=2, max_depth=14):
         X = self.dataset[self.pollutants]
         y = self.dataset['Severity']
@@ -101,10 +105,12 @@ class decision_tree_aqi_severity:
         self.grid = GridSearchCV(DecisionTreeClassifier(random_state=42), param_grid, cv=5)
         self.grid.fit(X, y)
         self.clf = self.grid.best_estimator_
+        self.best_depth = self.grid.best_params_['max_depth']
         print(f"\nBest depth from grid search: {self.grid.best_params_['max_depth']}")
 
     # Plots the trained decision tree
     def plot(self):
+        import matplotlib.pyplot as plt # Imported here to keep it off the service startup path
         if self.clf is None:
             print("Train the model first using train_tree() or tune_depth().")
             return
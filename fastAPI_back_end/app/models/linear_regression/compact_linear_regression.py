@@ -0,0 +1,70 @@
+import numpy as np
+
+# The StandardScaler -> PolynomialFeatures -> LinearRegression pipelines of one city, one per target,
+# combined into a single operator: the shared scaler as one shift and one multiply, the polynomial
+# expansion as one gather-multiply over fixed column pairs, and every target's coefficients stacked
+# into one matrix. All targets of any number of rows come out of one matmul, and agree with the
+# pipelines' predict to float rounding.
+class compact_linear_regression:
+
+    def __init__(self, mean, inverse_scale, first, second, coef, intercept, targets):
+        self.mean = mean
+        self.inverse_scale = inverse_scale
+        # Polynomial column k is scaled[:, first[k]] * scaled[:, second[k]], where the extra index
+        # n_features points at a column of ones (for the bias and the linear terms)
+        self.first = first
+        self.second = second
+        self.coef = coef # (polynomial columns, targets)
+        self.intercept = intercept
+        self.targets = list(targets)
+
+    # Combines fitted pipelines given as {target: pipeline}. Returns None when they cannot share one
+    # expansion, i.e. their scalers or polynomial expansions differ.
+    @staticmethod
+    def from_pipelines(pipelines):
+        targets = list(pipelines)
+        scaler, poly, _ = pipelines[targets[0]]
+        for pipeline in pipelines.values():
+            other_scaler, other_poly, _ = pipeline
+            if not (np.array_equal(other_scaler.mean_, scaler.mean_) and np.array_equal(other_scaler.scale_, scaler.scale_)
+                    and np.array_equal(other_poly.powers_, poly.powers_)):
+                return None
+        if poly.powers_.sum(axis=1).max() > 2:
+            return None
+
+        n_features = poly.powers_.shape[1]
+        first, second = [], []
+        for powers in poly.powers_:
+            factors = [i for i in range(n_features) for _ in range(powers[i])] + [n_features, n_features]
+            first.append(factors[0])
+            second.append(factors[1])
+
+        return compact_linear_regression(
+            mean=np.asarray(scaler.mean_, dtype=float),
+            inverse_scale=1.0 / np.asarray(scaler.scale_, dtype=float),
+            first=np.asarray(first),
+            second=np.asarray(second),
+            coef=np.column_stack([np.asarray(pipelines[target][-1].coef_, dtype=float) for target in targets]),
+            intercept=np.asarray([float(pipelines[target][-1].intercept_) for target in targets]),
+            targets=targets,
+        )
+
+    BLOCK_ROWS = 4096 # Rows expanded at a time, so the polynomial columns of a block stay in cache
+
+    # (rows, targets) predictions for a (rows, features) array in the pipelines' feature order
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        if len(X) <= compact_linear_regression.BLOCK_ROWS:
+            return self.predict_block(X)
+        predictions = np.empty((len(X), len(self.targets)))
+        for start in range(0, len(X), compact_linear_regression.BLOCK_ROWS):
+            block = slice(start, start + compact_linear_regression.BLOCK_ROWS)
+            predictions[block] = self.predict_block(X[block])
+        return predictions
+
+    def predict_block(self, X):
+        scaled = np.empty((len(X), len(self.mean) + 1))
+        np.subtract(X, self.mean, out=scaled[:, :-1])
+        scaled[:, :-1] *= self.inverse_scale
+        scaled[:, -1] = 1.0
+        return (scaled[:, self.first] * scaled[:, self.second]) @ self.coef + self.intercept
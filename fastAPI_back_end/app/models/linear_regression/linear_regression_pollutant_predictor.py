@@ -1,14 +1,20 @@
 import os
+import copy
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler, PolynomialFeatures
 from sklearn.pipeline import make_pipeline
-import joblib
 from tqdm import tqdm
 from app.evaluation.evaluator import evaluator
+from app.datasets.dataset_store import shared_dataset_store
+from app.datasets.outlier_filter import outlier_filter
+from app.datasets.partition_index import partition_index
+from app.features.feature_store import shared_feature_store
+from app.metrics.service_metrics import shared_metrics
+from app.models.artifact_io.artifact_io import dump_artifact, load_artifact
+from app.models.linear_regression.compact_linear_regression import compact_linear_regression
 from pathlib import Path
 
 MAIN_PATH = Path("app")
@@ -16,39 +22,43 @@ MAIN_PATH = Path("app")
 class linear_regression_pollutant_predictor:
 
     DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+    SELECTED_POLLUTANTS = ["co", "no2", "o3", "so2", "pm2.5", "pm10"]
+    TARGETS = ["count", "variance", "min", "max"]
 
-    def __init__(self, filepath = DATA_PATH):
+    # load_data=False skips loading the dataset, for serving pipelines brought in with import_models()
+    def __init__(self, filepath = DATA_PATH, load_data = True):
         self.filepath = filepath
-        self.df = pd.read_csv(self.filepath)
-        self.df.dropna(inplace=True)
-        self.targets = ["count", "variance", "min", "max"]
-        self.models = {}
+        self.targets = list(linear_regression_pollutant_predictor.TARGETS)
+        self.models = {} # Fitted pipelines keyed by "{city}_{target}"
+        self.compact = {} # Every target's pipelines of a city combined into one operator, used by predict()
+        self.statistics = {} # Sufficient statistics of each pipeline's training rows, for incremental updates
+        self.bounds = None # (lower, upper) outlier bounds of the targets used when the models were trained
+        self.outliers = None # (bounds, outlier_filter of them), rebuilt when self.bounds is replaced
         self.results = []
-        self.selected_pollutants = ["co", "no2", "o3", "so2", "pm2.5", "pm10"]
-
-        # Convert date to datetime and extract features
-        self.df["Date"] = pd.to_datetime(self.df["Date"])
-        self.df["dayofyear"] = self.df["Date"].dt.dayofyear
-        self.df["year"] = self.df["Date"].dt.year
-        self.df["month"] = self.df["Date"].dt.month
-        self.df["weekday"] = self.df["Date"].dt.weekday
-
-        # One-hot encode pollutant
-        pollutant_dummies = pd.get_dummies(self.df["Pollutant"], prefix="pollutant")
-        self.df = pd.concat([self.df, pollutant_dummies], axis=1)
-
-        # Final feature list
-        self.features = ["dayofyear", "year", "month", "weekday"] + list(pollutant_dummies.columns)
-
-        # Remove outliers using IQR
-        numeric_cols = self.targets
-        Q1 = self.df[numeric_cols].quantile(0.25)
-        Q3 = self.df[numeric_cols].quantile(0.75)
-        IQR = Q3 - Q1
-        self.df = self.df[~((self.df[numeric_cols] < (Q1 - 1.5 * IQR)) | (self.df[numeric_cols] > (Q3 + 1.5 * IQR))).any(axis=1)]
-
+        self.selected_pollutants = list(linear_regression_pollutant_predictor.SELECTED_POLLUTANTS)
+        self.df = None
+        self.partitions = None # partition_index of self.df, for per-city lookups
+        self.features = []
+        if load_data:
+            self.load_data()
+
+    def load_data(self):
+        # Cleaned rows from the shared dataset store, with outliers on the targets removed using IQR
+        self.df = shared_dataset_store.iqr_filtered(self.filepath, self.targets)
+        self.bounds = shared_dataset_store.iqr_bounds(self.filepath, self.targets)
+
+        # Date features and the fixed one-hot pollutant encoding from the shared feature store
+        self.features = list(shared_feature_store.feature_names)
+        X = shared_feature_store.feature_matrix(self.df["Date"], self.df["Pollutant"], self.features)
+        self.df = pd.concat([self.df, pd.DataFrame(X, index=self.df.index, columns=self.features)], axis=1)
+
+        # Rows held by (City, Pollutant) partition; the sorted frame replaces the unsorted one rather than doubling it
+        self.partitions = partition_index(self.df)
+        self.df = self.partitions.frame
+
+    @shared_metrics.timed("linear_regression_fit")
     def process_city(self, city):
-        city_data = self.df[self.df["City"] == city]
+        city_data = self.partitions.rows(city)
 
         for target in self.targets:
             X = city_data[self.features]
@@ -61,6 +71,7 @@ class linear_regression_pollutant_predictor:
             y_pred = model.predict(X_test)
 
             self.models[f"{city}_{target}"] = model
+            self.statistics[f"{city}_{target}"] = linear_regression_pollutant_predictor.sufficient_statistics(model, X_train, y_train)
 
             eval = evaluator(y_test, y_pred)
             r2, mae, rmse = eval.evaluate_regression()
@@ -73,32 +84,135 @@ class linear_regression_pollutant_predictor:
                 "Linear_RMSE": rmse
             })
 
-            dynamic_model_name = f"{city}_{target}.pkl"
-            model_path = MAIN_PATH / "models"
-            model_file_path = model_path / dynamic_model_name
-            os.makedirs(model_path, exist_ok=True)
-            joblib.dump(model, model_file_path)
-
-
+    # Sums over the polynomial features Z (after the fitted scaler) and the target y of some rows.
+    # They are all that is needed to refit the final LinearRegression, and can be added up across batches.
+    @staticmethod
+    def sufficient_statistics(model, X, y):
+        return linear_regression_pollutant_predictor.statistics_of(model[:-1].transform(X), y)
+
+    # Sufficient statistics of already expanded features Z
+    @staticmethod
+    def statistics_of(Z, y):
+        y = np.asarray(y, dtype=float)
+        return {"n": len(y), "z_sum": Z.sum(axis=0), "y_sum": y.sum(), "zz": Z.T @ Z, "zy": Z.T @ y}
+
+    # Statistics of two sets of rows added together
+    @staticmethod
+    def combine_statistics(first, second):
+        return {name: first[name] + second[name] for name in second}
+
+    # Least squares fit with an intercept from sufficient statistics, on centered sums as LinearRegression does
+    @staticmethod
+    def solve_statistics(statistics):
+        n = statistics["n"]
+        z_mean = statistics["z_sum"] / n
+        y_mean = statistics["y_sum"] / n
+        szz = statistics["zz"] - n * np.outer(z_mean, z_mean)
+        szy = statistics["zy"] - n * z_mean * y_mean
+        coef = np.linalg.lstsq(szz, szy, rcond=None)[0]
+        return coef, y_mean - z_mean @ coef
+
+    # Adds new observations of a city to its pipelines without retraining from scratch. The scaler and
+    # polynomial expansion stay as trained; only the final regression is refitted from the accumulated
+    # statistics. Rows outside the training outlier bounds are skipped, as they were in training.
+    # Returns the targets that were updated.
+    def update_models(self, city, dataframe):
+        new_data = linear_regression_pollutant_predictor.build_features(dataframe, self.features, self.selected_pollutants)
+        new_data = new_data.dropna(subset=self.targets)
+        if self.bounds is not None:
+            if self.outliers is None or self.outliers[0] is not self.bounds:
+                self.outliers = (self.bounds, outlier_filter.from_bounds(self.bounds))
+            new_data = self.outliers[1].filter(new_data)
+        if new_data.empty:
+            return []
+
+        updated = []
+        for target in self.targets:
+            key = f"{city}_{target}"
+            if key not in self.models or key not in self.statistics:
+                continue
+            batch = linear_regression_pollutant_predictor.sufficient_statistics(self.models[key], new_data[self.features], new_data[target])
+            statistics = linear_regression_pollutant_predictor.combine_statistics(self.statistics[key], batch)
+
+            # The pipeline is replaced rather than modified, so concurrent predictions never see a half-updated model
+            model = copy.deepcopy(self.models[key])
+            model[-1].coef_, model[-1].intercept_ = linear_regression_pollutant_predictor.solve_statistics(statistics)
+            self.models[key] = model
+            self.statistics[key] = statistics
+            updated.append(target)
+        if updated:
+            self.compile_city(city)
+        return updated
+
+    # Combines each city's pipelines into a compact_linear_regression operator
+    def compile(self):
+        self.compact = {}
+        for city in {key.rsplit("_", 1)[0] for key in self.models}:
+            self.compile_city(city)
+
+    # Cities missing a target, or whose pipelines cannot be combined, keep predicting through the pipelines
+    def compile_city(self, city):
+        pipelines = {target: self.models.get(f"{city}_{target}") for target in self.targets}
+        operator = None
+        if all(pipeline is not None for pipeline in pipelines.values()):
+            operator = compact_linear_regression.from_pipelines(pipelines)
+        compact = dict(self.compact) # Replaced rather than modified, for concurrent predictions
+        if operator is None:
+            compact.pop(city, None)
+        else:
+            compact[city] = operator
+        self.compact = compact
+
+    # Writes every fitted pipeline, with the features and targets they expect, to a single file.
+    # Extra metadata (e.g. the registry version) is stored alongside and returned by import_models().
+    def export_models(self, path, **metadata):
+        artifact = {"models": self.models, "features": self.features, "targets": self.targets,
+                    "statistics": self.statistics, "bounds": self.bounds}
+        artifact.update(metadata)
+        dump_artifact(artifact, path)
+
+    # Replaces the in-memory pipelines with the ones in a file written by export_models()
+    def import_models(self, path, mmap=True):
+        artifact = load_artifact(path, mmap)
+        self.models = artifact["models"]
+        self.features = artifact["features"]
+        self.targets = artifact["targets"]
+        self.statistics = artifact.get("statistics", {})
+        self.bounds = artifact.get("bounds")
+        self.compile()
+        return artifact
+
+    # Builds the date and one-hot pollutant features expected by the trained pipelines
+    @staticmethod
+    def build_features(dataframe, features, selected_pollutants = SELECTED_POLLUTANTS):
+        new_data = dataframe[dataframe["Pollutant"].isin(selected_pollutants)]
+        X = shared_feature_store.feature_matrix(new_data["Date"], new_data["Pollutant"], features)
+        new_data = new_data.drop(columns=[col for col in features if col in new_data.columns])
+        return pd.concat([new_data, pd.DataFrame(X, index=new_data.index, columns=features)], axis=1)
+
+    # Returns the input rows of the selected pollutants with the predicted targets added. Cities with a
+    # compact operator get every target from one matmul; the others go through the pipelines, and
+    # their result also carries the feature columns.
     def predict(self, city, dataframe):
+        operator = self.compact.get(city)
+        if operator is not None:
+            rows = dataframe[dataframe["Pollutant"].isin(self.selected_pollutants)]
+            try:
+                X = shared_feature_store.feature_matrix(rows["Date"], rows["Pollutant"], self.features)
+            except Exception as e:
+                print(f"Error reading or processing CSV file: {e}")
+                return pd.DataFrame()
+
+            predictions = operator.predict(X)
+            # The result frame is built in one go; adding the target columns one by one costs more than the models
+            columns = {name: rows[name] for name in rows.columns}
+            for column, target in enumerate(operator.targets):
+                # Variance cannot be negative
+                columns[target] = np.maximum(0, predictions[:, column]) if target == "variance" else predictions[:, column]
+            return pd.DataFrame(columns, index=rows.index)
+
         try:
-            new_data = dataframe.copy() # Use .copy() for safety
-            new_data = new_data[new_data["Pollutant"].isin(self.selected_pollutants)]
-            new_data["Date"] = pd.to_datetime(new_data["Date"])
-            # ... (date feature extraction remains the same) ...
-            new_data["dayofyear"] = new_data["Date"].dt.dayofyear
-            new_data["year"] = new_data["Date"].dt.year
-            new_data["month"] = new_data["Date"].dt.month
-            new_data["weekday"] = new_data["Date"].dt.weekday
-
-            # One-hot encode pollutant
-            pollutant_dummies = pd.get_dummies(new_data["Pollutant"], prefix="pollutant")
-            new_data = pd.concat([new_data, pollutant_dummies], axis=1)
-
-            # Ensure all expected columns are present
-            for col in self.features:
-                if col not in new_data.columns:
-                    new_data[col] = 0  # Fill missing dummy columns with 0
+            new_data = linear_regression_pollutant_predictor.build_features(dataframe, self.features, self.selected_pollutants)
         except Exception as e:
             # Returning an empty DataFrame on error is safer than returning None
             print(f"Error reading or processing CSV file: {e}")
@@ -110,18 +224,8 @@ class linear_regression_pollutant_predictor:
                 print(f"No trained model for {key}")
                 continue
 
-            dynamic_model_name = f"{city}_{target}.pkl"
-            model_file_path = MAIN_PATH / "models" / dynamic_model_name
-
-            if not os.path.exists(model_file_path):
-                print(f"Model file not found for {key}")
-                continue
-            
-            # Load the model
-            model = joblib.load(model_file_path)
-
             # 1. CALCULATE PREDICTIONS
-            predictions = model.predict(new_data[self.features])
+            predictions = self.models[key].predict(new_data[self.features])
 
             # 2. CLAMP IF TARGET IS VARIANCE
             if target == "variance":
@@ -135,6 +239,7 @@ class linear_regression_pollutant_predictor:
 
     # Plotting slows processing severly, not recommended unless one has plenty of time
     def plot(self, city, target, y_test, y_pred):
+        import matplotlib.pyplot as plt # Imported here to keep it off the service startup path
         plt.figure()
         plt.scatter(y_test, y_pred, color='purple', alpha=0.6)
         plt.xlabel(f"Actual {target}")
@@ -176,7 +281,8 @@ class linear_regression_pollutant_predictor:
         print(f"Summary data exported to {filename}")
 
     def compute(self):
-        for city in tqdm(self.df["City"].unique(), desc="Training models"):
+        for city in tqdm(self.partitions.cities(), desc="Training models"):
             self.process_city(city)
+        self.compile()
         # self.export_summary_csv()
         # self.save()
@@ -0,0 +1,448 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Import models
+from app.models.linear_regression.linear_regression_pollutant_predictor import linear_regression_pollutant_predictor
+from app.models.random_forest.random_forest_pollutant_median import random_forest_pollutant_median
+from app.models.random_forest.forest_cache import forest_cache
+from app.models.decision_tree.decision_tree_aqi_severity import decision_tree_aqi_severity
+from app.models.artifact_io.artifact_io import dump_artifact, load_artifact
+from app.models.model_registry import training_tasks, streaming_training
+from app.datasets.dataset_store import dataset_store
+from app.datasets.partitioned_dataset import partitioned_dataset
+from app.datasets.outlier_filter import outlier_filter
+
+MAIN_PATH = Path("app")
+
+class model_registry:
+
+    REGISTRY_PATH = MAIN_PATH / "models" / "registry"
+    DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+    DT_DATA_PATH = MAIN_PATH / "data" / "australia_air_quality_pollutant_aqi.csv"
+    POLLUTANTS = ["co", "no2", "o3", "pm10", "pm2.5", "so2"]
+
+    # The random forest options come from RF_N_ESTIMATORS, RF_MAX_DEPTH (empty for unlimited),
+    # RF_TRAINING_JOBS (cores used to fit each forest) and RF_MEMORY_CAP_MB (0 for no cap)
+    def __init__(self, registry_path = REGISTRY_PATH, data_path = DATA_PATH, dt_data_path = DT_DATA_PATH,
+                 rf_n_estimators = int(os.environ.get("RF_N_ESTIMATORS", 100)),
+                 rf_max_depth = int(os.environ["RF_MAX_DEPTH"]) if os.environ.get("RF_MAX_DEPTH") else None,
+                 rf_training_jobs = int(os.environ.get("RF_TRAINING_JOBS", -1)),
+                 rf_memory_cap_mb = float(os.environ.get("RF_MEMORY_CAP_MB", 0))):
+        self.registry_path = Path(registry_path)
+        self.data_path = Path(data_path)
+        self.dt_data_path = Path(dt_data_path)
+        self.rf_n_estimators = rf_n_estimators
+        self.rf_max_depth = rf_max_depth
+        self.rf_training_jobs = rf_training_jobs
+        self.rf_memory_cap = int(rf_memory_cap_mb * 1024 * 1024)
+        self.version = None # Version being served; "{base_version}+{updates}" once observations were ingested
+        self.base_version = None # Registry version folder the models were loaded from
+        self.manifest = None
+        self.stale = False
+        self.updates = 0 # Ingested batches applied on top of the base version
+        self.updates_mtime = None # Modification time of the Linear Regression updates file when it was read or written
+        self.latest_mtime = None # Modification time of the LATEST pointer when the loaded version was read
+        self.data_files = None # Size and mtime of the data files ({"data", "decision_tree"}) once observations were ingested
+        self.refit = model_registry.empty_refit() # Models that ingested observations could not update in place
+        self.linear_regression = None # linear_regression_pollutant_predictor serving the imported pipelines
+        self.lr_models = {} # Linear Regression pipelines keyed by "{city}_{target}"
+        self.rf_models = {} # Random Forest regressors keyed by (city, pollutant), loaded on first use (forest_cache)
+        self.decision_tree = None # decision_tree_aqi_severity serving the pre-trained classifier
+        self.features = []
+        self.targets = []
+
+    # Training options of a registry version, as train_registry takes them, so that retraining it
+    # repeats how it was trained. Options missing from older manifests take the current defaults.
+    @staticmethod
+    def training_options(manifest):
+        training = manifest.get("training", {}) if manifest else {}
+        forest = manifest.get("random_forest_options", {}) if manifest else {}
+        rf_options = {}
+        for option, argument in [("n_estimators", "rf_n_estimators"), ("max_depth", "rf_max_depth"), ("n_jobs", "rf_training_jobs")]:
+            if option in forest:
+                rf_options[argument] = forest[option]
+        return {
+            "workers": training.get("workers", 1),
+            "streaming": training.get("streaming", False),
+            "chunksize": training.get("chunksize", 500_000),
+            "max_forest_rows": training.get("max_forest_rows", streaming_training.FOREST_ROWS),
+            "rf_options": rf_options,
+        }
+
+    @staticmethod
+    def empty_refit():
+        return {"linear_regression": [], "random_forest": [], "decision_tree": False}
+
+    # Returns the version that the registry currently points to, or None if nothing has been trained
+    def latest_version(self):
+        pointer = self.registry_path / "LATEST"
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            return f.read().strip() or None
+
+    # Fits every (city, target) Linear Regression pipeline, every (city, pollutant) Random Forest
+    # and the AQI severity decision tree, then writes them as a new registry version.
+    # With workers > 1 the models are trained in a process pool, one model group per task.
+    # streaming=True trains out of core: the csv is split by City and Pollutant on disk from reads of
+    # chunksize rows, the Linear Regressions are fitted from statistics streamed over each city's
+    # partitions and every forest from a sample of at most max_forest_rows rows of its partition
+    # (see streaming_training).
+    def train(self, workers=1, streaming=False, chunksize=500_000, max_forest_rows=streaming_training.FOREST_ROWS):
+        start = time.perf_counter()
+        data_hash = dataset_store.hash_file(self.data_path)
+        dt_hash = dataset_store.hash_file(self.dt_data_path)
+        trained_at = datetime.now()
+        version = f"{trained_at.strftime('%Y%m%d%H%M%S')}-{data_hash[:8]}"
+        version_path = self.registry_path / version
+        os.makedirs(version_path / "random_forest", exist_ok=True)
+
+        # Forests are fitted one per worker when there are several workers, so they do not compete for cores
+        rf_options = {"n_estimators": self.rf_n_estimators, "max_depth": self.rf_max_depth,
+                      "n_jobs": self.rf_training_jobs if workers <= 1 else 1}
+        streaming_options = self.streaming_options(data_hash, chunksize, max_forest_rows) if streaming else None
+        initargs = (self.data_path, self.dt_data_path, rf_options, streaming_options)
+
+        # The parent loads the datasets first: it needs the city lists, and forked workers inherit them
+        training_tasks.init_worker(*initargs)
+        tasks = training_tasks.training_tasks(model_registry.POLLUTANTS)
+        print(f"Training registry version {version}: {len(tasks)} tasks on {workers} worker(s)...")
+
+        if workers <= 1:
+            outputs = [training_tasks.run_task(task, version_path, version, data_hash) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=training_tasks.init_worker, initargs=initargs) as pool:
+                futures = [pool.submit(training_tasks.run_task, task, version_path, version, data_hash) for task in tasks]
+                outputs = [future.result() for future in futures]
+
+        lr = linear_regression_pollutant_predictor(self.data_path, load_data=False)
+        lr.features = training_tasks.worker_state["linear_regression"].features
+        lr.bounds = training_tasks.worker_state["linear_regression"].bounds
+        lr_results, rf_results, rf_models = [], [], []
+        for output in outputs:
+            task = output["task"]
+            if task[0] == "linear_regression":
+                lr.models.update(output["models"])
+                lr.statistics.update(output["statistics"])
+                lr_results += output["results"]
+            elif task[0] == "random_forest":
+                rf_results += output["results"]
+                if output["trained"]:
+                    rf_models.append([task[2], task[1]])
+            else:
+                dt = output
+
+        lr.export_models(version_path / "linear_regression.pkl", version=version, data_hash=data_hash)
+        dump_artifact({"model": dt["model"], "version": version, "data_hash": dt_hash, "pollutants": dt["pollutants"]},
+                      version_path / "decision_tree.pkl")
+        evaluation = model_registry.write_evaluation(version_path / "evaluation", lr_results, rf_results, dt["results"])
+
+        manifest = {
+            "version": version,
+            "trained_at": trained_at.isoformat(timespec="seconds"),
+            "data_path": str(self.data_path),
+            "data_hash": data_hash,
+            "features": lr.features,
+            "targets": lr.targets,
+            "linear_regression": sorted(lr.models),
+            "random_forest": sorted(rf_models),
+            "random_forest_options": {"n_estimators": self.rf_n_estimators, "max_depth": self.rf_max_depth,
+                                      "n_jobs": self.rf_training_jobs},
+            "decision_tree": {
+                "data_path": str(self.dt_data_path),
+                "data_hash": dt_hash,
+                "tuned_depth": dt["best_depth"],
+                "max_depth": int(dt["model"].max_depth),
+            },
+            "evaluation": evaluation,
+            "training": {"workers": workers, "tasks": len(tasks), "seconds": round(time.perf_counter() - start, 2),
+                         "streaming": streaming, **({"chunksize": chunksize, "max_forest_rows": max_forest_rows} if streaming else {})},
+        }
+        with open(version_path / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        # The pointer is swapped last so readers never see a half-written version
+        pointer = self.registry_path / "LATEST"
+        temp_pointer = self.registry_path / "LATEST.tmp"
+        with open(temp_pointer, "w") as f:
+            f.write(version)
+        os.replace(temp_pointer, pointer)
+        print(f"Registry version {version} saved to {version_path}")
+        return version
+
+    # Partitions the dataset by City and Pollutant (reusing a layout of the same file version) and fits the outlier
+    # bounds of every model over all partitions by exact selection, so they equal the in-memory ones.
+    # The Linear Regression targets are a subset of the forest columns, so one fit serves both.
+    def streaming_options(self, data_hash, chunksize, max_forest_rows):
+        partitions = partitioned_dataset.write(self.data_path, chunksize=chunksize, file_hash=data_hash)
+        columns = random_forest_pollutant_median.FEATURES + ["median"]
+        lower, upper = outlier_filter(columns).fit_chunks(partitions.chunks).bounds
+        targets = linear_regression_pollutant_predictor.TARGETS
+        return {"partitions_path": partitions.path, "lr_bounds": (lower[targets], upper[targets]),
+                "rf_bounds": (lower, upper), "max_forest_rows": max_forest_rows}
+
+    # Writes the evaluator metrics of every model to csv files and returns their averages for the manifest
+    @staticmethod
+    def write_evaluation(evaluation_path, lr_results, rf_results, dt_results):
+        os.makedirs(evaluation_path, exist_ok=True)
+        lr_df = pd.DataFrame(lr_results).sort_values(["City", "Target"])
+        rf_df = pd.DataFrame(rf_results).sort_values(["City", "Pollutant"])
+        dt_df = pd.DataFrame(dt_results).drop(columns=["Confusion Matrix", "Classification Report"])
+        lr_df.to_csv(evaluation_path / "linear_regression.csv", index=False)
+        rf_df.to_csv(evaluation_path / "random_forest.csv", index=False)
+        dt_df.to_csv(evaluation_path / "decision_tree.csv", index=False)
+        with open(evaluation_path / "decision_tree_classification_report.txt", "w") as f:
+            f.write(dt_results[-1]["Classification Report"])
+
+        return {
+            "linear_regression_mean_r2": {target: round(float(r2), 4) for target, r2 in lr_df.groupby("Target")["Linear_R2"].mean().items()},
+            "random_forest_mean_r2": round(float(rf_df["RF_R2"].mean()), 4),
+            "random_forest_mean_mae": round(float(rf_df["RF_MAE"].mean()), 4),
+            "decision_tree_accuracy": round(float(dt_df["Accuracy Score"].iloc[-1]), 4),
+            "decision_tree_f1": round(float(dt_df["F1 Score"].iloc[-1]), 4),
+        }
+
+    # Modification time of a file in nanoseconds, None if it does not exist
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    # Size and modification time of a data file, which change with every append; comparing them
+    # instead of a hash keeps ingestion from reading whole files
+    @staticmethod
+    def file_stats(path):
+        stat = os.stat(path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Loads every artifact of a registry version into memory
+    def load(self, version=None):
+        latest_mtime = model_registry.mtime(self.registry_path / "LATEST")
+        version = version or self.latest_version()
+        if version is None:
+            raise FileNotFoundError(f"No trained models found in {self.registry_path}. Run the training step first.")
+
+        version_path = self.registry_path / version
+        with open(version_path / "manifest.json") as f:
+            manifest = json.load(f)
+        if "decision_tree" not in manifest:
+            raise FileNotFoundError(f"Registry version {version} has no decision tree. Run the training step again.")
+        if not os.path.exists(version_path / "linear_regression.pkl"):
+            raise FileNotFoundError(f"Registry version {version} uses the old per-model Linear Regression layout. Run the training step again.")
+
+        linear_regression = linear_regression_pollutant_predictor(self.data_path, load_data=False)
+        lr_artifact = linear_regression.import_models(version_path / "linear_regression.pkl")
+        if lr_artifact["data_hash"] != manifest["data_hash"]:
+            raise ValueError(f"Linear Regression artifact of {version} was trained on different data than its registry version")
+
+        # Observations ingested since training: the updated pipelines replace the trained ones
+        updates = 0
+        refit = model_registry.empty_refit()
+        data_files = None
+        updates_path = version_path / "linear_regression_updates.pkl"
+        updates_mtime = model_registry.mtime(updates_path)
+        if updates_mtime is not None:
+            updates_artifact = linear_regression.import_models(updates_path)
+            if updates_artifact["version"] != version:
+                raise ValueError(f"Linear Regression updates in {version} belong to version {updates_artifact['version']}")
+            updates = updates_artifact["updates"]
+            refit = updates_artifact["refit"]
+            data_files = updates_artifact.get("data_files")
+
+        # Forests are the bulk of the registry, so they are only read when first needed
+        rf_paths = {(city, pollutant): version_path / "random_forest" / f"{city}_{pollutant}.pkl"
+                    for city, pollutant in manifest["random_forest"]}
+        rf_models = forest_cache(rf_paths, lambda path: self._load_artifact(path, manifest["data_hash"]), self.rf_memory_cap)
+
+        decision_tree = decision_tree_aqi_severity(self.dt_data_path, load_data=False)
+        decision_tree.clf = self._load_artifact(version_path / "decision_tree.pkl", manifest["decision_tree"]["data_hash"])
+        decision_tree.best_depth = manifest["decision_tree"]["tuned_depth"]
+        decision_tree.compile()
+
+        self.version = f"{version}+{updates}" if updates else version
+        self.base_version = version
+        self.updates = updates
+        self.updates_mtime = updates_mtime
+        self.latest_mtime = latest_mtime
+        self.data_files = data_files
+        self.refit = refit
+        self.manifest = manifest
+        self.features = manifest["features"]
+        self.targets = manifest["targets"]
+        self.linear_regression = linear_regression
+        self.lr_models = linear_regression.models
+        self.rf_models = rf_models
+        self.decision_tree = decision_tree
+        self.stale = self.check_stale()
+        print(f"Loaded registry version {version} ({len(linear_regression.models)} linear regression models, {len(rf_models)} random forests available)")
+
+    def _load_artifact(self, path, data_hash):
+        artifact = load_artifact(path)
+        if artifact["data_hash"] != data_hash:
+            raise ValueError(f"Artifact {path} was trained on different data than its registry version")
+        return artifact["model"]
+
+    # Compares the hashes stored with the loaded models against the current data files. Once
+    # observations were ingested, the size and mtime the files had after the last batch are compared
+    # instead: the models the batches could not update are reported through refit_needed.
+    def check_stale(self):
+        if self.manifest is None:
+            return False
+        stale = False
+        for name, data_path, data_hash in [("data", self.data_path, self.manifest["data_hash"]),
+                                           ("decision_tree", self.dt_data_path, self.manifest["decision_tree"]["data_hash"])]:
+            if not os.path.exists(data_path):
+                continue
+            if self.data_files is not None:
+                changed = model_registry.file_stats(data_path) != self.data_files[name]
+            else:
+                changed = dataset_store.hash_file(data_path) != data_hash
+            if changed:
+                print(f"WARNING: Registry version {self.version} was trained on an older copy of {data_path}. Retrain to refresh the models.")
+                stale = True
+        return stale
+
+    # Re-reads the Linear Regression updates of the loaded version if another process (e.g. another
+    # app.serve worker) saved newer ones since this one read or wrote them; returns True if it did
+    def reload_updates(self):
+        if self.base_version is None:
+            return False
+        updates_path = self.registry_path / self.base_version / "linear_regression_updates.pkl"
+        mtime = model_registry.mtime(updates_path)
+        if mtime is None or mtime == self.updates_mtime:
+            return False
+
+        linear_regression = linear_regression_pollutant_predictor(self.data_path, load_data=False)
+        updates_artifact = linear_regression.import_models(updates_path)
+        if updates_artifact["version"] != self.base_version:
+            raise ValueError(f"Linear Regression updates in {self.base_version} belong to version {updates_artifact['version']}")
+        self.linear_regression = linear_regression
+        self.lr_models = linear_regression.models
+        self.refit = updates_artifact["refit"]
+        self.updates = updates_artifact["updates"]
+        self.updates_mtime = mtime
+        self.data_files = updates_artifact.get("data_files")
+        self.version = f"{self.base_version}+{self.updates}"
+        self.stale = self.check_stale()
+        print(f"Reloaded the Linear Regression updates of registry version {self.version}")
+        return True
+
+    # True if the registry on disk moved on from the loaded models: another process trained a new
+    # version (LATEST changed) or saved newer Linear Regression updates. Only stats two files, so it
+    # is cheap enough to call before every prediction.
+    def changed(self):
+        if model_registry.mtime(self.registry_path / "LATEST") != self.latest_mtime:
+            return True
+        return self.base_version is not None and \
+            model_registry.mtime(self.registry_path / self.base_version / "linear_regression_updates.pkl") != self.updates_mtime
+
+    # Catches up with the registry on disk: loads the latest version if LATEST points elsewhere,
+    # otherwise re-reads the Linear Regression updates; returns True if anything was reloaded
+    def refresh(self):
+        latest_mtime = model_registry.mtime(self.registry_path / "LATEST")
+        if latest_mtime != self.latest_mtime:
+            latest = self.latest_version()
+            if latest is not None and latest != self.base_version:
+                self.load(latest)
+                return True
+            self.latest_mtime = latest_mtime
+        return self.reload_updates()
+
+    # Folds newly ingested observations into the loaded version. Linear Regression pipelines are updated
+    # from their sufficient statistics; forests and the decision tree cannot be, so they are recorded
+    # as needing a refit. The updates are saved next to the version, so they survive a restart.
+    # Called under the ingestor's file lock, which reads the updates other processes saved (reload_updates)
+    # before appending the batch, so the saved file always holds every batch.
+    def apply_observations(self, dataframe):
+        lr_refit = set(self.refit["linear_regression"])
+        rf_refit = set(tuple(key) for key in self.refit["random_forest"])
+        updated = {}
+
+        for city, rows in dataframe.groupby("City", sort=False):
+            if any(f"{city}_{target}" not in self.linear_regression.statistics for target in self.targets):
+                lr_refit.add(city) # New city, or pipelines trained without statistics
+            targets = self.linear_regression.update_models(city, rows)
+            if targets:
+                updated[city] = targets
+            for pollutant in rows["Pollutant"].unique():
+                if pollutant in model_registry.POLLUTANTS:
+                    rf_refit.add((city, pollutant))
+
+        self.refit = {
+            "linear_regression": sorted(lr_refit),
+            "random_forest": sorted([city, pollutant] for city, pollutant in rf_refit),
+            "decision_tree": True,
+        }
+        self.updates += 1
+        # The data files now hold the batch, which the models account for; data that already changed
+        # some other way keeps the registry stale
+        if not self.stale:
+            self.data_files = {"data": model_registry.file_stats(self.data_path), "decision_tree": model_registry.file_stats(self.dt_data_path)}
+        updates_path = self.registry_path / self.base_version / "linear_regression_updates.pkl"
+        self.linear_regression.export_models(updates_path, version=self.base_version, data_hash=self.manifest["data_hash"],
+                                             updates=self.updates, refit=self.refit, data_files=self.data_files)
+        self.updates_mtime = os.stat(updates_path).st_mtime_ns
+        # A new serving version invalidates results cached for the previous models
+        self.version = f"{self.base_version}+{self.updates}"
+        return {"updated_linear_regression": updated, "refit_needed": self.refit}
+
+    # Loads the latest version, training one first if the registry is empty or out of date
+    def load_or_train(self):
+        try:
+            self.load()
+        except FileNotFoundError as e:
+            print(e)
+            self.train()
+            self.load()
+
+    # Predicts count, variance, min and max with the in-memory Linear Regression pipelines
+    def predict_linear_regression(self, city, dataframe):
+        return self.linear_regression.predict(city, dataframe)
+
+    # Predicts the median with the in-memory Random Forest for the city and pollutant
+    def predict_random_forest(self, city, pollutant, dataframe):
+        key = (city, pollutant)
+        if key not in self.rf_models:
+            print(f"No trained model found for {city} ({pollutant}).")
+            return pd.DataFrame()
+
+        new_data = dataframe.copy()
+        missing_cols = [col for col in random_forest_pollutant_median.FEATURES if col not in new_data.columns]
+        if missing_cols:
+            print(f"Missing required columns in input data: {missing_cols}")
+            return pd.DataFrame()
+
+        prediction = self.rf_models[key].predict(new_data[random_forest_pollutant_median.FEATURES])
+
+        # The median of a pollutant concentration cannot be negative
+        new_data["median"] = np.maximum(0, prediction)
+        return new_data
+
+    def status(self):
+        return {
+            "model_version": self.version,
+            "models_stale": self.stale,
+            "refit_needed": self.refit,
+            "random_forest": self.rf_models.status() if isinstance(self.rf_models, forest_cache) else None,
+        }
+
+# Standalone training function, importable by worker processes
+# rf_options (optional) overrides the forest options read from the environment, keyed by the
+# model_registry arguments (rf_n_estimators, rf_max_depth, rf_training_jobs)
+def train_registry(registry_path = model_registry.REGISTRY_PATH, data_path = model_registry.DATA_PATH,
+                   dt_data_path = model_registry.DT_DATA_PATH, workers = 1, streaming = False, chunksize = 500_000,
+                   max_forest_rows = streaming_training.FOREST_ROWS, rf_options = None):
+    registry = model_registry(registry_path, data_path, dt_data_path, **(rf_options or {}))
+    return registry.train(workers, streaming, chunksize, max_forest_rows)
+
+# Offline training step: python -m app.models.model_registry.model_registry (run from fastAPI_back_end)
+if __name__ == "__main__":
+    train_registry()
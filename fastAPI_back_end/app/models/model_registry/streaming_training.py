@@ -0,0 +1,141 @@
+import copy
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LinearRegression
+from sklearn.preprocessing import StandardScaler, PolynomialFeatures
+from sklearn.pipeline import make_pipeline
+from app.datasets.partition_index import partition_index
+from app.features.feature_store import shared_feature_store
+from app.metrics.service_metrics import shared_metrics
+from app.models.linear_regression.linear_regression_pollutant_predictor import linear_regression_pollutant_predictor
+
+# Out-of-core training from a partitioned_dataset split by City and Pollutant: a task reads only its
+# city's (or city and pollutant's) partitions, chunk by chunk, and never holds more than a chunk of
+# them (plus, for forests, a bounded sample).
+# The models are the same as the in-memory ones; only the rows that go into them are chosen differently.
+
+TEST_SIZE = 0.2
+SEED = 42
+FOREST_ROWS = 250_000 # Most rows a forest is fitted on (train and test), sampled uniformly from its partition
+BATCH_ROWS = 25_000 # Chunks of a city's partitions are combined into batches of about this many rows: every sklearn call has a fixed cost, and a batch's polynomial features take 66 floats per row
+
+# (feature frame, targets, test mask) of batches of a city's rows, after the outlier filter. Each row
+# is drawn into the test set with probability TEST_SIZE from a generator seeded the same on every
+# call, so every pass over the partitions sees the same split.
+def linear_regression_batches(lr, partitions, city, outliers):
+    rng = np.random.default_rng(SEED)
+    for batch in batches(outliers.filter(chunk)[["Date", "Pollutant"] + lr.targets] for chunk in partitions.chunks(city)):
+        X = shared_feature_store.feature_matrix(batch["Date"], batch["Pollutant"], lr.features)
+        yield pd.DataFrame(X, columns=lr.features), batch[lr.targets], rng.random(len(batch)) < TEST_SIZE
+
+# Frames combined into batches of at least BATCH_ROWS rows (the last one may be smaller); empty ones are dropped
+def batches(frames):
+    pending, rows = [], 0
+    for frame in frames:
+        if len(frame):
+            pending.append(frame)
+            rows += len(frame)
+        if rows >= BATCH_ROWS:
+            yield pd.concat(pending, ignore_index=True)
+            pending, rows = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+# Fits a city's pipelines into lr.models, lr.statistics and lr.results, as process_city does, in three
+# passes over its partitions: the scaler from running means and variances of the training rows, the
+# regressions from their summed sufficient statistics, then the metrics of the test rows
+@shared_metrics.timed("linear_regression_fit")
+def fit_linear_regression(lr, partitions, city, outliers):
+    scaler = StandardScaler()
+    first = None
+    for X, y, test in linear_regression_batches(lr, partitions, city, outliers):
+        if (~test).any():
+            scaler.partial_fit(X[~test])
+            first = X[~test].iloc[:1] if first is None else first
+    if first is None:
+        print(f"Skipping {city} - no training rows")
+        return
+
+    poly = PolynomialFeatures(degree=2).fit(scaler.transform(first))
+    statistics = {}
+    for X, y, test in linear_regression_batches(lr, partitions, city, outliers):
+        if not (~test).any():
+            continue
+        Z = poly.transform(scaler.transform(X[~test])) # Shared by every target
+        for target in lr.targets:
+            batch = linear_regression_pollutant_predictor.statistics_of(Z, y[target].to_numpy()[~test])
+            statistics[target] = linear_regression_pollutant_predictor.combine_statistics(statistics[target], batch) \
+                if target in statistics else batch
+
+    models = {}
+    for target in lr.targets:
+        regression = LinearRegression()
+        regression.coef_, regression.intercept_ = linear_regression_pollutant_predictor.solve_statistics(statistics[target])
+        regression.n_features_in_ = poly.n_output_features_
+        models[target] = make_pipeline(copy.deepcopy(scaler), copy.deepcopy(poly), regression)
+
+    metrics = {target: running_metrics() for target in lr.targets}
+    for X, y, test in linear_regression_batches(lr, partitions, city, outliers):
+        if test.any():
+            for target in lr.targets:
+                metrics[target].add(y[target].to_numpy()[test], models[target].predict(X[test]))
+
+    for target in lr.targets:
+        lr.models[f"{city}_{target}"] = models[target]
+        lr.statistics[f"{city}_{target}"] = statistics[target]
+        r2, mae, rmse = metrics[target].evaluate_regression()
+        lr.results.append({"City": city, "Target": target, "Linear_R2": r2, "Linear_MAE": mae, "Linear_RMSE": rmse})
+
+# Fits the forest of one (city, pollutant) with rf.process_city on a uniform sample of at most
+# max_rows of the partition's rows (after the outlier filter), kept in the order they were read. The sample is
+# drawn in one pass: every row gets a random key and the max_rows smallest keys seen so far are kept.
+def fit_random_forest(rf, partitions, city, outliers, max_rows = FOREST_ROWS):
+    rng = np.random.default_rng(SEED)
+    columns = ["City", "Pollutant"] + rf.features + [rf.target]
+    sample, keys = None, None
+    for chunk in (partitions.chunks(city) if rf.pollutant == "all" else partitions.chunks(city, rf.pollutant)):
+        rows = outliers.filter(chunk)[columns]
+        row_keys = rng.random(len(rows))
+        if sample is not None:
+            rows, row_keys = pd.concat([sample, rows], ignore_index=True), np.concatenate([keys, row_keys])
+        if max_rows is not None and len(rows) > max_rows:
+            keep = np.sort(np.argpartition(row_keys, max_rows - 1)[:max_rows])
+            rows, row_keys = rows.iloc[keep], row_keys[keep]
+        sample, keys = rows, row_keys
+
+    rf.df = sample if sample is not None else pd.DataFrame(columns=columns)
+    rf.partitions = partition_index(rf.df)
+    rf.process_city(city)
+    rf.df, rf.partitions = None, None
+
+# Regression metrics of predictions added in batches, equal to evaluator.evaluate_regression on all
+# of them at once. The spread of y is merged batch by batch (Chan et al.) rather than from raw sums.
+class running_metrics:
+
+    def __init__(self):
+        self.n = 0
+        self.absolute_error = 0.0
+        self.squared_error = 0.0
+        self.y_mean = 0.0
+        self.y_spread = 0.0 # Sum of squared deviations of y from its mean
+
+    def add(self, y_test, y_pred):
+        y_test = np.asarray(y_test, dtype=float)
+        errors = y_test - np.asarray(y_pred, dtype=float)
+        self.absolute_error += np.abs(errors).sum()
+        self.squared_error += errors @ errors
+        n, mean = len(y_test), y_test.mean()
+        spread = ((y_test - mean) ** 2).sum()
+        total = self.n + n
+        self.y_spread += spread + (mean - self.y_mean) ** 2 * self.n * n / total
+        self.y_mean += (mean - self.y_mean) * n / total
+        self.n = total
+
+    def evaluate_regression(self):
+        if self.n == 0:
+            return float("nan"), float("nan"), float("nan")
+        if self.y_spread > 0:
+            r2 = 1 - self.squared_error / self.y_spread
+        else:
+            r2 = 1.0 if self.squared_error == 0 else 0.0 # As r2_score does for a constant y
+        return r2, self.absolute_error / self.n, np.sqrt(self.squared_error / self.n)
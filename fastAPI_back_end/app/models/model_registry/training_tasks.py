@@ -0,0 +1,113 @@
+import time
+
+from app.models.linear_regression.linear_regression_pollutant_predictor import linear_regression_pollutant_predictor
+from app.models.random_forest.random_forest_pollutant_median import random_forest_pollutant_median
+from app.models.decision_tree.decision_tree_aqi_severity import decision_tree_aqi_severity
+from app.models.artifact_io.artifact_io import dump_artifact
+from app.models.model_registry import streaming_training
+from app.datasets.partitioned_dataset import partitioned_dataset
+from app.datasets.outlier_filter import outlier_filter
+from app.features.feature_store import shared_feature_store
+
+# Standalone training tasks run by model_registry.train, either in-process or in a process pool.
+# Each task trains one model group: ("linear_regression", city), ("random_forest", pollutant, city)
+# or ("decision_tree",).
+
+# Per-process training state. Workers build it once in init_worker, so tasks only carry their
+# small arguments and the datasets are never pickled per task.
+worker_state = {}
+
+# Worker initializer: reads the cleaned datasets through the shared dataset store. Forked workers
+# inherit the store the parent already filled; spawned ones read the parquet cache.
+# With streaming options (see model_registry.train) nothing is loaded: tasks read their city's
+# partitions from disk, filtered with the outlier bounds the parent fitted over all partitions.
+def init_worker(data_path, dt_data_path, rf_options, streaming=None):
+    worker_state["data_path"] = data_path
+    worker_state["dt_data_path"] = dt_data_path
+    worker_state["rf_options"] = rf_options
+    worker_state["streaming"] = streaming
+    worker_state["random_forest"] = {}
+    if streaming is None:
+        worker_state["linear_regression"] = linear_regression_pollutant_predictor(data_path)
+        return
+
+    worker_state["partitions"] = partitioned_dataset(streaming["partitions_path"])
+    worker_state["outliers"] = {"linear_regression": outlier_filter.from_bounds(streaming["lr_bounds"]),
+                                "random_forest": outlier_filter.from_bounds(streaming["rf_bounds"])}
+    lr = linear_regression_pollutant_predictor(data_path, load_data=False)
+    lr.features = list(shared_feature_store.feature_names)
+    lr.bounds = streaming["lr_bounds"]
+    worker_state["linear_regression"] = lr
+
+# One random_forest_pollutant_median per pollutant and process; they share the same filtered frame
+def random_forest_for(pollutant):
+    if pollutant not in worker_state["random_forest"]:
+        options = worker_state["rf_options"]
+        worker_state["random_forest"][pollutant] = random_forest_pollutant_median(
+            pollutant, worker_state["data_path"], options["n_estimators"], options["max_depth"], options["n_jobs"],
+            load_data=worker_state["streaming"] is None)
+    return worker_state["random_forest"][pollutant]
+
+# Every task that model_registry.train runs, heaviest first so the pool stays busy until the end
+def training_tasks(pollutants):
+    tasks = [("decision_tree",)]
+    if worker_state["streaming"] is not None:
+        partitions = worker_state["partitions"]
+        cities = list(dict.fromkeys(key[0] for key in partitions.keys()))
+        for pollutant in pollutants:
+            tasks += [("random_forest", pollutant, city) for city in cities if partitions.rows(city, pollutant)]
+        return tasks + [("linear_regression", city) for city in cities]
+    for pollutant in pollutants:
+        tasks += [("random_forest", pollutant, city) for city in random_forest_for(pollutant).partitions.cities()]
+    tasks += [("linear_regression", city) for city in worker_state["linear_regression"].partitions.cities()]
+    return tasks
+
+# Runs one task. Forests are written straight to the version folder so they never travel back to
+# the parent; the small Linear Regression pipelines and the decision tree are returned.
+def run_task(task, version_path, version, data_hash):
+    start = time.perf_counter()
+    result = {"task": task}
+
+    if task[0] == "linear_regression":
+        lr = worker_state["linear_regression"]
+        lr.models, lr.statistics, lr.results = {}, {}, []
+        if worker_state["streaming"] is None:
+            lr.process_city(task[1])
+        else:
+            streaming_training.fit_linear_regression(lr, worker_state["partitions"], task[1], worker_state["outliers"]["linear_regression"])
+        result["models"] = lr.models
+        result["statistics"] = lr.statistics
+        result["results"] = lr.results
+
+    elif task[0] == "random_forest":
+        pollutant, city = task[1], task[2]
+        rf = random_forest_for(pollutant)
+        rf.models, rf.results = {}, []
+        if worker_state["streaming"] is None:
+            rf.process_city(city)
+        else:
+            streaming_training.fit_random_forest(rf, worker_state["partitions"], city, worker_state["outliers"]["random_forest"],
+                                                 worker_state["streaming"]["max_forest_rows"])
+        if city in rf.models:
+            dump_artifact({"model": rf.models[city], "version": version, "data_hash": data_hash},
+                          version_path / "random_forest" / f"{city}_{pollutant}.pkl")
+        result["trained"] = city in rf.models
+        result["results"] = rf.results
+
+    elif task[0] == "decision_tree":
+        # Depth tuning only runs here, never at startup. The served tree keeps train_tree()'s
+        # balanced depth-4 setup; the grid-searched depth is recorded alongside it.
+        dt = decision_tree_aqi_severity(worker_state["dt_data_path"])
+        dt.prepare_data()
+        dt.tune_depth()
+        dt.train_tree()
+        result["model"] = dt.clf
+        result["pollutants"] = dt.pollutants
+        result["best_depth"] = int(dt.best_depth)
+        result["results"] = dt.results
+
+    else:
+        raise ValueError(f"Unknown training task {task}")
+
+    result["seconds"] = time.perf_counter() - start
+    return result
@@ -0,0 +1,91 @@
+import os
+import threading
+from collections import OrderedDict
+from app.metrics.service_metrics import shared_metrics
+
+# Lazily loaded grid of (city, pollutant) forests. A forest is read from its artifact on first
+# use; when a memory cap is set, the least recently used forests are dropped to stay under it
+# and read again the next time they are needed.
+class forest_cache:
+
+    # paths maps (city, pollutant) to artifact files; loader(path) returns the forest.
+    # memory_cap is in bytes, 0 for no cap. Sizes are estimated from the artifact files.
+    def __init__(self, paths, loader, memory_cap = 0):
+        self.paths = dict(paths)
+        self.loader = loader
+        self.memory_cap = memory_cap
+        self.forests = OrderedDict() # (city, pollutant) -> forest, least recently used first
+        self.sizes = {}
+        self.loaded_bytes = 0
+        self.loads = 0
+        self.evictions = 0
+        self.lock = threading.Lock() # Guards forests, sizes and the counters
+        self.key_locks = {} # (city, pollutant) -> lock held while that forest is read
+
+    def __contains__(self, key):
+        return key in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+    # Only lookups and inserts hold the cache lock; a forest is read under a lock of its own, so a cold
+    # load only holds up requests for that forest, and threads asking for it together read it once
+    def __getitem__(self, key):
+        path = self.paths[key] # KeyError for forests that were never trained
+        with self.lock:
+            forest = self._lookup(key)
+            if forest is not None:
+                return forest
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                forest = self._lookup(key) # Loaded by another thread while this one waited
+            if forest is not None:
+                return forest
+            try:
+                with shared_metrics.stage("forest_load"):
+                    forest = self.loader(path)
+            except BaseException:
+                with self.lock:
+                    self.key_locks.pop(key, None)
+                raise
+
+            with self.lock:
+                self.key_locks.pop(key, None) # Later requests find the forest itself
+                self.loads += 1
+                self.forests[key] = forest
+                self.sizes[key] = os.path.getsize(path)
+                self.loaded_bytes += self.sizes[key]
+
+                # Always keep the forest that was just requested, even if it alone exceeds the cap
+                while self.memory_cap and self.loaded_bytes > self.memory_cap and len(self.forests) > 1:
+                    evicted, _ = self.forests.popitem(last=False)
+                    self.loaded_bytes -= self.sizes.pop(evicted)
+                    self.evictions += 1
+            return forest
+
+    # The loaded forest of key, marked as most recently used, or None; called with the lock held
+    def _lookup(self, key):
+        forest = self.forests.get(key)
+        if forest is not None:
+            self.forests.move_to_end(key)
+        return forest
+
+    # Loads every forest up front (subject to the memory cap)
+    def preload(self):
+        for key in self.paths:
+            self[key]
+
+    def status(self):
+        return {
+            "forests": len(self.paths),
+            "loaded": len(self.forests),
+            "loaded_mb": round(self.loaded_bytes / (1024 * 1024), 1),
+            "memory_cap_mb": round(self.memory_cap / (1024 * 1024), 1) if self.memory_cap else None,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
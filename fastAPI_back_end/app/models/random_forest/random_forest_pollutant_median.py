@@ -1,10 +1,11 @@
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np # Import numpy for non-negative constraint
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestRegressor
 from app.evaluation.evaluator import evaluator
+from app.datasets.dataset_store import shared_dataset_store
+from app.metrics.service_metrics import shared_metrics
 from pathlib import Path
 
 MAIN_PATH = Path("app")
@@ -12,31 +13,36 @@ MAIN_PATH = Path("app")
 class random_forest_pollutant_median:
 
     DATA_PATH = MAIN_PATH / "data" / "australia_air_quality.csv"
+    # Features used to predict median: summary statistics of the time series
+    FEATURES = ["count", "min", "max", "variance"]
 
-    def __init__(self, pollutant, filepath = DATA_PATH):
+    # n_estimators and max_depth size the forests (smaller forests are faster and lighter);
+    # n_jobs fits the trees of each forest on several cores. load_data=False skips loading the dataset,
+    # for callers that set self.df themselves (e.g. the streaming training)
+    def __init__(self, pollutant, filepath = DATA_PATH, n_estimators = 100, max_depth = None, n_jobs = None, load_data = True):
         self.filepath = filepath
-        self.df = pd.read_csv(self.filepath)
-        self.df.dropna(inplace=True)
-        # Features used to predict median: summary statistics of the time series
-        self.features = ["count", "min", "max", "variance"]
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.n_jobs = n_jobs
+        self.features = list(random_forest_pollutant_median.FEATURES)
         self.target = "median"
         self.results = [] # Store evaluation results
         self.pollutant = pollutant
         self.models = {} # Dictionary that stores trained models for each city
-
-        # Removing Outliers using IQR (applied globally for simplicity)
-        numeric_cols = self.features + [self.target]
-        Q1 = self.df[numeric_cols].quantile(0.25)
-        Q3 = self.df[numeric_cols].quantile(0.75)
-        IQR = Q3 - Q1
-        self.df = self.df[~((self.df[numeric_cols] < (Q1 - 1.5 * IQR)) | (self.df[numeric_cols] > (Q3 + 1.5 * IQR))).any(axis=1)]
-
-    # Filters data for specified city and pollutant
+        self.df = None
+        self.partitions = None # partition_index of self.df, for per-city lookups
+        if load_data:
+            # Cleaned rows from the shared dataset store, with outliers removed using IQR (applied globally for simplicity)
+            self.df = shared_dataset_store.iqr_filtered(self.filepath, self.features + [self.target])
+            self.partitions = shared_dataset_store.partitioned(self.filepath, self.features + [self.target])
+
+    # Rows of the specified city and pollutant, sliced from their partition
+    @shared_metrics.timed("random_forest_fit")
     def process_city(self, city):
         if self.pollutant == "all":
-            city_data = self.df[self.df["City"] == city]
+            city_data = self.partitions.rows(city)
         else:
-            city_data = self.df[(self.df["City"] == city) & (self.df["Pollutant"] == self.pollutant)]
+            city_data = self.partitions.rows(city, self.pollutant)
 
         # Skip cities with insufficient data
         if len(city_data) < 5:
@@ -51,8 +57,9 @@ class random_forest_pollutant_median:
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
         # Initialize and train Random Forest Regressor
-        rf = RandomForestRegressor(n_estimators=100, random_state=42)
+        rf = RandomForestRegressor(n_estimators=self.n_estimators, max_depth=self.max_depth, random_state=42, n_jobs=self.n_jobs)
         rf.fit(X_train, y_train)
+        rf.n_jobs = None # Predictions are single rows or small batches, where spawning workers costs more than it saves
         y_pred = rf.predict(X_test)
 
         # Store trained models for future use
@@ -109,6 +116,7 @@ class random_forest_pollutant_median:
 
 # Plots scatter plot of actual vs predicted median values
     def plot(self, city, y_test, y_pred):
+        import matplotlib.pyplot as plt # Imported here to keep it off the service startup path
         plt.figure()
         plt.scatter(y_test, y_pred, color='green', alpha=0.6)
         plt.xlabel("Actual Median Values")
@@ -142,8 +150,8 @@ class random_forest_pollutant_median:
         results_df.to_csv(filename, index=False)
         print(f"Results saved to {filename}")
 
-    # Runs regression for each city and save results
-    def compute(self):
-        for city in self.df["City"].unique():
+    # Runs regression for each city (or only the given cities) and save results
+    def compute(self, cities = None):
+        for city in (cities if cities is not None else self.partitions.cities()):
             self.process_city(city)
         # self.save()   
\ No newline at end of file
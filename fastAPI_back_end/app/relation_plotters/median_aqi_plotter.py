@@ -1,11 +1,13 @@
 import pandas as pd
 import matplotlib.pyplot as plt
+from app.datasets.partition_index import partition_index
 
 class median_aqi_plotter:
     
     def __init__(self, pollutant):
         self.dataframe = pd.read_csv("./data/australia_air_quality_pollutant_aqi.csv")
         self.dataframe.dropna(inplace = True)
+        self.partitions = partition_index(self.dataframe) # Each city's and (city, pollutant)'s rows as a slice
         self.y_target = "AQI"     # Dependant
         self.x_target = "median"  # Independant
         self.x = None
@@ -23,11 +25,11 @@ class median_aqi_plotter:
 
     def compute(self):
         # Loops through each city under the 'City' column in the dataset
-        for city in self.dataframe["City"].unique():
+        for city in self.partitions.cities():
             if (self.pollutant != "all"):
-                city_data = self.dataframe[(self.dataframe["City"] == city) & (self.dataframe["Pollutant"] == self.pollutant)]
+                city_data = self.partitions.rows(city, self.pollutant)
             else:
-                city_data = self.dataframe[(self.dataframe["City"] == city)]
+                city_data = self.partitions.rows(city)
 
             # Extract x and y values for regression, and returns filtered data
             self.x = city_data[self.x_target]
@@ -38,7 +40,7 @@ class median_aqi_plotter:
             return city_data
 
     def plot(self):
-        for city in self.dataframe["City"].unique():
+        for city in self.partitions.cities():
             # Plot predicted vs actual values
             plt.figure()
             plt.scatter(self.x, self.y, color='blue', label='Data Points')
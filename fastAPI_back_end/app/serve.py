@@ -0,0 +1,109 @@
+import os
+import gc
+import sys
+import time
+import signal
+import argparse
+import uvicorn
+
+# Multi-worker server with the models loaded once.
+#
+# The parent imports the app (registry, Linear Regression, decision tree and, unless disabled, every
+# forest), freezes the garbage collector so collections never write to those objects, binds the
+# socket and forks the workers. Workers share the parent's memory copy-on-write; the frozen gc is
+# what keeps those pages shared. Forests are not memory-mapped: sklearn copies every tree's arrays
+# into memory the tree owns when it is unpickled, so a forest is only shared if the parent loaded it
+# before the fork. Only the Linear Regression pipeline arrays stay memory-mapped from the registry.
+# With --no-preload every worker imports and loads the app itself, like `uvicorn --workers`.
+# Workers reload the models on their own when another worker retrains or ingests observations
+# (see refresh_models in app/main.py).
+#
+# python -m app.serve --workers 4 (run from fastAPI_back_end)
+
+# Loads the app and everything it serves; returns the ASGI app
+def load_app(preload_forests):
+    from app.main import app, global_combined_model
+    if preload_forests and global_combined_model is not None:
+        global_combined_model.registry.rf_models.preload()
+    return app
+
+# Child process: serves the shared socket until uvicorn is told to stop
+def run_worker(config, sock, preload, preload_forests):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if not preload:
+        config.app = load_app(preload_forests)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+def spawn_worker(config, sock, preload, preload_forests):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(config, sock, preload, preload_forests)
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def serve(host = "127.0.0.1", port = 8000, workers = 2, preload = True, preload_forests = True, log_level = "info"):
+    start = time.perf_counter()
+    app = None
+    if preload:
+        app = load_app(preload_forests)
+        # Everything loaded so far is permanent: moving it out of the collected generations keeps
+        # gc from touching (and so copying) its pages in every worker
+        gc.collect()
+        gc.freeze()
+        print(f"Preloaded the app in {time.perf_counter() - start:.2f}s")
+
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level, lifespan="on")
+    sock = config.bind_socket()
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    children = set()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        children.add(spawn_worker(config, sock, preload, preload_forests))
+    print(f"Serving on http://{host}:{port} with {workers} workers (preload {'on' if preload else 'off'}), parent {os.getpid()}")
+
+    # Replaces workers that exit on their own; returns once every worker stopped after a signal
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}, starting a new one")
+            children.add(spawn_worker(config, sock, preload, preload_forests))
+    sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API from several worker processes sharing the loaded models.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-preload", action="store_true", help="load the app in every worker instead of once in the parent")
+    parser.add_argument("--lazy-forests", action="store_true", help="read forests on first use instead of at startup")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("app.serve needs os.fork; use `uvicorn app.main:app --workers N` on this platform")
+    serve(args.host, args.port, args.workers, not args.no_preload, not args.lazy_forests, args.log_level)
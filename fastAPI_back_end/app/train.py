@@ -0,0 +1,37 @@
+import os
+import json
+import argparse
+
+from app.models.model_registry.model_registry import model_registry
+from app.models.model_registry import streaming_training
+
+# Offline training of every model into a new registry version, outside the web process:
+# python -m app.train [--workers N] [--streaming] (run from fastAPI_back_end)
+def main():
+    parser = argparse.ArgumentParser(description="Train every model and save them as a new registry version.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="training processes (default: all cores)")
+    parser.add_argument("--registry-path", default=model_registry.REGISTRY_PATH)
+    parser.add_argument("--data-path", default=model_registry.DATA_PATH)
+    parser.add_argument("--dt-data-path", default=model_registry.DT_DATA_PATH)
+    parser.add_argument("--streaming", action="store_true", help="train out of core from per-city partitions of the data file (csv or parquet)")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="rows read at a time when partitioning (with --streaming)")
+    parser.add_argument("--forest-rows", type=int, default=streaming_training.FOREST_ROWS, help="most rows sampled for each forest (with --streaming)")
+    args = parser.parse_args()
+
+    registry = model_registry(args.registry_path, args.data_path, args.dt_data_path)
+    version = registry.train(args.workers, args.streaming, args.chunksize, args.forest_rows)
+
+    with open(registry.registry_path / version / "manifest.json") as f:
+        manifest = json.load(f)
+    training = manifest["training"]
+    evaluation = manifest["evaluation"]
+    print(f"\nTrained {len(manifest['linear_regression'])} linear regression models, {len(manifest['random_forest'])} random forests "
+          f"and the decision tree in {training['seconds']:.1f}s on {training['workers']} worker(s)")
+    for target, r2 in evaluation["linear_regression_mean_r2"].items():
+        print(f"Linear Regression {target}: mean R2 {r2}")
+    print(f"Random Forest median: mean R2 {evaluation['random_forest_mean_r2']}, mean MAE {evaluation['random_forest_mean_mae']}")
+    print(f"Decision tree severity: accuracy {evaluation['decision_tree_accuracy']}, F1 {evaluation['decision_tree_f1']}")
+    print(f"Evaluation details saved to {registry.registry_path / version / 'evaluation'}")
+
+if __name__ == "__main__":
+    main()
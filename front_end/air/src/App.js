@@ -66,6 +66,23 @@ const api = {
         }
         return results;
     },
+    // Whole forecast series for one city in a single request
+    forecastAirQuality: async (startDate, horizon, city, pollutants) => {
+        const apiPollutants = pollutants.map(p => pollutantMapping[p]);
+
+        const response = await fetch(`${API_BASE_URL}/forecast`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ start_date: startDate, horizon, city, pollutants: apiPollutants, stream: false }),
+        });
+
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Forecast failed');
+        }
+        const result = await response.json();
+        return result.data;
+    },
     healthCheck: async () => {
         const response = await fetch(`${API_BASE_URL}/health`);
         return response.json();
@@ -967,36 +984,21 @@ const AQITrendChart = ({ predictions, darkMode }) => {
         try {
             // Use the date from predictions instead of today
             const startDate = predictions?.[0]?.date ? new Date(predictions[0].date) : new Date();
-            const forecastPromises = [];
-            
-            // Generate next 7 days from the selected/predicted date
-            for (let i = 0; i < 7; i++) {
-                const forecastDate = new Date(startDate);
-                forecastDate.setDate(startDate.getDate() + i);
-                const dateString = forecastDate.toISOString().split('T')[0];
-                    
-                    forecastPromises.push(
-                        api.predictAirQuality(dateString, city, [selectedPollutant])
-                            .then(results => ({
-                                date: new Date(dateString),   
-                                label: forecastDate.toLocaleDateString('en-AU', { month: 'short', day: 'numeric' }), 
-                                aqi: parseFloat(results[0]?.AQI) || 0,
-                                fullDate: dateString  
-
-                            }))
-                            .catch(() => ({
-                                date: new Date(dateString),
-                                label: forecastDate.toLocaleDateString('en-AU', { month: 'short', day: 'numeric' }),
-                                aqi: 0,
-                                fullDate: dateString,
-                                error: true
-
-                            }))
-                    );
-                }
-                
-                const results = await Promise.all(forecastPromises);
-                setForecastData(results);
+            const startString = startDate.toISOString().split('T')[0];
+
+            // Next 7 days from the selected/predicted date, predicted in one request
+            const series = await api.forecastAirQuality(startString, 7, city, [selectedPollutant]);
+            const results = series.map(point => {
+                const forecastDate = new Date(point.Date);
+                return {
+                    date: forecastDate,
+                    label: forecastDate.toLocaleDateString('en-AU', { month: 'short', day: 'numeric' }),
+                    aqi: parseFloat(point.AQI) || 0,
+                    fullDate: point.Date,
+                    error: point.AQI === null
+                };
+            });
+            setForecastData(results);
             } catch (err) {
                 setError('Failed to fetch forecast data');
                 console.error('Forecast error:', err);